@@ -0,0 +1,126 @@
+"""Compare the Flask servelocal app with the ASGI app.
+
+Both apps are called in process with their test clients, so the numbers are the framework
+and GLaDOS overhead without any network.
+
+``usec/request`` is one signed Slash command with a handler that returns right away.
+``req/sec io`` sends CONCURRENT requests to a handler that waits IO_WAIT seconds, like a
+handler that calls the Slack API. The Flask app handles them one at a time, the ASGI app
+awaits them on one event loop.
+"""
+import asyncio
+import hashlib
+import hmac
+import time
+from urllib.parse import urlencode
+
+from common import report, time_per_call
+
+from glados import Glados, GladosBot, GladosPlugin, RouteType, servelocal
+from glados.asgi import ASGITestClient, GladosASGI
+from glados.plugin import PluginConfig
+
+SIGNING_SECRET = "bench_signing_secret"
+CONCURRENT = 200
+IO_WAIT = 0.005
+
+
+def signed(body: bytes) -> dict:
+    timestamp = "1584379414"
+    digest = hmac.new(
+        SIGNING_SECRET.encode(), f"v0:{timestamp}:".encode() + body, hashlib.sha256
+    ).hexdigest()
+    return {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": f"v0={digest}",
+    }
+
+
+def build_glados() -> Glados:
+    def fast(request):
+        return "ok"
+
+    def slow(request):
+        time.sleep(IO_WAIT)
+        return "ok"
+
+    async def afast(request):
+        return "ok"
+
+    async def aslow(request):
+        await asyncio.sleep(IO_WAIT)
+        return "ok"
+
+    plugin = GladosPlugin(
+        PluginConfig("bench", "None"), GladosBot("", "bot", SIGNING_SECRET)
+    )
+    plugin.add_route(RouteType.Slash, "fast", fast)
+    plugin.add_route(RouteType.Slash, "slow", slow)
+    plugin.add_route(RouteType.Slash, "afast", afast)
+    plugin.add_route(RouteType.Slash, "aslow", aslow)
+    g = Glados()
+    g.add_plugin(plugin)
+    g.router.freeze()
+    return g
+
+
+def main():
+    g = build_glados()
+    body = urlencode({"command": "/bench", "text": "hello"}).encode()
+    headers = signed(body)
+
+    servelocal.glados = g
+    flask_client = servelocal.app.test_client()
+    asgi_client = ASGITestClient(GladosASGI(g))
+
+    def flask_request(route):
+        return flask_client.post(f"/Slash/bot/{route}", data=body, headers=headers)
+
+    def asgi_request(route):
+        return asgi_client.post(f"/Slash/bot/{route}", body=body, headers=headers)
+
+    def flask_io():
+        start = time.perf_counter()
+        for _ in range(CONCURRENT):
+            flask_request("slow")
+        return CONCURRENT / (time.perf_counter() - start)
+
+    def asgi_io():
+        async def run():
+            await asyncio.gather(
+                *[
+                    asgi_client.arequest(
+                        "POST", "/Slash/bot/aslow", body=body, headers=headers
+                    )
+                    for _ in range(CONCURRENT)
+                ]
+            )
+
+        start = time.perf_counter()
+        asgi_client.loop.run_until_complete(run())
+        return CONCURRENT / (time.perf_counter() - start)
+
+    assert flask_request("fast").data == b"ok"
+    assert asgi_request("afast").body == b"ok"
+
+    rows = {
+        "flask": {
+            "usec/request": time_per_call(lambda: flask_request("fast"), number=2000),
+            "req/sec io": flask_io(),
+        },
+        "asgi (sync route)": {
+            "usec/request": time_per_call(lambda: asgi_request("fast"), number=2000),
+            "req/sec io": float("nan"),
+        },
+        "asgi (async route)": {
+            "usec/request": time_per_call(lambda: asgi_request("afast"), number=2000),
+            "req/sec io": asgi_io(),
+        },
+    }
+    asgi_client.close()
+    report(f"Slash command, {CONCURRENT} concurrent requests for io", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Compare the JSON codecs on the recorded Slack payloads.
+
+Decoding starts from the raw bytes as they come off the wire and encoding
+returns a str, which is what the Lambda adapter puts in the response body.
+"""
+from common import load_payloads, report, time_per_call
+
+from glados.codec import CODECS, JSONCodec
+
+
+def available_codecs():
+    codecs = list()
+    for name, cls in CODECS.items():
+        try:
+            codecs.append(cls())
+        except ImportError:
+            print(f"skipping {name}: not installed")
+    return codecs
+
+
+def main():
+    codecs = available_codecs()
+    for name, raw in load_payloads().items():
+        obj = JSONCodec().loads(raw)
+        rows = dict()
+        for codec in codecs:
+            rows[codec.name] = {
+                "usec/loads": time_per_call(lambda: codec.loads(raw), number=2000),
+                "usec/dumps": time_per_call(lambda: codec.dumps(obj), number=2000),
+            }
+        report(f"{name} ({len(raw)} bytes)", rows)
+
+
+if __name__ == "__main__":
+    main()
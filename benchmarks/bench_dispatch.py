@@ -0,0 +1,59 @@
+"""Compare the per request cost of route dispatch.
+
+``string lookup`` is the old path: build the prefixed route string, look it up in the
+router and then again in the plugin. ``dispatch table`` is GladosRouter.exec_route
+using the frozen (route_type, bot, route) table.
+"""
+from common import report, time_per_call
+
+from glados import GladosBot, GladosPlugin, GladosRequest, GladosRouter, RouteType
+from glados.plugin import PluginConfig
+
+ROUTES_PER_PLUGIN = 200
+
+
+def build_router():
+    router = GladosRouter()
+    for b in range(5):
+        bot = GladosBot("", f"bot{b}", "")
+        plugin = GladosPlugin(PluginConfig(f"plugin{b}", "None"), bot)
+        for r in range(ROUTES_PER_PLUGIN):
+            plugin.add_route(RouteType.Webhook, f"route_{r}", lambda request: True)
+        router.add_routes(plugin)
+    router.freeze()
+    return router
+
+
+def main():
+    router = build_router()
+    request = GladosRequest(RouteType.Webhook, "route_100", bot_name="bot3")
+
+    dispatch = router.freeze()
+
+    def string_lookup():
+        return router.route_function(request.route_type, request.route)
+
+    def table_lookup():
+        return dispatch[request.key]
+
+    def string_dispatch():
+        return router.route_function(request.route_type, request.route)(request)
+
+    def table_dispatch():
+        return router.exec_route(request)
+
+    rows = {
+        "string lookup": {
+            "usec/lookup": time_per_call(string_lookup),
+            "usec/dispatch": time_per_call(string_dispatch),
+        },
+        "dispatch table": {
+            "usec/lookup": time_per_call(table_lookup),
+            "usec/dispatch": time_per_call(table_dispatch),
+        },
+    }
+    report("Webhook dispatch", rows)
+
+
+if __name__ == "__main__":
+    main()
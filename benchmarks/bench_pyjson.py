@@ -0,0 +1,37 @@
+"""Compare eager PyJSON against LazyPyJSON for inbound Slack payloads.
+
+The handler is modelled as reading the two or three fields a typical plugin
+route uses, which is what GladosRequest does for every request.
+"""
+from common import count_allocations, load_payload_dicts, report, time_per_call
+
+from glados.utils import LazyPyJSON, PyJSON
+
+READS = {
+    "block_actions": lambda j: (j.actions[0].action_id, j.container.channel_id),
+    "view_submission": lambda j: (j.view.callback_id, j.user.id),
+    "event_message": lambda j: (j.event.type, j.event.channel),
+}
+
+
+def main():
+    payloads = load_payload_dicts()
+    for name, payload in payloads.items():
+        read = READS[name]
+        rows = dict()
+        for cls in (PyJSON, LazyPyJSON):
+
+            def request():
+                j = cls(payload)
+                read(j)
+                return j
+
+            rows[cls.__name__] = {
+                "allocs/request": count_allocations(request),
+                "usec/request": time_per_call(request, number=2000),
+            }
+        report(name, rows)
+
+
+if __name__ == "__main__":
+    main()
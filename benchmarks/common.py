@@ -0,0 +1,55 @@
+"""Helpers shared by the GLaDOS benchmark scripts.
+
+Run any benchmark from the repo root, e.g. ``python benchmarks/bench_pyjson.py``
+"""
+import json
+import logging
+import timeit
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict
+
+PAYLOADS_DIR = Path(__file__).parent / "payloads"
+
+# glados sets the root logger to DEBUG, keep log output out of the timings.
+logging.disable(logging.CRITICAL)
+
+
+def load_payloads() -> Dict[str, bytes]:
+    """Load the recorded Slack payloads as raw bytes keyed by name."""
+    return {p.stem: p.read_bytes() for p in sorted(PAYLOADS_DIR.glob("*.json"))}
+
+
+def load_payload_dicts() -> Dict[str, dict]:
+    """Load the recorded Slack payloads as dicts keyed by name."""
+    return {name: json.loads(raw) for name, raw in load_payloads().items()}
+
+
+def count_allocations(func: Callable, repeat: int = 100) -> float:
+    """Return the average number of memory blocks allocated by one call of func."""
+    func()  # warm up any caches
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [func() for _ in range(repeat)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del keep
+    stats = after.compare_to(before, "filename")
+    return sum(s.count_diff for s in stats) / repeat
+
+
+def time_per_call(func: Callable, number: int = 10000) -> float:
+    """Return the best time in microseconds of one call of func."""
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e6
+
+
+def report(title: str, rows: Dict[str, Dict[str, float]]):
+    """Print a small aligned table of benchmark results."""
+    print(title)
+    columns = list(next(iter(rows.values())).keys())
+    name_width = max(len(name) for name in rows)
+    print(" " * name_width + "".join(f"{c:>18}" for c in columns))
+    for name, values in rows.items():
+        print(f"{name:<{name_width}}" + "".join(f"{values[c]:>18.2f}" for c in columns))
+    print()
@@ -1,4 +1,3 @@
-import json
 import logging
 
 from flask import Flask, request
@@ -8,7 +7,6 @@ from glados import (
     GladosRequest,
     GladosRouteNotFoundError,
     RouteType,
-    SlackVerification,
     read_config,
 )
 
@@ -23,40 +21,28 @@ glados = Glados(config.config_file)
 app.secret_key = server_config.secret_key
 
 
-def extract_slack_info(r: request):
-    try:
-        data = r.get_data(as_text=True)
-        timestamp = r.headers.get("X-Slack-Request-Timestamp")
-        signature = r.headers.get("X-Slack-Signature")
-        return SlackVerification(data, timestamp, signature)
-    except Exception as e:
-        # If it makes it here, the request probably isn't from Slack.
-        logging.error(e)
-        return None
+def build_request(route_type: RouteType, route: str = None, bot: str = None):
+    """Build a GladosRequest from the raw body and headers of the flask request."""
+    return GladosRequest(
+        route_type,
+        route,
+        bot_name=bot,
+        body=request.get_data(),
+        headers=request.headers,
+    )
 
 
 @app.route("/Webhook/<bot>/<route>", methods=["POST"])
 def send_message_route(bot, route):
-    glados_request = GladosRequest(
-        RouteType.Webhook, route, bot_name=bot, json=request.get_json()
-    )
+    glados_request = build_request(RouteType.Webhook, route, bot)
     return glados.request(glados_request)
 
 
 @app.route("/Events/<bot>", methods=["POST"])
 def event_subscriptions(bot):
-    body = request.json
-    event_type = body.get("type", "")
-    if event_type == "url_verification":
-        return body.get("challenge")
-
-    # Build GladosRequest
-    r = GladosRequest(
-        RouteType.Events,
-        slack_verify=extract_slack_info(request),
-        bot_name=bot,
-        json=request.get_json(),
-    )
+    r = build_request(RouteType.Events, bot=bot)
+    if r.json.get("type") == "url_verification":
+        return r.json.get("challenge")
     try:
         return glados.request(r)
     except KeyError:
@@ -65,22 +51,13 @@ def event_subscriptions(bot):
 
 @app.route("/Slash/<bot>/<route>", methods=["POST"])
 def slash_command(bot, route):
-    slack_info = extract_slack_info(request)
-    request_json = request.form.to_dict()
-    r = GladosRequest(
-        RouteType.Slash, route, slack_info, bot_name=bot, json=request_json
-    )
+    r = build_request(RouteType.Slash, route, bot)
     return glados.request(r)
 
 
 @app.route("/Interaction/<bot>", methods=["POST"])
 def interaction(bot):
-    slack_info = extract_slack_info(request)
-    request_json = request.form.to_dict()
-    request_json = json.loads(request_json.get("payload"))
-    r = GladosRequest(
-        RouteType.Interaction, slack_verify=slack_info, bot_name=bot, json=request_json
-    )
+    r = build_request(RouteType.Interaction, bot=bot)
     try:
         return glados.request(r)
     except GladosRouteNotFoundError as e:
@@ -90,10 +67,7 @@ def interaction(bot):
 
 @app.route("/Menu", methods=["POST"])
 def external_menu():
-    slack_info = extract_slack_info(request)
-    request_json = request.form.to_dict()
-    request_json = json.loads(request_json.get("payload"))
-    r = GladosRequest(RouteType.Menu, slack_verify=slack_info, json=request_json)
+    r = build_request(RouteType.Menu)
     return glados.request(r)
 
 
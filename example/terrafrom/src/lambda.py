@@ -1,11 +1,9 @@
-import json
 from os import environ
 from glados import (
     Glados,
     GladosBot,
     GladosRequest,
     RouteType,
-    SlackVerification,
     EventRoutes,
 )
 from example_plugin import ExamplePlugin
@@ -13,7 +11,7 @@ from example_plugin import ExamplePlugin
 BOT_KEY = environ.get("glados_bot_key")
 SIGNING_KEY = environ.get("glados_signing_key")
 
-glados = Glados()
+glados = Glados(json_codec="auto")
 glados_bot = GladosBot(BOT_KEY, "glados", SIGNING_KEY)
 glados.add_bot(glados_bot)
 glados.add_plugin(ExamplePlugin(glados_bot))
@@ -22,25 +20,22 @@ glados.add_plugin(ExamplePlugin(glados_bot))
 def send_message(event):
     print("sending message")
     route = event.get("pathParameters").get("route")
-    r = GladosRequest(RouteType.Webhook, route, json=json.loads(event.get("body")))
+    r = GladosRequest(
+        RouteType.Webhook, route, body=event.get("body"), headers=event.get("headers")
+    )
     return glados.request(r)
 
 
 def events(event):
-    body = json.loads(event.get("body"))
-    event_type = body.get("type", "")
-    if event_type == "url_verification":
-        return {"challenge": body.get("challenge")}
-
     bot = event.get("pathParameters").get("bot")
-    slack_info = SlackVerification(
-        event.get("body"),
-        event.get("headers").get("X-Slack-Request-Timestamp"),
-        event.get("headers").get("X-Slack-Signature"),
-    )
     r = GladosRequest(
-        RouteType.Events, slack_verify=slack_info, bot_name=bot, json=body
+        RouteType.Events,
+        bot_name=bot,
+        body=event.get("body"),
+        headers=event.get("headers"),
     )
+    if r.json.get("type") == "url_verification":
+        return {"challenge": r.json.get("challenge")}
     return glados.request(r)
 
 
@@ -56,5 +51,5 @@ def handler(event, context):
     return {
         "headers": {"content-type": "application/json"},
         "statusCode": 200,
-        "body": json.dumps(response),
+        "body": glados.codec.dumps(response),
     }
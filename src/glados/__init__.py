@@ -1,19 +1,23 @@
 import logging as RootLogging
 
-from .bot import BotImporter, GladosBot
+from .bot import BotImporter, GladosBot, SendResult
+from .codec import JSONCodec, OrjsonCodec, get_codec, set_codec
 from .configs import GladosConfig, read_config
 from .core import Glados
+from .event_filter import EventFilter
 from .errors import (
     GladosBotNotFoundError,
     GladosError,
     GladosPathExistsError,
     GladosRouteNotFoundError,
 )
+from .metrics import Metrics, metrics
 from .plugin import GladosPlugin, PluginImporter
+from .ratelimit import RateLimiter, rate_limiter
 from .request import GladosRequest, SlackVerification
 from .route_type import BOT_ROUTES, VERIFY_ROUTES, EventRoutes, RouteType
 from .router import GladosRoute, GladosRouter
-from .utils import PyJSON, check_for_env_vars, get_enc_var, get_var
+from .utils import LazyPyJSON, PyJSON, check_for_env_vars, get_enc_var, get_var
 
 LOGGING_FORMAT = "%(levelname)-8s :: [ %(module)s.%(funcName)s:%(lineno)s ] %(message)s"
 LOGGING_LEVEL = "WARNING"
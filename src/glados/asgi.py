@@ -0,0 +1,296 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from slack.errors import SlackRequestError
+
+from . import codec
+from .core import Glados
+from .errors import GladosRouteNotFoundError
+from .http import close_async_session
+from .request import INVALID_BODY_ERRORS, GladosRequest
+from .route_type import RouteType
+
+# first path segment -> (route type, has bot, has route)
+ENDPOINTS = {
+    "Events": (RouteType.Events, True, False),
+    "Slash": (RouteType.Slash, True, True),
+    "Interaction": (RouteType.Interaction, True, False),
+    "Menu": (RouteType.Menu, False, False),
+    "Webhook": (RouteType.Webhook, True, True),
+}
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def parse_path(path: str) -> Optional[Tuple[RouteType, Optional[str], Optional[str]]]:
+    """Get the route type, bot name and route from a request path.
+
+    Examples
+    --------
+    >>> parse_path("/Slash/SecurityBot/ask")
+    (<RouteType.Slash: 4>, 'SecurityBot', 'ask')
+    >>> parse_path("/Events/SecurityBot")
+    (<RouteType.Events: 5>, 'SecurityBot', None)
+    >>> parse_path("/Unknown") is None
+    True
+
+    Parameters
+    ----------
+    path
+        the request path
+
+    Returns
+    -------
+    Optional[Tuple[RouteType, Optional[str], Optional[str]]]
+        None if the path is not a GLaDOS endpoint.
+    """
+    parts = path.strip("/").split("/")
+    endpoint = ENDPOINTS.get(parts[0])
+    if endpoint is None:
+        return None
+    route_type, has_bot, has_route = endpoint
+    if len(parts) != 1 + has_bot + has_route:
+        return None
+    bot = parts[1] if has_bot else None
+    route = parts[-1] if has_route else None
+    return route_type, bot, route
+
+
+def encode_response(response: Any) -> Tuple[bytes, bytes]:
+    """Encode a plugin response into a body and content type."""
+    if response is None:
+        return b"", b"text/plain; charset=utf-8"
+    if type(response) is bytes:
+        return response, b"text/plain; charset=utf-8"
+    if type(response) is str:
+        return response.encode("utf-8"), b"text/plain; charset=utf-8"
+    if hasattr(response, "to_dict"):
+        response = response.to_dict()
+    return codec.dumps(response).encode("utf-8"), b"application/json"
+
+
+class GladosASGI:
+    """ASGI application that serves the GLaDOS endpoints.
+
+    Requests are dispatched with :meth:`glados.core.Glados.arequest`, so async plugin routes
+    run on the server event loop. The endpoints are the same as the Flask servers:
+
+    - ``POST /Events/<bot>``
+    - ``POST /Slash/<bot>/<route>``
+    - ``POST /Interaction/<bot>``
+    - ``POST /Menu``
+    - ``POST /Webhook/<bot>/<route>``
+    - ``GET /health``
+
+    Examples
+    --------
+    .. code-block:: python
+
+        # app.py, run with: uvicorn app:app
+        from glados import Glados
+        from glados.asgi import GladosASGI
+
+        glados = Glados("glados.yaml")
+        glados.read_config()
+        app = GladosASGI(glados)
+
+    Parameters
+    ----------
+    glados
+        the loaded GLaDOS instance
+    """
+
+    def __init__(self, glados: Glados):
+        self.glados = glados
+
+    async def __call__(self, scope: dict, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            status, body, content_type = await self._handle(scope, receive)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": status,
+                    "headers": [
+                        (b"content-type", content_type),
+                        (b"content-length", str(len(body)).encode()),
+                    ],
+                }
+            )
+            await send({"type": "http.response.body", "body": body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_session()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    @staticmethod
+    async def read_body(receive) -> bytes:
+        """Read the full request body from the ASGI receive channel."""
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    async def _handle(self, scope: dict, receive) -> Tuple[int, bytes, bytes]:
+        path = scope["path"]
+        method = scope["method"]
+        if path == "/health" and method == "GET":
+            body, content_type = encode_response(
+                {
+                    "status": "ok",
+                    "pid": os.getpid(),
+                    "bots": len(self.glados.bots),
+                    "plugins": len(self.glados.plugins),
+                }
+            )
+            return 200, body, content_type
+
+        endpoint = parse_path(path)
+        if endpoint is None:
+            return 404, b"not found", b"text/plain; charset=utf-8"
+        if method != "POST":
+            return 405, b"method not allowed", b"text/plain; charset=utf-8"
+
+        route_type, bot, route = endpoint
+        headers = dict()  # type: Dict[str, str]
+        for key, value in scope["headers"]:
+            headers[key.decode("latin-1")] = value.decode("latin-1")
+        body = await self.read_body(receive)
+
+        try:
+            request = GladosRequest(
+                route_type, route, bot_name=bot, body=body, headers=headers
+            )
+        except INVALID_BODY_ERRORS as e:
+            logging.warning(f"invalid request body for {path}: {e!r}")
+            return 400, b"invalid request body", b"text/plain; charset=utf-8"
+
+        try:
+            if route_type is RouteType.Events:
+                if request.json.get("type") == "url_verification":
+                    response = request.json.get("challenge")
+                    return (200, *encode_response(response))
+            response = await self.glados.arequest(request)
+        except GladosRouteNotFoundError as e:
+            logging.error(e)
+            if route_type is RouteType.Interaction:
+                # same as the Flask servers, slack shows an error for a non 200 response.
+                return 200, b"not found", b"text/plain; charset=utf-8"
+            return 404, b"not found", b"text/plain; charset=utf-8"
+        except SlackRequestError as e:
+            logging.error(e)
+            return 401, b"invalid request", b"text/plain; charset=utf-8"
+        except Exception as e:
+            logging.exception(f"error handling {path}: {e}")
+            return 500, b"internal server error", b"text/plain; charset=utf-8"
+        return (200, *encode_response(response))
+
+
+class TestResponse:
+    """Response returned by :obj:`ASGITestClient`"""
+
+    __test__ = False
+
+    def __init__(self, status: int, headers: Headers, body: bytes):
+        self.status = status
+        self.headers = {k.decode(): v.decode() for k, v in headers}
+        self.body = body
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8")
+
+    def json(self) -> Any:
+        return codec.loads(self.body)
+
+
+class ASGITestClient:
+    """Call an ASGI app in process without a server.
+
+    Examples
+    --------
+    >>> client = ASGITestClient(GladosASGI(Glados()))
+    >>> client.get("/health").json()["status"]
+    'ok'
+    >>> client.close()
+
+    Parameters
+    ----------
+    app
+        the ASGI app
+    loop
+        the event loop to run requests on. A new loop is created if not set.
+    """
+
+    def __init__(self, app, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.app = app
+        self.loop = loop or asyncio.new_event_loop()
+
+    async def arequest(
+        self,
+        method: str,
+        path: str,
+        body: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> TestResponse:
+        """Send a request to the app from a coroutine."""
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "query_string": b"",
+            "headers": [
+                (k.lower().encode("latin-1"), v.encode("latin-1"))
+                for k, v in (headers or dict()).items()
+            ],
+        }
+        received = False
+
+        async def receive():
+            nonlocal received
+            if received:
+                return {"type": "http.disconnect"}
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        start = sent[0]
+        response_body = b"".join(m.get("body", b"") for m in sent[1:])
+        return TestResponse(start["status"], start["headers"], response_body)
+
+    def request(self, method: str, path: str, **kwargs) -> TestResponse:
+        """Send a request to the app. See :meth:`arequest`"""
+        return self.loop.run_until_complete(self.arequest(method, path, **kwargs))
+
+    def get(self, path: str, **kwargs) -> TestResponse:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> TestResponse:
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        """Close the HTTP sessions and the event loop."""
+        self.loop.run_until_complete(close_async_session())
+        self.loop.close()
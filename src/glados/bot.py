@@ -1,6 +1,10 @@
+import asyncio
 import glob
 import logging
-from typing import Dict, Union
+import threading
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, NoReturn, Optional, Tuple, Union
+from weakref import WeakKeyDictionary
 
 import yaml
 from slack import WebClient
@@ -8,8 +12,12 @@ from slack.errors import SlackRequestError
 from slack.web.classes.messages import Message
 from slack.web.slack_response import SlackResponse
 
+from .coalesce import UpdateCoalescer
+from .event_filter import EventFilter
+from .http import register_clients, run_coroutine, slack_client, thread_loop
+from .ratelimit import rate_limiter
 from .request import GladosRequest
-from .utils import get_enc_var, get_var, check_for_env_vars
+from .utils import check_for_env_vars
 
 
 class BotImporter:
@@ -36,6 +44,40 @@ class BotImporter:
             self.bots[bot_name] = GladosBot(name=bot_name, **bot_config)
 
 
+class SendResult:
+    """The result of sending one message with :meth:`GladosBot.send_messages`
+
+    Attributes
+    ----------
+    channel: str
+        the channel the message was sent to
+    response: Optional[SlackResponse]
+        the response data from Slack if the message was sent
+    error: Optional[Exception]
+        the error if the message was not sent
+    """
+
+    __slots__ = ("channel", "response", "error")
+
+    def __init__(
+        self,
+        channel: str,
+        response: Optional[SlackResponse] = None,
+        error: Optional[Exception] = None,
+    ):
+        self.channel = channel
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """True if the message was sent"""
+        return self.error is None
+
+    def __repr__(self):
+        return f"<SendResult| channel: {self.channel} | ok: {self.ok} >"
+
+
 class GladosBot:
     """ GLaDOS Bot represents all the required data and functions for a Slack bot.
 
@@ -51,6 +93,8 @@ class GladosBot:
         The bot token
     signing_secret
         The bot signing secret.
+    event_filter
+        config for the :obj:`EventFilter` used to drop unwanted Events for this bot.
 
     Attributes
     ----------
@@ -59,9 +103,15 @@ class GladosBot:
     token: str
         The bot token
     client: WebClient
-        A Slack client generated for that bot
+        A Slack client for that bot. It is built on first use.
+    async_client: WebClient
+        A Slack client for the running event loop. The API functions return awaitables.
     signing_secret: str
         The bots signing secret.
+    event_filter: Optional[EventFilter]
+        The filter used to drop unwanted Events.
+    coalescer: Optional[UpdateCoalescer]
+        Debounces update_message calls when ``update_window`` is set in the bot config.
 
     """
 
@@ -70,6 +120,8 @@ class GladosBot:
         token: Union[str, Dict[str, str]],
         name: str,
         signing_secret: Union[str, Dict[str, str]] = None,
+        event_filter: Optional[dict] = None,
+        update_window: float = 0,
         **kwargs,
     ):
         # Get the values from the env vars if used.
@@ -78,17 +130,101 @@ class GladosBot:
 
         self.name = name
         self.token = token
-        self.client = WebClient(token=token)
         self.signing_secret = signing_secret
+        self.event_filter = EventFilter(**event_filter) if event_filter else None
+        self.coalescer = (
+            UpdateCoalescer(self._update_message, update_window, name)
+            if update_window
+            else None
+        )
+        self.reset_clients()
+        register_clients(self)
+
+    def reset_clients(self) -> NoReturn:
+        """Drop the cached slack clients, they are built again on next use.
+
+        This is called by :func:`glados.http.reset_after_fork`.
+        """
+        # clients are cheap, the connections are shared by all bots. see glados.http
+        self._clients = threading.local()
+        self._async_clients = WeakKeyDictionary()
+
+    @property
+    def client(self) -> WebClient:
+        """Slack client for the current thread. It is built on first use."""
+        loop = thread_loop()
+        client = getattr(self._clients, "client", None)
+        # the thread loop is replaced when it is closed, the client is bound to the old one.
+        if client is None or client.session.closed or self._clients.loop is not loop:
+            client = slack_client(self.token)
+            self._clients.client = client
+            self._clients.loop = loop
+        return client
+
+    @property
+    def async_client(self) -> WebClient:
+        """Slack client for the running event loop. This must be used from a coroutine.
+
+        All Slack Web API functions can be awaited, ``await MyBot.async_client.*``
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.session.closed:
+            client = slack_client(self.token, run_async=True)
+            self._async_clients[loop] = client
+        return client
 
     def validate_slack_signature(self, request: GladosRequest):
-        valid = self.client.validate_slack_signature(
-            signing_secret=self.signing_secret, **request.slack_verify.json
-        )
+        if not request.slack_verify:
+            raise SlackRequestError("Request is missing slack verification data")
+        valid = request.slack_verify.is_valid(self.signing_secret)
         logging.info(f"valid payload signature from slack: {valid}")
         if not valid:
             raise SlackRequestError("Signature of request is not valid")
 
+    def api_call(
+        self, method: str, channel: Optional[str] = None, **kwargs
+    ) -> SlackResponse:
+        """Call a Slack Web API method through the rate limiter.
+
+        The call waits for its turn when the bot is over the Slack rate limit for the method
+        and it is retried when Slack responds with HTTP 429. See :obj:`glados.ratelimit.RateLimiter`
+
+        Parameters
+        ----------
+        method
+            the Slack method, like ``chat.postMessage``
+        channel
+            the channel to send with the call, if the method takes one.
+        kwargs
+            the arguments for the method
+
+        Returns
+        -------
+        SlackResponse
+        """
+        if channel is not None:
+            kwargs["channel"] = channel
+        return rate_limiter.call(
+            self.name,
+            method,
+            lambda: self.client.api_call(method, json=kwargs),
+            channel,
+        )
+
+    async def aapi_call(
+        self, method: str, channel: Optional[str] = None, **kwargs
+    ) -> SlackResponse:
+        """Async version of :meth:`api_call`"""
+        if channel is not None:
+            kwargs["channel"] = channel
+        return await rate_limiter.acall(
+            self.name,
+            method,
+            lambda: self.async_client.api_call(method, json=kwargs),
+            channel,
+        )
+
     def send_message(self, channel: str, message: Message) -> SlackResponse:
         """Send a message as the bot
 
@@ -103,24 +239,58 @@ class GladosBot:
         -------
 
         """
-        return self.client.chat_postMessage(
-            channel=channel, as_user=True, **message.to_dict()
+        return self.api_call(
+            "chat.postMessage", channel=channel, as_user=True, **message.to_dict()
         ).data
 
-    def update_message(self, channel: str, ts: str, message: Message) -> SlackResponse:
+    def update_message(
+        self, channel: str, ts: str, message: Message, wait: bool = False
+    ) -> Union[SlackResponse, Future]:
         """Updates a message that was sent by the bot
 
+        If ``update_window`` is set in the bot config, updates to the same message are
+        coalesced and only the latest one in the window is sent. See :obj:`UpdateCoalescer`
+
         Parameters
         ----------
         channel :
         ts :
         message :
+        wait :
+            when coalescing, block until the update is sent and return the response. This
+            can block for the whole ``update_window``. Call :meth:`flush_updates` to send
+            pending updates now.
 
         Returns
         -------
+        Union[SlackResponse, Future]
+            the Slack response when coalescing is off or ``wait`` is True. When coalescing
+            is on a Future of the response is returned right away by default.
+        """
+        if self.coalescer is None:
+            return self._update_message(channel, ts, message)
+        future = self.coalescer.update(channel, ts, message)
+        return future.result() if wait else future
+
+    def _update_message(self, channel: str, ts: str, message: Message) -> SlackResponse:
+        return self.api_call(
+            "chat.update", channel=channel, ts=ts, **message.to_dict()
+        ).data
+
+    def flush_updates(
+        self, channel: Optional[str] = None, ts: Optional[str] = None
+    ) -> NoReturn:
+        """Send coalesced updates now instead of waiting for the window.
 
+        Parameters
+        ----------
+        channel
+            only send updates for this channel.
+        ts
+            only send the update for this message.
         """
-        return self.client.chat_update(channel=channel, ts=ts, **message.to_dict()).data
+        if self.coalescer is not None:
+            self.coalescer.flush(channel, ts)
 
     def delete_message(self, channel: str, ts: str) -> SlackResponse:
         """Deletes a message that was sent by a bot
@@ -134,4 +304,87 @@ class GladosBot:
         -------
 
         """
-        return self.client.chat_delete(channel=channel, ts=ts).data
+        if self.coalescer is not None:
+            self.coalescer.cancel(channel, ts)
+        return self.api_call("chat.delete", channel=channel, ts=ts).data
+
+    async def asend_message(self, channel: str, message: Message) -> SlackResponse:
+        """Send a message as the bot without blocking the event loop.
+
+        See :meth:`send_message`
+        """
+        response = await self.aapi_call(
+            "chat.postMessage", channel=channel, as_user=True, **message.to_dict()
+        )
+        return response.data
+
+    async def aupdate_message(
+        self, channel: str, ts: str, message: Message
+    ) -> SlackResponse:
+        """Update a message that was sent by the bot without blocking the event loop.
+
+        See :meth:`update_message`
+        """
+        response = await self.aapi_call(
+            "chat.update", channel=channel, ts=ts, **message.to_dict()
+        )
+        return response.data
+
+    async def adelete_message(self, channel: str, ts: str) -> SlackResponse:
+        """Delete a message that was sent by the bot without blocking the event loop.
+
+        See :meth:`delete_message`
+        """
+        response = await self.aapi_call("chat.delete", channel=channel, ts=ts)
+        return response.data
+
+    def send_messages(
+        self, messages: Iterable[Tuple[str, Message]], max_concurrency: int = 10
+    ) -> List[SendResult]:
+        """Send many messages at once.
+
+        The messages are sent with up to ``max_concurrency`` in flight and still wait for the
+        rate limiter. A message that fails does not stop the others. This must not be called
+        from a coroutine, use :meth:`asend_messages`.
+
+        Examples
+        --------
+        >>> results = bot.send_messages([(c, alert) for c in channels])  # doctest: +SKIP
+        >>> failed = [r.channel for r in results if not r.ok]  # doctest: +SKIP
+
+        Parameters
+        ----------
+        messages
+            (channel, message) pairs to send
+        max_concurrency
+            max number of messages being sent at the same time
+
+        Returns
+        -------
+        List[SendResult]
+            one result for each message in the same order as ``messages``.
+        """
+        return run_coroutine(self.asend_messages(messages, max_concurrency))
+
+    async def asend_messages(
+        self, messages: Iterable[Tuple[str, Message]], max_concurrency: int = 10
+    ) -> List[SendResult]:
+        """Send many messages at once without blocking the event loop.
+
+        See :meth:`send_messages`
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def send(channel: str, message: Message) -> SendResult:
+            async with semaphore:
+                try:
+                    return SendResult(
+                        channel, response=await self.asend_message(channel, message)
+                    )
+                except Exception as e:
+                    logging.error(f"error sending message to {channel}: {e}")
+                    return SendResult(channel, error=e)
+
+        return list(
+            await asyncio.gather(*[send(channel, m) for channel, m in messages])
+        )
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, NoReturn, Optional, Tuple
+
+from .metrics import metrics
+
+MessageKey = Tuple[str, str]
+
+
+class InteractionCache:
+    """In memory LRU cache of interactions with a TTL.
+
+    Interactions are cached by ``interaction_id`` and by the (channel, slack ts) of the
+    message they are linked to, so clicking through a multi step message does not look up
+    the same interaction in postgres again and again. The cache holds the column values of
+    the interaction, not the ORM object, so it can be used by any session.
+
+    The datastore invalidates an interaction when it is changed through this process. Changes
+    made by other nodes are seen when the entry expires, so keep the ttl short when the
+    interaction is updated from more than one node.
+
+    This is turned on with ``cache_size`` in the ``datastore`` config. See
+    :obj:`glados.datastore.DataStore`
+
+    The cache reports these metrics:
+
+    - ``datastore.cache.hits``: lookups found in the cache.
+    - ``datastore.cache.misses``: lookups that went to postgres.
+
+    Examples
+    --------
+    >>> cache = InteractionCache(max_size=10, ttl=60)
+    >>> cache.put("1234", {"bot": "bot"}, channel="C123", ts="1584379414.000800")
+    >>> cache.get_by_message("C123", "1584379414.000800")
+    {'bot': 'bot'}
+    >>> cache.invalidate("1234")
+    >>> cache.get("1234") is None
+    True
+
+    Parameters
+    ----------
+    max_size
+        the max number of interactions to keep. The least recently used are dropped first.
+    ttl
+        how long to keep an interaction in seconds.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        # interaction_id -> (expires, values, message key)
+        self._entries = (
+            OrderedDict()
+        )  # type: OrderedDict[str, Tuple[float, dict, Optional[MessageKey]]]
+        self._messages = dict()  # type: Dict[MessageKey, str]
+        self._lock = threading.Lock()
+
+    def get(self, interaction_id: str) -> Optional[dict]:
+        """Get the cached values of an interaction by interaction_id."""
+        with self._lock:
+            values = self._get(interaction_id)
+        self._count(values)
+        return values
+
+    def get_by_message(self, channel: str, ts: str) -> Optional[dict]:
+        """Get the cached values of an interaction by the channel and ts of its message."""
+        with self._lock:
+            interaction_id = self._messages.get((channel, ts))
+            values = self._get(interaction_id) if interaction_id is not None else None
+        self._count(values)
+        return values
+
+    @staticmethod
+    def _count(values: Optional[dict]) -> NoReturn:
+        if values is None:
+            metrics.incr("datastore.cache.misses")
+        else:
+            metrics.incr("datastore.cache.hits")
+
+    def _get(self, interaction_id: str) -> Optional[dict]:
+        entry = self._entries.get(interaction_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(interaction_id)
+            return None
+        self._entries.move_to_end(interaction_id)
+        return entry[1]
+
+    def put(
+        self,
+        interaction_id: str,
+        values: dict,
+        channel: Optional[str] = None,
+        ts: Optional[str] = None,
+    ) -> NoReturn:
+        """Cache the values of an interaction.
+
+        Parameters
+        ----------
+        interaction_id
+            the id of the interaction
+        values
+            the column values of the interaction
+        channel
+            the channel of the message the interaction is linked to
+        ts
+            the slack ts of the message the interaction is linked to
+        """
+        message_key = (channel, ts) if channel is not None and ts is not None else None
+        with self._lock:
+            self._remove(interaction_id)
+            self._entries[interaction_id] = (
+                time.monotonic() + self.ttl,
+                values,
+                message_key,
+            )
+            if message_key is not None:
+                self._messages[message_key] = interaction_id
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, interaction_id: str) -> NoReturn:
+        entry = self._entries.pop(interaction_id, None)
+        if entry is not None and entry[2] is not None:
+            self._messages.pop(entry[2], None)
+
+    def invalidate(self, interaction_id: str) -> NoReturn:
+        """Drop an interaction from the cache."""
+        with self._lock:
+            self._remove(interaction_id)
+
+    def clear(self) -> NoReturn:
+        """Drop all the interactions from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self._messages.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, NoReturn, Optional, Tuple
+
+from slack.web.classes.messages import Message
+from slack.web.slack_response import SlackResponse
+
+from . import http
+from .metrics import metrics
+
+MessageKey = Tuple[str, str]
+
+
+class _PendingUpdate:
+    __slots__ = ("message", "futures", "due")
+
+    def __init__(self, due: float):
+        self.message = None  # type: Optional[Message]
+        self.futures = list()  # type: List[Future]
+        self.due = due
+
+
+class UpdateCoalescer:
+    """Debounce message updates so only the latest update in a window is sent to Slack.
+
+    The first update for a (channel, ts) starts a window. Updates for the same message that
+    come in before the window ends replace the pending message. When the window ends the
+    latest message is sent and every caller gets that response. Callers get a Future so
+    they do not block for the window.
+
+    Updates are sent from one flusher thread that is started on the first update, so the
+    event loop and the Slack connections of the thread are reused for every window. Call
+    :meth:`stop` to send the pending updates and close them.
+
+    This is turned on with ``update_window`` in the bot config. See
+    :meth:`glados.bot.GladosBot.update_message`
+
+    The coalescer reports these metrics:
+
+    - ``coalesce.<bot>.updates``: updates received.
+    - ``coalesce.<bot>.sent``: updates sent to Slack.
+
+    Parameters
+    ----------
+    send
+        sends an update, called with (channel, ts, message).
+    window
+        seconds to wait for more updates before sending.
+    name
+        the name used in the metrics, normally the bot name.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[str, str, Message], SlackResponse],
+        window: float,
+        name: str = "bot",
+    ):
+        self.window = window
+        self.name = name
+        self._send = send
+        self._lock = threading.Lock()
+        # the window is the same for every message, so the first entry is due first.
+        self._pending = dict()  # type: Dict[MessageKey, _PendingUpdate]
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def update(self, channel: str, ts: str, message: Message) -> Future:
+        """Queue an update.
+
+        Parameters
+        ----------
+        channel
+            channel of the message
+        ts
+            ts of the message
+        message
+            the new message
+
+        Returns
+        -------
+        Future
+            resolves to the Slack response of the update that was sent.
+        """
+        metrics.incr(f"coalesce.{self.name}.updates")
+        key = (channel, ts)
+        future = Future()
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = _PendingUpdate(time.monotonic() + self.window)
+                self._pending[key] = pending
+                self._start()
+            pending.message = message
+            pending.futures.append(future)
+        self._wakeup.set()
+        return future
+
+    def _start(self) -> NoReturn:
+        # the thread is not running after a fork or a stop.
+        if self._thread is None or not self._thread.is_alive():
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(self._stop,),
+                name=f"glados-coalesce-{self.name}",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _next_due(self) -> Optional[Tuple[MessageKey, float]]:
+        with self._lock:
+            first = next(iter(self._pending.items()), None)
+        return None if first is None else (first[0], first[1].due)
+
+    def _run(self, stop: threading.Event) -> NoReturn:
+        try:
+            while not stop.is_set():
+                due = self._next_due()
+                timeout = None if due is None else due[1] - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    self._flush_key(due[0])
+                    continue
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+            self.flush()
+        finally:
+            http.close_thread_loop()
+
+    def _flush_key(self, key: MessageKey) -> NoReturn:
+        with self._lock:
+            pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        metrics.incr(f"coalesce.{self.name}.sent")
+        try:
+            response = self._send(key[0], key[1], pending.message)
+        except Exception as e:
+            logging.error(f"error sending coalesced update for {key}: {e}")
+            for future in pending.futures:
+                future.set_exception(e)
+        else:
+            for future in pending.futures:
+                future.set_result(response)
+
+    def flush(self, channel: Optional[str] = None, ts: Optional[str] = None) -> NoReturn:
+        """Send pending updates now.
+
+        Parameters
+        ----------
+        channel
+            only send updates for this channel.
+        ts
+            only send the update for this message.
+        """
+        with self._lock:
+            keys = [
+                key
+                for key in self._pending
+                if (channel is None or key[0] == channel) and (ts is None or key[1] == ts)
+            ]
+        for key in keys:
+            self._flush_key(key)
+
+    def cancel(self, channel: str, ts: str) -> NoReturn:
+        """Drop the pending update for a message, for example when it is deleted."""
+        with self._lock:
+            pending = self._pending.pop((channel, ts), None)
+        if pending is not None:
+            for future in pending.futures:
+                future.cancel()
+
+    def stop(self, wait: bool = True) -> NoReturn:
+        """Send the pending updates and stop the flusher thread.
+
+        Parameters
+        ----------
+        wait
+            wait for the pending updates to be sent.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
@@ -0,0 +1,130 @@
+import json
+import logging
+from typing import Any, Union
+
+from .errors import GladosError
+
+
+class JSONCodec:
+    """The JSON encoder/decoder used by GLaDOS. This uses the python json module.
+
+    Subclass this and override :meth:`loads` and :meth:`dumps` to use a different JSON library.
+    """
+
+    name = "json"
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        """Decode a JSON document.
+
+        Parameters
+        ----------
+        data
+            JSON document to decode.
+
+        Raises
+        ------
+        :obj:`json.JSONDecodeError`
+            the data is not valid JSON
+        """
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        """Encode an object as a JSON string.
+
+        Parameters
+        ----------
+        obj
+            object to encode.
+        """
+        return json.dumps(obj)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}| name: {self.name} >"
+
+
+class OrjsonCodec(JSONCodec):
+    """JSON codec using orjson. This requires the orjson package to be installed."""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._orjson = orjson
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+        return self._orjson.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        return self._orjson.dumps(obj).decode("utf-8")
+
+
+CODECS = {JSONCodec.name: JSONCodec, OrjsonCodec.name: OrjsonCodec}
+
+_codec = JSONCodec()  # type: JSONCodec
+
+
+def load_codec(codec: Union[str, JSONCodec]) -> JSONCodec:
+    """Get a codec by name.
+
+    Parameters
+    ----------
+    codec
+        the name of the codec (``json`` or ``orjson``), ``auto`` to use orjson if it is
+        installed and fall back to json, or a :obj:`JSONCodec` object.
+
+    Raises
+    ------
+    GladosError
+        the codec is not known or can not be loaded.
+    """
+    if isinstance(codec, JSONCodec):
+        return codec
+    if codec == "auto":
+        try:
+            return OrjsonCodec()
+        except ImportError:
+            logging.info("orjson is not installed. using json codec.")
+            return JSONCodec()
+    if codec not in CODECS:
+        raise GladosError(f"unknown json codec: {codec}")
+    try:
+        return CODECS[codec]()
+    except ImportError as e:
+        raise GladosError(f"unable to load json codec {codec}: {e}")
+
+
+def set_codec(codec: Union[str, JSONCodec]) -> JSONCodec:
+    """Set the codec used by GLaDOS to encode and decode JSON.
+
+    The codec is process wide, it is used by every :obj:`glados.Glados` and
+    :obj:`glados.GladosRequest` in the process. Set it once at startup.
+
+    Parameters
+    ----------
+    codec
+        codec name or object. See :func:`load_codec`
+    """
+    global _codec
+    new_codec = load_codec(codec)
+    if new_codec.name != _codec.name:
+        logging.info(f"replacing the process wide json codec {_codec} with {new_codec}")
+    _codec = new_codec
+    logging.debug(f"using json codec: {_codec}")
+    return _codec
+
+
+def get_codec() -> JSONCodec:
+    """Returns the codec used by GLaDOS."""
+    return _codec
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decode a JSON document with the current codec."""
+    return _codec.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Encode an object as a JSON string with the current codec."""
+    return _codec.dumps(obj)
@@ -1,14 +1,26 @@
+import asyncio
 import logging
-from typing import Dict, List, NoReturn, Optional
+from functools import partial
+from typing import Dict, List, NoReturn, Optional, Tuple, Union
 
 from pkg_resources import get_distribution
 
 from .bot import BotImporter, GladosBot
+from .codec import JSONCodec, get_codec, set_codec
 from .configs import GladosConfig, read_config
 from .datastore import DataStore
+from .dedup import DataStoreDedupCache, DedupCache, MemoryDedupCache
+from .deferred import DeferredExecutor
+from .followup import CronScheduler, FollowupScheduler
+from .http import run_coroutine, setup_session
+from .metrics import metrics
+from .migrations import migrate
 from .plugin import GladosPlugin, PluginImporter
+from .ratelimit import rate_limiter
 from .request import GladosRequest
-from .router import GladosRouter
+from .route_type import RouteType
+from .router import GladosRoute, GladosRouter
+from .sweeper import TTLSweeper
 
 
 class Glados:
@@ -20,6 +32,8 @@ class Glados:
         plugins_folder: Optional[str] = None,
         bots_config_dir: Optional[str] = None,
         plugins_config_dir: Optional[str] = None,
+        json_codec: Optional[Union[str, JSONCodec]] = None,
+        autostart_jobs: bool = True,
     ):
         """Glados is the core of the GLaDOS package.
 
@@ -33,6 +47,16 @@ class Glados:
             path to bots config folder
         plugins_config_dir
             path to plugin config folder.
+        json_codec
+            process wide JSON codec to use for decoding requests and encoding responses.
+            This can be ``json``, ``orjson``, ``auto`` or a :obj:`JSONCodec` object. The
+            codec is shared by every Glados and GladosRequest in the process, setting it
+            here changes it for all of them. If not set the current codec is used, which
+            is ``json`` by default. See :func:`glados.codec.set_codec`
+        autostart_jobs
+            start the followup, cron and ttl sweeper threads that are enabled in the config
+            when they are set up. Set this to False to start them later with
+            :meth:`start_jobs`, like in a process forked after the config is read.
 
         Notes
         -----
@@ -55,6 +79,16 @@ class Glados:
         self.global_config = None
         self.enable_datastore = False
         self.datastore = None  # type: Optional[DataStore]
+        if json_codec:
+            set_codec(json_codec)
+        self.dedup = None  # type: Optional[DedupCache]
+        self.deferred = None  # type: Optional[DeferredExecutor]
+        self.followups = None  # type: Optional[FollowupScheduler]
+        self.cron = None  # type: Optional[CronScheduler]
+        self.sweeper = None  # type: Optional[TTLSweeper]
+        self.autostart_jobs = autostart_jobs
+        # the enabled background jobs, started by start_jobs.
+        self._jobs = dict()  # type: Dict[str, Union[FollowupScheduler, CronScheduler, TTLSweeper]]
 
     def read_config(self, bot_name: Optional[str] = None) -> NoReturn:
         """Read the GLaDOS config file. If a bot name is provided it will only install that bot. Else it will install all bots.
@@ -84,6 +118,10 @@ class Glados:
         self.plugins_config_dir = config.get("plugins_config_folder")
         self.bots_config_dir = config.get("bots_config_folder")
 
+        json_codec = config.get("json_codec")
+        if json_codec:
+            set_codec(json_codec)
+
         import_bots = config.get("import_bots")
         if import_bots:
             logging.info("auto-importing bots as set in glados config file")
@@ -106,6 +144,7 @@ class Glados:
             ds_password = ds_config.get("password")
             ds_database = ds_config.get("database", "glados")
             ds_recreate = ds_config.get("recreate", False)
+            ds_migrate = ds_config.get("migrate", True)
             if None in [
                 ds_enabled,
                 ds_host,
@@ -121,14 +160,13 @@ class Glados:
             else:
                 self.enable_datastore = ds_enabled
                 if ds_enabled:
-                    self.datastore = DataStore(
-                        host=ds_host,
-                        port=ds_port,
-                        username=ds_username,
-                        password=ds_password,
-                        database=ds_database,
-                    )
+                    self.datastore = DataStore.from_config(ds_config.to_dict())
                     self.datastore.create_table(force=ds_recreate)
+                    if ds_migrate:
+                        migrate(
+                            self.datastore,
+                            params=ds_config.to_dict().get("migration_params"),
+                        )
                     logging.info("testing datastore connection...")
                     session = self.datastore.create_session()
                     if not session.is_active:
@@ -148,6 +186,238 @@ class Glados:
             logging.warning("datastore section not found in config file")
             self.enable_datastore = False
 
+        dedup_config = config.get("event_dedup")
+        if dedup_config:
+            self.setup_dedup(**dedup_config.to_dict())
+
+        deferred_config = config.get("deferred")
+        if deferred_config:
+            self.setup_deferred(**deferred_config.to_dict())
+
+        followups_config = config.get("followups")
+        if followups_config:
+            self.setup_followups(**followups_config.to_dict())
+
+        cron_config = config.get("cron")
+        if cron_config:
+            self.setup_cron(**cron_config.to_dict())
+
+        sweeper_config = config.get("ttl_sweeper")
+        if sweeper_config:
+            self.setup_sweeper(**sweeper_config.to_dict())
+
+        http_config = config.get("http")
+        if http_config:
+            setup_session(**http_config.to_dict())
+
+        rate_limit_config = config.get("rate_limit")
+        if rate_limit_config:
+            rate_limiter.configure(**rate_limit_config.to_dict())
+
+    def setup_deferred(
+        self, max_workers: int = 4, max_queue: int = 100, **kwargs
+    ) -> NoReturn:
+        """Set up the worker pool used to run deferred routes.
+
+        This is set with the ``deferred`` section in the glados config. If it is not set up,
+        a pool with the default settings is created on the first deferred request.
+
+        Parameters
+        ----------
+        max_workers
+            number of worker threads.
+        max_queue
+            max number of deferred requests waiting or running.
+        """
+        if self.deferred is not None:
+            self.deferred.shutdown(wait=False)
+        self.deferred = DeferredExecutor(max_workers=max_workers, max_queue=max_queue)
+
+    def setup_followups(
+        self,
+        enabled: bool = True,
+        batch_size: int = 100,
+        poll_interval: float = 5,
+        workers: int = 1,
+        **kwargs,
+    ) -> NoReturn:
+        """Set up the scheduler that runs the followup actions of interactions.
+
+        This is set with the ``followups`` section in the glados config. If enabled the
+        scheduler threads are started. Set ``enabled: no`` to only run followups when
+        ``glados.followups.run_pending()`` is called, like from a scheduled AWS Lambda.
+
+        Parameters
+        ----------
+        enabled
+            start the scheduler threads.
+        batch_size
+            max number of followups claimed at once.
+        poll_interval
+            seconds to wait between polls when there are no due followups.
+        workers
+            number of threads polling for followups.
+        """
+        if not self.has_datastore():
+            logging.error("followups need the datastore. followups are disabled.")
+            return
+        if self.followups is not None:
+            self.followups.stop(wait=False)
+        self.followups = FollowupScheduler(
+            self, batch_size=batch_size, poll_interval=poll_interval, workers=workers
+        )
+        self._enable_job("followups", self.followups, enabled)
+
+    def setup_cron(
+        self,
+        enabled: bool = True,
+        intervals: Optional[Dict[str, float]] = None,
+        default_interval: float = 300,
+        refresh_interval: float = 60,
+        **kwargs,
+    ) -> NoReturn:
+        """Set up the scheduler that runs the cron_followup_action of interactions.
+
+        This is set with the ``cron`` section in the glados config. If enabled the schedule
+        is loaded from the datastore and the scheduler thread is started. Set ``enabled: no``
+        to run the due actions with ``glados.cron.run_due()`` after ``glados.cron.rebuild()``.
+
+        Parameters
+        ----------
+        enabled
+            start the scheduler thread.
+        intervals
+            seconds between runs for each action.
+        default_interval
+            seconds between runs for actions not in intervals.
+        refresh_interval
+            seconds between loading new cron interactions from the datastore.
+        """
+        if not self.has_datastore():
+            logging.error("cron needs the datastore. cron is disabled.")
+            return
+        if self.cron is not None:
+            self.cron.stop(wait=False)
+        self.cron = CronScheduler(
+            self,
+            intervals=intervals,
+            default_interval=default_interval,
+            refresh_interval=refresh_interval,
+        )
+        self._enable_job("cron", self.cron, enabled)
+
+    def setup_sweeper(
+        self,
+        enabled: bool = True,
+        batch_size: int = 1000,
+        interval: float = 60,
+        pause: float = 0.1,
+        **kwargs,
+    ) -> NoReturn:
+        """Set up the sweeper that deletes interactions when their ttl expires.
+
+        This is set with the ``ttl_sweeper`` section in the glados config. If enabled the
+        sweeper thread is started. Set ``enabled: no`` to only delete expired interactions
+        when ``glados.sweeper.sweep()`` is called.
+
+        Parameters
+        ----------
+        enabled
+            start the sweeper thread.
+        batch_size
+            max number of interactions deleted in one transaction.
+        interval
+            seconds between sweeps.
+        pause
+            seconds to wait between batches.
+        """
+        if not self.has_datastore():
+            logging.error("ttl_sweeper needs the datastore. ttl_sweeper is disabled.")
+            return
+        if self.sweeper is not None:
+            self.sweeper.stop(wait=False)
+        self.sweeper = TTLSweeper(
+            self, batch_size=batch_size, interval=interval, pause=pause
+        )
+        self._enable_job("ttl_sweeper", self.sweeper, enabled)
+
+    def _enable_job(
+        self,
+        name: str,
+        job: Union[FollowupScheduler, CronScheduler, TTLSweeper],
+        enabled: bool,
+    ) -> NoReturn:
+        self._jobs.pop(name, None)
+        if enabled:
+            self._jobs[name] = job
+            if self.autostart_jobs:
+                job.start()
+
+    def start_jobs(self) -> NoReturn:
+        """Start the followup, cron and ttl sweeper threads that are enabled in the config.
+
+        Only call this when ``autostart_jobs`` is False, otherwise the jobs are started when
+        they are set up. Threads do not survive a fork and a lock held by one of them at the
+        fork stays locked in the child, so start the jobs in the process that runs them.
+        """
+        for job in self._jobs.values():
+            job.start()
+
+    def stop(self, wait: bool = True) -> NoReturn:
+        """Stop the followup, cron and ttl sweeper threads and close the datastore connections.
+
+        Call this before the instance is replaced, like on a graceful restart, so that the
+        old and the new instance do not both run the background jobs. Coalesced message
+        updates of the bots are sent before their flusher threads stop.
+
+        Parameters
+        ----------
+        wait
+            wait for the jobs that are running to finish.
+        """
+        for job in (self.followups, self.cron, self.sweeper):
+            if job is not None:
+                job.stop(wait=wait)
+        for bot in self.bots.values():
+            if bot.coalescer is not None:
+                bot.coalescer.stop(wait=wait)
+        if self.has_datastore():
+            self.datastore.db.dispose()
+
+    def setup_dedup(
+        self,
+        backend: str = "memory",
+        ttl: int = 3600,
+        max_size: int = 10000,
+        **kwargs,
+    ) -> NoReturn:
+        """Set up the dedup cache that drops Slack Event retries.
+
+        This is set with the ``event_dedup`` section in the glados config.
+
+        Parameters
+        ----------
+        backend
+            ``memory`` for an in process cache or ``datastore`` to share the cache between
+            nodes using the datastore.
+        ttl
+            how long to remember an event in seconds.
+        max_size
+            the max number of events to remember. (memory only)
+        """
+        if backend == "datastore":
+            if not self.has_datastore():
+                logging.error(
+                    "event_dedup backend is datastore but the datastore is not enabled. using memory."
+                )
+                backend = "memory"
+            else:
+                self.dedup = DataStoreDedupCache(self.datastore, ttl=ttl)
+        if backend == "memory":
+            self.dedup = MemoryDedupCache(max_size=max_size, ttl=ttl)
+        if self.dedup is None:
+            logging.error(f"unknown event_dedup backend: {backend}")
+
     def import_bots(self) -> NoReturn:
         """Import all discovered bots"""
         logging.info("importing bots...")
@@ -185,6 +455,7 @@ class Glados:
         importer.import_discovered_plugins(self.bots)
         for plugin in importer.plugins.values():
             self.add_plugin(plugin)
+        self.router.freeze()
         logging.info(f"successfully imported {len(self.plugins)} plugins")
 
     def add_plugin(self, plugin: GladosPlugin) -> NoReturn:
@@ -209,6 +480,11 @@ class Glados:
         """
         self.bots[bot.name] = bot
 
+    @property
+    def codec(self) -> JSONCodec:
+        """The process wide JSON codec. See :func:`glados.codec.set_codec`"""
+        return get_codec()
+
     def has_datastore(self) -> bool:
         """Returns True if there is a datastore else False"""
         return (
@@ -220,7 +496,10 @@ class Glados:
     def request(self, request: GladosRequest):
         """Send a request to GLaDOS. This returns whatever the plugin returns.
 
-        This function will also set the datastore session for the request, try to find the interaction in the datastore and fetch it. This info is available in the request.
+        This function will also set the datastore for the request. The datastore session and the interaction are loaded when the route first uses them, see ``preload_interaction`` in :meth:`glados.plugin.GladosPlugin.add_route`.
+
+        Async plugin routes are run to completion on a new event loop. Use :meth:`arequest`
+        when GLaDOS is served from an event loop.
 
         Parameters
         ----------
@@ -228,18 +507,183 @@ class Glados:
             the request to be sent to GLaDOS
 
         """
-        # DataStore actions if enabled
-        if self.has_datastore():
-            try:
-                request.set_datastore(self.datastore)
-                request.set_interaction_from_datastore()
-            except Exception as e:
-                logging.error(
-                    f"error setting up datastore or retrieving interaction : {e} for request: {request}"
+        drop, dedup_key = self._check_request(request)
+        if drop:
+            return ""
+
+        try:
+            route = self.router.match(request)
+            if route.deferred:
+                if self._defer(request, route, dedup_key):
+                    return route.ack
+                logging.warning(
+                    f"deferred queue is full. running {request.route} inline."
                 )
+            return self._exec_request(request, route)
+        except Exception:
+            if dedup_key:
+                # let slack retry the event
+                self.dedup.release(dedup_key)
+            raise
+
+    async def arequest(self, request: GladosRequest):
+        """Send a request to GLaDOS from a coroutine. This returns whatever the plugin returns.
 
-        response = self.router.exec_route(request)
+        Async plugin routes are awaited on the running event loop. Sync plugin routes and
+        datastore calls are run in the default executor so they do not block the loop.
+
+        Parameters
+        ----------
+        request
+            the request to be sent to GLaDOS
+        """
+        loop = asyncio.get_running_loop()
+        blocking_dedup = isinstance(self.dedup, DataStoreDedupCache)
+        if blocking_dedup:
+            drop, dedup_key = await loop.run_in_executor(
+                None, self._check_request, request
+            )
+        else:
+            drop, dedup_key = self._check_request(request)
+        if drop:
+            return ""
+
+        try:
+            route = self.router.match(request)
+            if route.deferred:
+                if self._defer(request, route, dedup_key, loop):
+                    return route.ack
+                logging.warning(
+                    f"deferred queue is full. running {request.route} inline."
+                )
+            if route.is_async:
+                return await self._aexec_request(request, route)
+            return await loop.run_in_executor(
+                None, self._exec_request, request, route
+            )
+        except Exception:
+            if dedup_key:
+                # let slack retry the event
+                if blocking_dedup:
+                    await loop.run_in_executor(None, self.dedup.release, dedup_key)
+                else:
+                    self.dedup.release(dedup_key)
+            raise
+
+    def _check_request(self, request: GladosRequest) -> Tuple[bool, Optional[str]]:
+        """Run the event filter and dedup cache for the request.
+
+        Returns
+        -------
+        Tuple[bool, Optional[str]]
+            True if the request should be dropped and the dedup key that was claimed.
+        """
+        if request.route_type is not RouteType.Events:
+            return False, None
+
+        bot = self.bots.get(request.bot_name)
+        if bot and bot.event_filter and not bot.event_filter.allow(request):
+            return True, None
+
+        dedup_key = None
+        if self.dedup is not None:
+            dedup_key = self.dedup.key(request)
+            if dedup_key and not self.dedup.claim(dedup_key):
+                logging.info(
+                    f"dropping duplicate event {dedup_key} retry: {request.headers.get('x-slack-retry-num')} "
+                    f"reason: {request.headers.get('x-slack-retry-reason')}"
+                )
+                metrics.incr(f"events.dedup.{request.bot_name}.duplicates")
+                return True, None
+        return False, dedup_key
+
+    def _defer(
+        self,
+        request: GladosRequest,
+        route: GladosRoute,
+        dedup_key: Optional[str] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+    ) -> bool:
+        """Queue a deferred route. Returns False if the deferred queue is full.
+
+        Async routes are run as a task on ``loop`` when one is given, everything else is
+        run on the deferred worker threads. The dedup key is released if the route fails.
+        """
+        if self.deferred is None:
+            self.setup_deferred()
+        if loop is not None and route.is_async:
+            return self.deferred.spawn(
+                partial(self._aexec_deferred, route=route, dedup_key=dedup_key),
+                request,
+                loop,
+            )
+        return self.deferred.submit(
+            partial(self._exec_deferred, route=route, dedup_key=dedup_key), request
+        )
+
+    def _exec_deferred(
+        self, request: GladosRequest, route: GladosRoute, dedup_key: Optional[str]
+    ):
+        """Run a deferred route, releasing the dedup key if it fails."""
+        try:
+            return self._exec_request(request, route)
+        except Exception:
+            if dedup_key:
+                self.dedup.release(dedup_key)
+            raise
+
+    async def _aexec_deferred(
+        self, request: GladosRequest, route: GladosRoute, dedup_key: Optional[str]
+    ):
+        """Async version of :meth:`_exec_deferred`"""
+        try:
+            return await self._aexec_request(request, route)
+        except Exception:
+            if dedup_key:
+                if isinstance(self.dedup, DataStoreDedupCache):
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.dedup.release, dedup_key
+                    )
+                else:
+                    self.dedup.release(dedup_key)
+            raise
+
+    def _exec_request(self, request: GladosRequest, route: GladosRoute):
+        """Set up the datastore for the request and run the route."""
+        self._open_datastore(request, route)
+        if route.is_async:
+            response = run_coroutine(route.handler(request))
+        else:
+            response = route.handler(request)
+        return self._close_datastore(request, response)
+
+    async def _aexec_request(self, request: GladosRequest, route: GladosRoute):
+        """Async version of :meth:`_exec_request`"""
+        if not self.has_datastore():
+            return await route.handler(request)
+        loop = asyncio.get_running_loop()
+        if route.preload_interaction:
+            await loop.run_in_executor(None, self._open_datastore, request, route)
+        else:
+            self._open_datastore(request, route)
+        response = await route.handler(request)
+        if request._session is None and not request.auto_link:
+            return response
+        return await loop.run_in_executor(
+            None, self._close_datastore, request, response
+        )
+
+    def _open_datastore(self, request: GladosRequest, route: GladosRoute) -> NoReturn:
+        """Set the datastore on the request, loading the interaction if the route asks."""
+        # DataStore actions if enabled
+        if self.has_datastore():
+            request.set_datastore(self.datastore)
+            if route.preload_interaction:
+                # errors are logged by the request and the interaction is left as None.
+                request.has_interaction()
 
+    def _close_datastore(self, request: GladosRequest, response):
+        """Link the response to a new interaction and close the datastore session."""
         if self.has_datastore() and request.auto_link and request.new_interaction:
             try:
                 request.link_interaction_to_message_response(
@@ -249,7 +693,7 @@ class Glados:
                 logging.error(
                     f"error linking response to interaction: {e} response: {response}"
                 )
-                request._session.rollback()
+                request.rollback_session()
             finally:
                 request.close_session()
                 return response
@@ -1,18 +1,69 @@
+import copy
 import logging
-from datetime import datetime
-from typing import List, NoReturn, Optional
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, NoReturn, Optional, Union
 from uuid import uuid4
 
-from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine
-from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    and_,
+    create_engine,
+    delete,
+    event,
+    func,
+    inspect,
+    literal_column,
+    select,
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID, insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Query, Session, sessionmaker
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Query, Session, make_transient_to_detached, sessionmaker
 from sqlalchemy.orm.exc import MultipleResultsFound
+from sqlalchemy.pool import NullPool, QueuePool
+
+from .cache import InteractionCache
+from .metrics import metrics
 
 Metadata = MetaData()
 Base = declarative_base(metadata=Metadata)
 
 TABLE_INTERACTIONS = "interactions"
+TABLE_DEDUP_KEYS = "dedup_keys"
+TABLE_MIGRATIONS = "schema_migrations"
+
+
+def to_slack_ts(ts: Union[str, float, datetime]) -> str:
+    """Get the Slack ts string of a message ts.
+
+    Slack message ts are strings with 6 decimal places. They are the ID of the message
+    in the channel so they are compared as strings.
+
+    Examples
+    --------
+    >>> to_slack_ts("1584379414.000800")
+    '1584379414.000800'
+    >>> to_slack_ts(1584379414.0008)
+    '1584379414.000800'
+
+    Parameters
+    ----------
+    ts
+        the ts as sent by Slack, a float or a datetime.
+    """
+    if isinstance(ts, str):
+        return ts
+    if isinstance(ts, datetime):
+        ts = ts.timestamp()
+    return f"{ts:.6f}"
 
 
 class DataStoreInteraction(Base):
@@ -32,8 +83,12 @@ class DataStoreInteraction(Base):
         The channel that this interaction was sent to.
     message_ts: :obj:`datetime`
         The message timestamp when this interaction was sent.
+    slack_ts: :obj:`str`
+        The exact Slack ts of the message. Together with message_channel this is unique and is used to find the interaction.
     ttl: :obj:`int`
-        How long this interaction should live for.
+        How long this interaction should live for in seconds.
+    expires: :obj:`datetime`
+        When the interaction expires, ``ts + ttl``. This is None if there is no ttl. It is not stored, the ttl sweeper finds the expired interactions with an index on the expression.
     followup_ts: :obj:`datetime`
         When should the follow up action happen.
     followup_action: :obj:`str`
@@ -42,31 +97,162 @@ class DataStoreInteraction(Base):
         The action name to execute on a normal cron schedule like every 5 min. If None then no action will happen.
     followed_up: :obj:`datetime`
         This is the time when the action was followed up at. If it has not happened yet this value will be None.
+    updated_at: :obj:`datetime`
+        The database time when the row was last inserted or updated through the ORM. The cron scheduler loads the interactions changed since its last load with this.
     """
 
     __tablename__ = TABLE_INTERACTIONS
-    interaction_id = Column(UUID, primary_key=True, default=str(uuid4()))
-    ts = Column(DateTime, default=datetime.now())
+    # the defaults are callables so they are evaluated for each row, not once at import.
+    interaction_id = Column(UUID, primary_key=True, default=lambda: str(uuid4()))
+    ts = Column(DateTime, default=datetime.now)
     bot = Column(String, nullable=False)
     data = Column(JSONB, default=dict())
     message_channel = Column(String, default=None)
     message_ts = Column(DateTime, default=None)
+    slack_ts = Column(String, default=None)
     ttl = Column(Integer, default=None)
     followup_ts = Column(DateTime, default=None)
     followup_action = Column(String, default=None)
     cron_followup_action = Column(String, default=None)
     followed_up = Column(DateTime, default=None)
+    # set by the database clock so the nodes do not need synced clocks.
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        # a message can only be linked to one interaction.
+        Index("ux_interactions_message", message_channel, slack_ts, unique=True),
+        # partial index so finding due followups does not scan the whole table.
+        Index(
+            "ix_interactions_followup_due",
+            followup_ts,
+            postgresql_where=and_(followed_up.is_(None), followup_action.isnot(None)),
+        ),
+        # the cron scheduler loads changed cron interactions by updated_at.
+        Index(
+            "ix_interactions_cron_updated",
+            updated_at,
+            postgresql_where=cron_followup_action.isnot(None),
+        ),
+        # the ttl sweeper deletes by expires, rows without a ttl are not in the index.
+        Index(
+            "ix_interactions_expiry",
+            ts + ttl * literal_column("interval '1 second'"),
+            postgresql_where=ttl.isnot(None),
+        ),
+    )
+
+    @hybrid_property
+    def expires(self) -> Optional[datetime]:
+        if self.ts is None or self.ttl is None:
+            return None
+        return self.ts + timedelta(seconds=self.ttl)
+
+    @expires.expression
+    def expires(cls):
+        # the same expression as ix_interactions_expiry, so queries can use the index.
+        return cls.ts + cls.ttl * literal_column("interval '1 second'")
 
     def update(self, **kwargs):
         """Update the object dropping any arguments that are not valid"""
-        for k, v in kwargs:
+        for k, v in kwargs.items():
             if hasattr(self, k):
                 setattr(self, k, v)
 
 
+class DataStoreDedupKey(Base):
+    """DataStoreDedupKey is a claimed dedup key. This is used to drop Slack retries across nodes.
+
+    Attributes
+    ----------
+    key: :obj:`str`
+        The dedup key. This is the primary key.
+    expires: :obj:`datetime`
+        When the key can be claimed again.
+    """
+
+    __tablename__ = TABLE_DEDUP_KEYS
+    key = Column(String, primary_key=True)
+    expires = Column(DateTime, nullable=False, index=True)
+
+
+class DataStoreMigration(Base):
+    """DataStoreMigration is a schema migration that was applied to the datastore.
+
+    Attributes
+    ----------
+    version: :obj:`int`
+        The version of the migration. This is the primary key.
+    name: :obj:`str`
+        The name of the migration.
+    applied: :obj:`datetime`
+        When the migration was applied.
+    """
+
+    __tablename__ = TABLE_MIGRATIONS
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied = Column(DateTime, nullable=False)
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool that records the time to check out a connection in ``datastore.pool.wait``"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe("datastore.pool.wait", time.perf_counter() - start)
+
+
+class _TimedNullPool(NullPool):
+    """NullPool that records the time to open a connection in ``datastore.pool.wait``"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe("datastore.pool.wait", time.perf_counter() - start)
+
+
+POOL_MODES = {"queue": _TimedQueuePool, "null": _TimedNullPool}
+
+
 class DataStore:
     """DataStore is how GLaDOS stores async data.
 
+    The connection pool is set with the ``pool_*`` options in the ``datastore`` config
+    section. The default ``queue`` pool keeps up to ``pool_size`` connections open. Set
+    ``pool_size`` to at least the number of request threads in a server. The ``null`` pool
+    opens a connection for every session and closes it after. Use it on AWS Lambda, where
+    every container would otherwise hold idle connections, or behind an external pooler
+    like PgBouncer or RDS Proxy.
+
+    Examples
+    --------
+    .. code-block:: yaml
+
+        datastore:
+          enabled: yes
+          host: localhost
+          pool_mode: queue
+          pool_size: 10
+          max_overflow: 5
+          pool_timeout: 30
+          pool_recycle: 1800
+          pool_pre_ping: yes
+
+    The datastore reports these metrics:
+
+    - ``datastore.pool.wait``: time to check out a connection from the pool.
+    - ``datastore.pool.in_use``: connections checked out of the pool.
+    - ``datastore.pool.connections.new``: connections opened to postgres.
+
+    Set ``cache_size`` to keep up to that many interactions in an
+    :obj:`glados.cache.InteractionCache` in front of :meth:`find_by_id` and
+    :meth:`find_interaction_by_channel_ts`.
+
     Parameters
     ----------
     host
@@ -79,8 +265,35 @@ class DataStore:
         postgres port.
     database
         postgres database to use.
+    pool_mode
+        ``queue`` to keep a pool of connections or ``null`` to open a connection per session.
+    pool_size
+        connections kept open by the queue pool.
+    max_overflow
+        connections the queue pool opens over pool_size when they are all in use.
+    pool_timeout
+        seconds to wait for a connection from the queue pool before raising an error.
+    pool_recycle
+        seconds after which a connection is replaced. -1 to never replace connections.
+    pool_pre_ping
+        test connections when they are checked out and replace dead connections.
+    cache_size
+        max number of interactions to cache. 0 turns the cache off.
+    cache_ttl
+        how long to cache an interaction in seconds.
     """
 
+    OPTIONS = (
+        "pool_mode",
+        "pool_size",
+        "max_overflow",
+        "pool_timeout",
+        "pool_recycle",
+        "pool_pre_ping",
+        "cache_size",
+        "cache_ttl",
+    )
+
     def __init__(
         self,
         host: str,
@@ -88,6 +301,14 @@ class DataStore:
         password: str,
         port: int = 5432,
         database: str = "glados",
+        pool_mode: str = "queue",
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = False,
+        cache_size: int = 0,
+        cache_ttl: float = 60,
     ):
         self.host = host
         self.port = port
@@ -95,12 +316,95 @@ class DataStore:
         self.password = password
         self.database = database
 
+        pool_class = POOL_MODES.get(pool_mode)
+        if pool_class is None:
+            raise ValueError(
+                f"unknown datastore pool_mode: {pool_mode}. use one of {list(POOL_MODES)}"
+            )
+        pool_options = dict(poolclass=pool_class, pool_pre_ping=pool_pre_ping)
+        if pool_class is _TimedQueuePool:
+            pool_options.update(
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=pool_timeout,
+                pool_recycle=pool_recycle,
+            )
         self.db = create_engine(
-            f"postgres://{self.username}:{self.password}@{self.host}:{self.port}/"
-            f"{self.database}"
+            f"postgresql://{self.username}:{self.password}@{self.host}:{self.port}/"
+            f"{self.database}",
+            **pool_options,
         )
+        self._in_use = 0
+        self._in_use_lock = threading.Lock()
+        event.listen(self.db, "connect", self._on_connect)
+        event.listen(self.db, "checkout", self._on_checkout)
+        event.listen(self.db, "checkin", self._on_checkin)
         self.session_maker = sessionmaker(self.db)
 
+        self.cache = None  # type: Optional[InteractionCache]
+        if cache_size:
+            self.cache = InteractionCache(max_size=cache_size, ttl=cache_ttl)
+            event.listen(self.session_maker, "after_flush", self._invalidate_flushed)
+            event.listen(self.session_maker, "after_commit", self._invalidate_committed)
+
+    @classmethod
+    def from_config(cls, config: dict) -> "DataStore":
+        """Create a DataStore from the ``datastore`` section of the glados config."""
+        options = {k: v for k, v in config.items() if k in cls.OPTIONS}
+        return cls(
+            host=config.get("host"),
+            port=config.get("port", 5432),
+            username=config.get("username"),
+            password=config.get("password"),
+            database=config.get("database", "glados"),
+            **options,
+        )
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        metrics.incr("datastore.pool.connections.new")
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._in_use_lock:
+            self._in_use += 1
+            metrics.gauge("datastore.pool.in_use", self._in_use)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._in_use_lock:
+            self._in_use -= 1
+            metrics.gauge("datastore.pool.in_use", self._in_use)
+
+    def _invalidate_flushed(self, session: Session, flush_context) -> NoReturn:
+        """Drop the interactions changed by a flush from the cache."""
+        changed = session.info.setdefault("glados_changed_interactions", set())
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(instance, DataStoreInteraction):
+                changed.add(instance.interaction_id)
+                self.cache.invalidate(instance.interaction_id)
+
+    def _invalidate_committed(self, session: Session) -> NoReturn:
+        """Drop them again on commit, another session may have cached the old row."""
+        for interaction_id in session.info.pop("glados_changed_interactions", ()):
+            self.cache.invalidate(interaction_id)
+
+    def _cache_interaction(self, interaction: DataStoreInteraction) -> NoReturn:
+        values = {
+            attr.key: copy.deepcopy(getattr(interaction, attr.key))
+            for attr in inspect(DataStoreInteraction).column_attrs
+        }
+        self.cache.put(
+            interaction.interaction_id,
+            values,
+            channel=interaction.message_channel,
+            ts=interaction.slack_ts,
+        )
+
+    @staticmethod
+    def _from_cache(values: dict, session: Session) -> DataStoreInteraction:
+        """Add a cached interaction to the session without querying postgres."""
+        interaction = DataStoreInteraction(**copy.deepcopy(values))
+        make_transient_to_detached(interaction)
+        return session.merge(interaction, load=False)
+
     def create_session(self) -> Session:
         """Generate a new session with the existing connection."""
         return self.session_maker()
@@ -173,7 +477,13 @@ class DataStore:
         session
             session to be used
         """
+        if self.cache is not None:
+            values = self.cache.get(interaction_id)
+            if values is not None:
+                return self._from_cache(values, session)
         result = session.query(DataStoreInteraction).get(interaction_id)
+        if result is not None and self.cache is not None:
+            self._cache_interaction(result)
         return result
 
     def update_interaction(
@@ -190,13 +500,11 @@ class DataStore:
         kwargs
             fields and new values to update
         """
+        if self.cache is not None:
+            self.cache.invalidate(interaction_id)
         interaction = session.query(DataStoreInteraction).get(
             interaction_id
         )  # type: DataStoreInteraction
-        for k, v in kwargs.items():
-            if hasattr(interaction, k):
-                continue
-            kwargs.pop(k)
         interaction.update(**kwargs)
         return interaction
 
@@ -214,6 +522,8 @@ class DataStore:
         """
         session.add(interaction)
         session.commit()
+        if self.cache is not None:
+            self.cache.invalidate(interaction.interaction_id)
         return interaction
 
     def link_to_message_response(
@@ -233,17 +543,20 @@ class DataStore:
         ts_str = message_response.get("ts")
         if not ts_str:
             raise KeyError(f"ts missing from message body: {message_response}")
-        channel = message_response.get("channel", {}).get("id")
+        channel = message_response.get("channel")
+        if isinstance(channel, dict):
+            channel = channel.get("id")
         if not channel:
             raise KeyError(f"channel missing from message body: {message_response}")
-        ts = datetime.fromtimestamp(ts_str)
 
-        self.update_interaction(
-            interaction_id, session, message_channel=channel, message_ts=ts
-        )
+        self.link_to_message(interaction_id, channel, ts_str, session)
 
     def link_to_message(
-        self, interaction_id: str, channel: str, ts: datetime, session: "Session"
+        self,
+        interaction_id: str,
+        channel: str,
+        ts: Union[str, datetime],
+        session: "Session",
     ) -> NoReturn:
         """Link to message by setting message ts and channel.
 
@@ -254,19 +567,201 @@ class DataStore:
         channel
             channel to link interaction to
         ts
-            ts to link interaction to
+            ts to link interaction to. Pass the ts string from Slack so it is stored exactly.
         session
             session to be used
         """
+        slack_ts = to_slack_ts(ts)
         self.update_interaction(
-            interaction_id, session, message_channel=channel, message_ts=ts
+            interaction_id,
+            session,
+            message_channel=channel,
+            message_ts=datetime.fromtimestamp(float(slack_ts)),
+            slack_ts=slack_ts,
         )
 
+    def claim_dedup_key(self, key: str, ttl: int, session: Session) -> bool:
+        """Claim a dedup key. Only one caller can claim the key until it expires.
+
+        Parameters
+        ----------
+        key
+            the key to claim
+        ttl
+            how long the key is held for in seconds
+        session
+            session to be used
+
+        Returns
+        -------
+        bool
+            True if the key was claimed, False if the key is already claimed.
+        """
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=ttl)
+        query = (
+            insert(DataStoreDedupKey)
+            .values(key=key, expires=expires)
+            .on_conflict_do_update(
+                index_elements=[DataStoreDedupKey.key],
+                set_=dict(expires=expires),
+                where=DataStoreDedupKey.expires <= now,
+            )
+        )
+        result = session.execute(query)
+        session.commit()
+        return result.rowcount == 1
+
+    def release_dedup_key(self, key: str, session: Session) -> NoReturn:
+        """Release a claimed dedup key so it can be claimed again.
+
+        Parameters
+        ----------
+        key
+            the key to release
+        session
+            session to be used
+        """
+        session.query(DataStoreDedupKey).filter(DataStoreDedupKey.key == key).delete()
+        session.commit()
+
+    def purge_dedup_keys(self, session: Session) -> int:
+        """Delete all the expired dedup keys.
+
+        Parameters
+        ----------
+        session
+            session to be used
+
+        Returns
+        -------
+        int
+            the number of keys deleted
+        """
+        deleted = (
+            session.query(DataStoreDedupKey)
+            .filter(DataStoreDedupKey.expires <= datetime.utcnow())
+            .delete(synchronize_session=False)
+        )
+        session.commit()
+        return deleted
+
+    def claim_due_followups(
+        self, session: Session, now: datetime, limit: int = 100
+    ) -> List[DataStoreInteraction]:
+        """Lock a batch of interactions whose followup action is due.
+
+        The rows are locked with ``FOR UPDATE SKIP LOCKED`` so other nodes claiming at the
+        same time get a different batch. The rows stay locked until the session commits or
+        rolls back.
+
+        Parameters
+        ----------
+        session
+            session to be used
+        now
+            followups with a followup_ts before this are due
+        limit
+            max number of interactions to claim
+
+        Returns
+        -------
+        List[DataStoreInteraction]
+            the claimed interactions, oldest followup_ts first.
+        """
+        return (
+            session.query(DataStoreInteraction)
+            .filter(DataStoreInteraction.followed_up.is_(None))
+            .filter(DataStoreInteraction.followup_action.isnot(None))
+            .filter(DataStoreInteraction.followup_ts <= now)
+            .order_by(DataStoreInteraction.followup_ts)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+    def delete_expired_interactions(
+        self, session: Session, now: datetime, limit: int = 1000
+    ) -> int:
+        """Delete a batch of interactions whose ttl has expired.
+
+        The batch is picked with ``FOR UPDATE SKIP LOCKED`` so rows locked by a running
+        request or another sweeper are left for the next sweep. The session is committed
+        after the batch so the locks are only held for one batch.
+
+        Parameters
+        ----------
+        session
+            session to be used
+        now
+            interactions that expire before this are deleted
+        limit
+            max number of interactions to delete
+
+        Returns
+        -------
+        int
+            the number of interactions deleted
+        """
+        expired = (
+            select(DataStoreInteraction.interaction_id)
+            .where(
+                DataStoreInteraction.ttl.isnot(None),
+                DataStoreInteraction.expires <= now,
+            )
+            .order_by(DataStoreInteraction.expires)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        deleted = (
+            session.execute(
+                delete(DataStoreInteraction)
+                .where(
+                    DataStoreInteraction.interaction_id.in_(expired.scalar_subquery())
+                )
+                .returning(DataStoreInteraction.interaction_id)
+                .execution_options(synchronize_session=False)
+            )
+            .scalars()
+            .all()
+        )
+        session.commit()
+        if self.cache is not None:
+            for interaction_id in deleted:
+                self.cache.invalidate(interaction_id)
+        return len(deleted)
+
+    def find_cron_interactions(
+        self, session: Session, since: Optional[datetime] = None
+    ) -> List[DataStoreInteraction]:
+        """Find the interactions that have a cron_followup_action.
+
+        Parameters
+        ----------
+        session
+            session to be used
+        since
+            only find interactions inserted or updated after this ``updated_at``.
+
+        Returns
+        -------
+        List[DataStoreInteraction]
+            the interactions, least recently updated first.
+        """
+        query = session.query(DataStoreInteraction).filter(
+            DataStoreInteraction.cron_followup_action.isnot(None)
+        )
+        if since is not None:
+            query = query.filter(DataStoreInteraction.updated_at > since)
+        return query.order_by(DataStoreInteraction.updated_at).all()
+
     def find_interaction_by_channel_ts(
-        self, channel: str, ts: datetime, session: Session
+        self, channel: str, ts: Union[str, datetime], session: Session
     ) -> Optional[DataStoreInteraction]:
         """Find the interaction in the datastore by channel and message ts.
 
+        This is one lookup in the unique (message_channel, slack_ts) index.
+
         Parameters
         ----------
         channel
@@ -281,13 +776,20 @@ class DataStore:
         ReferenceError
             There were more than one interaction that matched the channel and message_ts
         """
+        slack_ts = to_slack_ts(ts)
+        if self.cache is not None:
+            values = self.cache.get_by_message(channel, slack_ts)
+            if values is not None:
+                return self._from_cache(values, session)
         query = (
             session.query(DataStoreInteraction)
-            .filter(DataStoreInteraction.message_ts == ts)
             .filter(DataStoreInteraction.message_channel == channel)
+            .filter(DataStoreInteraction.slack_ts == slack_ts)
         )  # type: Query
         try:
             result = query.one_or_none()
-            return result
         except MultipleResultsFound as e:
             raise ReferenceError(e)
+        if result is not None and self.cache is not None:
+            self._cache_interaction(result)
+        return result
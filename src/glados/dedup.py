@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import TYPE_CHECKING, NoReturn, Optional
+
+from .request import GladosRequest
+
+if TYPE_CHECKING:
+    from .datastore import DataStore
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_SIZE = 10000
+
+
+class DedupCache(ABC):
+    """Drop Slack Events that have already been received.
+
+    Slack re-sends an Event with a ``X-Slack-Retry-Num`` header when GLaDOS does not respond
+    in time. The first delivery of an ``event_id`` claims it, any retry of that event is
+    acked right away without running the plugin again.
+
+    Subclass this and implement :meth:`claim` and :meth:`release` to add a new backend.
+    """
+
+    @staticmethod
+    def key(request: GladosRequest) -> Optional[str]:
+        """Get the dedup key for the request.
+
+        Parameters
+        ----------
+        request
+            the Events request
+
+        Returns
+        -------
+        Optional[str]
+            ``<bot>:<event_id>`` or None if the request has no ``event_id``.
+        """
+        event_id = request.json.get("event_id")
+        if not event_id:
+            return None
+        return f"{request.bot_name}:{event_id}"
+
+    @abstractmethod
+    def claim(self, key: str) -> bool:
+        """Claim a key.
+
+        Parameters
+        ----------
+        key
+            the key to claim
+
+        Returns
+        -------
+        bool
+            True if this is the first time the key was claimed, False if the key is in flight
+            or already done.
+        """
+
+    @abstractmethod
+    def release(self, key: str) -> NoReturn:
+        """Release a claimed key so that it can be claimed again.
+
+        This is called when the plugin raises an error so that Slack can retry, including
+        when a deferred route fails after the event was acked.
+
+        Parameters
+        ----------
+        key
+            the key to release
+        """
+
+
+class MemoryDedupCache(DedupCache):
+    """In memory dedup cache with a max size and a TTL.
+
+    This only dedups retries that are sent to the same process. Use
+    :obj:`DataStoreDedupCache` when running more than one node.
+
+    Parameters
+    ----------
+    max_size
+        the max number of keys to keep. The oldest keys are dropped first.
+    ttl
+        how long to keep a key in seconds.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: int = DEFAULT_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._keys = OrderedDict()  # type: OrderedDict[str, float]
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            expires = self._keys.get(key)
+            if expires is not None and expires > now:
+                return False
+            self._keys[key] = now + self.ttl
+            self._keys.move_to_end(key)
+            # all keys have the same ttl so the oldest keys expire first.
+            while self._keys and (
+                len(self._keys) > self.max_size or next(iter(self._keys.values())) <= now
+            ):
+                self._keys.popitem(last=False)
+        return True
+
+    def release(self, key: str) -> NoReturn:
+        with self._lock:
+            self._keys.pop(key, None)
+
+
+class DataStoreDedupCache(DedupCache):
+    """Dedup cache backed by the GLaDOS datastore so retries are dropped across nodes.
+
+    Parameters
+    ----------
+    datastore
+        the datastore to use
+    ttl
+        how long to keep a key in seconds.
+    purge_every
+        delete expired keys after this many claims.
+    """
+
+    def __init__(
+        self, datastore: "DataStore", ttl: int = DEFAULT_TTL, purge_every: int = 1000
+    ):
+        self.datastore = datastore
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._claims = 0
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> bool:
+        session = self.datastore.create_session()
+        try:
+            claimed = self.datastore.claim_dedup_key(key, self.ttl, session)
+            with self._lock:
+                self._claims += 1
+                purge = self.purge_every and self._claims % self.purge_every == 0
+            if purge:
+                deleted = self.datastore.purge_dedup_keys(session)
+                logging.debug(f"purged {deleted} expired dedup keys")
+            return claimed
+        finally:
+            session.close()
+
+    def release(self, key: str) -> NoReturn:
+        session = self.datastore.create_session()
+        try:
+            self.datastore.release_dedup_key(key, session)
+        finally:
+            session.close()
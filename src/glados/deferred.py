@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, NoReturn, Set
+
+from .metrics import metrics
+from .request import GladosRequest
+
+
+class DeferredExecutor:
+    """Runs deferred routes on a bounded pool of worker threads.
+
+    The pool size and queue size are set with the ``deferred`` section of the glados config.
+
+    Async routes served by :meth:`glados.core.Glados.arequest` are run as tasks on the event
+    loop with :meth:`spawn`. They share the same queue limit.
+
+    Notes
+    -----
+    Background threads do not run after an AWS Lambda function returns. Do not use deferred
+    routes with Lambda.
+
+    The executor reports these metrics:
+
+    - ``deferred.queue_depth``: requests waiting for or running on a worker.
+    - ``deferred.queue_wait``: time a request waited for a worker.
+    - ``deferred.handler``: time the route took to run.
+    - ``deferred.rejected``: requests run inline because the queue was full.
+    - ``deferred.errors``: deferred routes that raised an error.
+
+    Parameters
+    ----------
+    max_workers
+        number of worker threads.
+    max_queue
+        max number of requests waiting or running. When the queue is full the request is
+        run inline instead.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 100):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="glados-deferred"
+        )
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._tasks = set()  # type: Set[asyncio.Task]
+
+    def _set_depth(self, change: int) -> NoReturn:
+        with self._lock:
+            self._depth += change
+            metrics.gauge("deferred.queue_depth", self._depth)
+
+    def submit(self, function: Callable, request: GladosRequest) -> bool:
+        """Run function(request) on a worker.
+
+        Parameters
+        ----------
+        function
+            the function to run
+        request
+            the request to pass to the function
+
+        Returns
+        -------
+        bool
+            False if the queue is full and the request was not queued.
+        """
+        if not self._slots.acquire(blocking=False):
+            metrics.incr("deferred.rejected")
+            return False
+        self._set_depth(1)
+        self._pool.submit(self._run, function, request, time.perf_counter())
+        return True
+
+    def _run(self, function: Callable, request: GladosRequest, queued: float):
+        metrics.observe("deferred.queue_wait", time.perf_counter() - queued)
+        try:
+            with metrics.timer("deferred.handler"):
+                function(request)
+        except Exception as e:
+            metrics.incr("deferred.errors")
+            logging.exception(f"error running deferred route {request.route}: {e}")
+        finally:
+            self._set_depth(-1)
+            self._slots.release()
+
+    def spawn(
+        self,
+        function: Callable[[GladosRequest], Awaitable],
+        request: GladosRequest,
+        loop: asyncio.AbstractEventLoop,
+    ) -> bool:
+        """Run the coroutine function(request) as a task on the event loop.
+
+        Parameters
+        ----------
+        function
+            the coroutine function to run
+        request
+            the request to pass to the function
+        loop
+            the event loop to run the task on
+
+        Returns
+        -------
+        bool
+            False if the queue is full and the request was not queued.
+        """
+        if not self._slots.acquire(blocking=False):
+            metrics.incr("deferred.rejected")
+            return False
+        self._set_depth(1)
+        task = loop.create_task(self._arun(function, request, time.perf_counter()))
+        # keep a reference so the task is not garbage collected while it runs
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _arun(
+        self,
+        function: Callable[[GladosRequest], Awaitable],
+        request: GladosRequest,
+        queued: float,
+    ):
+        metrics.observe("deferred.queue_wait", time.perf_counter() - queued)
+        try:
+            with metrics.timer("deferred.handler"):
+                await function(request)
+        except Exception as e:
+            metrics.incr("deferred.errors")
+            logging.exception(f"error running deferred route {request.route}: {e}")
+        finally:
+            self._set_depth(-1)
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True) -> NoReturn:
+        """Stop the workers.
+
+        Parameters
+        ----------
+        wait
+            wait for queued requests to finish.
+        """
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,127 @@
+import logging
+from typing import Iterable, Optional
+
+from .metrics import metrics
+from .request import GladosRequest
+
+BOT_MESSAGE_SUBTYPE = "bot_message"
+
+
+class EventFilter:
+    """Drop unwanted Slack Events before they are sent to a plugin.
+
+    This is set with the ``event_filter`` section of the bot config. Events that are
+    dropped are never signature checked or routed, GLaDOS returns an empty response
+    right away.
+
+    Examples
+    --------
+    .. code-block:: yaml
+
+        SecurityBot:
+          token: ...
+          signing_secret: ...
+          event_filter:
+            event_types: [message, app_home_opened]
+            ignore_subtypes: [message_changed, channel_join]
+            ignore_channels: [C0123456789]
+            ignore_bot_messages: yes
+            bot_user_id: U0123456789
+
+    Parameters
+    ----------
+    event_types
+        only allow these event types. If not set all event types are allowed.
+    ignore_event_types
+        drop these event types.
+    ignore_subtypes
+        drop events with these subtypes.
+    channels
+        only allow events from these channels. Events without a channel are allowed.
+    ignore_channels
+        drop events from these channels.
+    ignore_bot_messages
+        drop events that were sent by any bot.
+    bot_user_id
+        the user id of the bot. Events sent by this user are dropped.
+    """
+
+    def __init__(
+        self,
+        event_types: Optional[Iterable[str]] = None,
+        ignore_event_types: Optional[Iterable[str]] = None,
+        ignore_subtypes: Optional[Iterable[str]] = None,
+        channels: Optional[Iterable[str]] = None,
+        ignore_channels: Optional[Iterable[str]] = None,
+        ignore_bot_messages: bool = False,
+        bot_user_id: Optional[str] = None,
+        **kwargs,
+    ):
+        for key in kwargs:
+            logging.warning(f"unknown event_filter option: {key}")
+        self.event_types = frozenset(event_types) if event_types else None
+        self.ignore_event_types = frozenset(ignore_event_types or ())
+        self.ignore_subtypes = frozenset(ignore_subtypes or ())
+        self.channels = frozenset(channels) if channels else None
+        self.ignore_channels = frozenset(ignore_channels or ())
+        self.ignore_bot_messages = ignore_bot_messages
+        self.bot_user_id = bot_user_id
+
+    def check(self, event: dict) -> Optional[str]:
+        """Check an event against the filter.
+
+        Parameters
+        ----------
+        event
+            the ``event`` object of the Events payload
+
+        Returns
+        -------
+        Optional[str]
+            the reason the event should be dropped or None if the event is allowed.
+        """
+        event_type = event.get("type")
+        if self.event_types is not None and event_type not in self.event_types:
+            return "event_type"
+        if event_type in self.ignore_event_types:
+            return "event_type"
+        subtype = event.get("subtype")
+        if subtype in self.ignore_subtypes:
+            return "subtype"
+        if self.ignore_bot_messages and (
+            subtype == BOT_MESSAGE_SUBTYPE or event.get("bot_id")
+        ):
+            return "bot_message"
+        if self.bot_user_id and event.get("user") == self.bot_user_id:
+            return "self"
+        channel = event.get("channel")
+        if type(channel) is not str:
+            # some events (like channel_created) have a channel object
+            channel = None
+        if channel in self.ignore_channels:
+            return "channel"
+        if self.channels is not None and channel and channel not in self.channels:
+            return "channel"
+        return None
+
+    def allow(self, request: GladosRequest) -> bool:
+        """Returns True if the Events request should be sent to the plugin.
+
+        Dropped events are counted in ``events.filter.<bot>.dropped`` and
+        ``events.filter.<bot>.dropped.<reason>``.
+
+        Parameters
+        ----------
+        request
+            the Events request to check
+        """
+        event = request.json.get("event")
+        if event is None:
+            return True
+        reason = self.check(event)
+        if reason is None:
+            return True
+        logging.debug(f"dropping event for {request.bot_name}: {reason}")
+        metrics.incr(f"events.filter.{request.bot_name}.dropped")
+        metrics.incr(f"events.filter.{request.bot_name}.dropped.{reason}")
+        return False
@@ -0,0 +1,512 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, NoReturn, Optional, Tuple
+
+from .errors import GladosRouteNotFoundError
+from .http import run_coroutine
+from .metrics import metrics
+from .request import GladosRequest
+from .route_type import RouteType
+
+if TYPE_CHECKING:
+    from .core import Glados
+    from .datastore import DataStoreInteraction
+
+# how far back the cron scheduler reloads before the newest updated_at it has seen.
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+def run_callback(
+    glados: "Glados", interaction: "DataStoreInteraction", action: str, session
+) -> bool:
+    """Call the :obj:`RouteType.Callback` route for an interaction.
+
+    The route runs in a savepoint so that a failed route does not roll back the session.
+
+    Parameters
+    ----------
+    glados
+        the GLaDOS instance with the routes
+    interaction
+        the interaction to set on the request
+    action
+        the name of the callback route
+    session
+        the datastore session the interaction was loaded with
+
+    Returns
+    -------
+    bool
+        False if there is no route or the route raised an error.
+    """
+    request = GladosRequest(
+        RouteType.Callback, action, bot_name=interaction.bot, data=interaction.data
+    )
+    request._datastore = glados.datastore
+    request._session = session
+    request._interaction = interaction
+    savepoint = session.begin_nested()
+    try:
+        route = glados.router.match(request)
+        if route.is_async:
+            run_coroutine(route.handler(request))
+        else:
+            route.handler(request)
+        savepoint.commit()
+        return True
+    except GladosRouteNotFoundError:
+        savepoint.rollback()
+        logging.error(
+            f"no callback route for {action} interaction: {interaction.interaction_id}"
+        )
+    except Exception as e:
+        savepoint.rollback()
+        logging.exception(
+            f"error running callback {action} interaction: {interaction.interaction_id}: {e}"
+        )
+    return False
+
+
+class FollowupScheduler:
+    """Runs the ``followup_action`` of interactions when their ``followup_ts`` is due.
+
+    The followup action is the name of a :obj:`RouteType.Callback` route. The route gets a
+    request with the interaction set, ``request.interaction``, and the interaction data
+    as ``request.data``.
+
+    Due interactions are claimed in batches with ``FOR UPDATE SKIP LOCKED`` and
+    ``followed_up`` is stamped and committed before any route is called. Any number of
+    nodes and workers can run the scheduler at the same time without running a followup
+    twice, and no row locks are held while the routes call Slack. Each route's changes are
+    committed after it runs. Followups are run at most once: if a node dies after claiming a
+    batch, the followups it did not run yet are not run by another node. A followup that
+    raises an error is not retried.
+
+    This is set with the ``followups`` section of the glados config.
+
+    Examples
+    --------
+    .. code-block:: yaml
+
+        glados:
+          followups:
+            enabled: yes
+            batch_size: 100
+            poll_interval: 5
+            workers: 2
+
+    The scheduler reports these metrics:
+
+    - ``followups.done``: followups that ran.
+    - ``followups.errors``: followups that raised an error or have no route.
+    - ``followups.lag``: time between the followup_ts and the followup being claimed.
+    - ``followups.batch``: time to run a batch.
+
+    Parameters
+    ----------
+    glados
+        the GLaDOS instance with the datastore and routes
+    batch_size
+        max number of followups claimed at once.
+    poll_interval
+        seconds to wait between polls when there are no due followups.
+    workers
+        number of threads polling for followups.
+    """
+
+    def __init__(
+        self,
+        glados: "Glados",
+        batch_size: int = 100,
+        poll_interval: float = 5,
+        workers: int = 1,
+    ):
+        self.glados = glados
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self._stop = threading.Event()
+        self._threads = list()  # type: List[threading.Thread]
+
+    def run_once(self) -> int:
+        """Claim and run one batch of due followups.
+
+        Returns
+        -------
+        int
+            the number of followups that were run.
+        """
+        datastore = self.glados.datastore
+        session = datastore.create_session()
+        try:
+            with metrics.timer("followups.batch"):
+                now = datetime.now()
+                interactions = datastore.claim_due_followups(
+                    session, now, self.batch_size
+                )
+                # the claim is committed before the routes run, so another worker can not
+                # claim the batch again and the row locks are released.
+                for interaction in interactions:
+                    metrics.observe(
+                        "followups.lag", (now - interaction.followup_ts).total_seconds()
+                    )
+                    interaction.followed_up = now
+                session.commit()
+                for interaction in interactions:
+                    self._run_followup(interaction, session)
+            return len(interactions)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def run_pending(self) -> int:
+        """Run batches until there are no due followups. Use this from a scheduled job.
+
+        Returns
+        -------
+        int
+            the number of followups that were run.
+        """
+        total = 0
+        while not self._stop.is_set():
+            count = self.run_once()
+            total += count
+            if count < self.batch_size:
+                break
+        return total
+
+    def _run_followup(self, interaction: "DataStoreInteraction", session) -> NoReturn:
+        if run_callback(self.glados, interaction, interaction.followup_action, session):
+            metrics.incr("followups.done")
+        else:
+            metrics.incr("followups.errors")
+        # commit what the route changed so its locks are not held while the next one runs.
+        session.commit()
+
+    def _poll(self) -> NoReturn:
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logging.exception(f"error running followups: {e}")
+            self._stop.wait(self.poll_interval)
+
+    def start(self) -> NoReturn:
+        """Start the worker threads."""
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._poll, name=f"glados-followup-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, wait: bool = True) -> NoReturn:
+        """Stop the worker threads.
+
+        Parameters
+        ----------
+        wait
+            wait for the batches that are running to finish.
+        """
+        self._stop.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = list()
+
+
+class CronScheduler:
+    """Runs the ``cron_followup_action`` of interactions on a recurring schedule.
+
+    The next run time of every cron interaction is kept in a min-heap, so finding the
+    soonest job is cheap and the thread sleeps until it is due. Runs are at
+    ``ts + n * interval``, the next run is computed from the interaction so nothing has to
+    be stored when a job runs.
+
+    The heap is loaded from the datastore with :meth:`rebuild` when the scheduler starts.
+    After that :meth:`refresh` only loads the interactions inserted or updated since the
+    newest ``updated_at`` seen, so new interactions and changed intervals are picked up. A
+    job is checked against the datastore before it runs, so deleted interactions and
+    cleared actions are dropped from the heap.
+
+    Each run is claimed with a dedup key, so only one node runs it when the scheduler runs
+    on many nodes.
+
+    The interval is picked from, in order, ``cron_interval`` in the interaction data, the
+    ``intervals`` for the action and ``default_interval``.
+
+    This is set with the ``cron`` section of the glados config.
+
+    Examples
+    --------
+    .. code-block:: yaml
+
+        glados:
+          cron:
+            enabled: yes
+            default_interval: 300
+            refresh_interval: 60
+            intervals:
+              check_ticket: 3600
+
+    The scheduler reports these metrics:
+
+    - ``cron.runs``: cron actions that ran.
+    - ``cron.errors``: cron actions that raised an error or have no route.
+    - ``cron.skipped``: runs claimed by another node.
+    - ``cron.lag``: time between the scheduled run and the action running.
+
+    Parameters
+    ----------
+    glados
+        the GLaDOS instance with the datastore and routes
+    intervals
+        seconds between runs for each action.
+    default_interval
+        seconds between runs for actions not in intervals.
+    refresh_interval
+        seconds between loading new cron interactions from the datastore.
+    """
+
+    def __init__(
+        self,
+        glados: "Glados",
+        intervals: Optional[Dict[str, float]] = None,
+        default_interval: float = 300,
+        refresh_interval: float = 60,
+    ):
+        self.glados = glados
+        self.intervals = intervals or dict()
+        self.default_interval = default_interval
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        # (next run, seq, interaction_id)
+        self._heap = list()  # type: List[Tuple[datetime, int, str]]
+        self._entries = dict()  # type: Dict[str, datetime]
+        self._seq = itertools.count()
+        self._last_updated = None  # type: Optional[datetime]
+        self._next_refresh = 0.0
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def interval(self, interaction: "DataStoreInteraction") -> float:
+        """Get the seconds between runs for an interaction."""
+        data = interaction.data or dict()
+        interval = data.get("cron_interval")
+        if interval is None:
+            interval = self.intervals.get(
+                interaction.cron_followup_action, self.default_interval
+            )
+        return float(interval)
+
+    def next_run(
+        self, interaction: "DataStoreInteraction", after: datetime
+    ) -> datetime:
+        """Get the first run of an interaction after a time."""
+        interval = self.interval(interaction)
+        elapsed = (after - interaction.ts).total_seconds()
+        runs = max(int(elapsed // interval) + 1, 1)
+        return interaction.ts + timedelta(seconds=runs * interval)
+
+    def schedule(
+        self, interaction: "DataStoreInteraction", now: Optional[datetime] = None
+    ) -> NoReturn:
+        """Add an interaction to the schedule, or move it if it is already scheduled."""
+        if interaction.cron_followup_action is None:
+            return
+        next_run = self.next_run(interaction, now or datetime.now())
+        updated = interaction.updated_at
+        with self._lock:
+            self._push(interaction.interaction_id, next_run)
+            if updated is not None and (
+                self._last_updated is None or updated > self._last_updated
+            ):
+                self._last_updated = updated
+        self._wakeup.set()
+
+    def _push(self, interaction_id: str, next_run: datetime) -> NoReturn:
+        # entries that are moved stay in the heap and are skipped when they are popped.
+        self._entries[interaction_id] = next_run
+        heapq.heappush(self._heap, (next_run, next(self._seq), interaction_id))
+
+    def _load(self, since: Optional[datetime], now: Optional[datetime]) -> int:
+        datastore = self.glados.datastore
+        session = datastore.create_session()
+        try:
+            interactions = datastore.find_cron_interactions(session, since)
+        finally:
+            session.close()
+        now = now or datetime.now()
+        for interaction in interactions:
+            scheduled = self._entries.get(interaction.interaction_id)
+            if scheduled is not None and scheduled <= now:
+                # it is due, it is scheduled again when it runs.
+                continue
+            self.schedule(interaction, now)
+        self._next_refresh = time.monotonic() + self.refresh_interval
+        return len(interactions)
+
+    def rebuild(self, now: Optional[datetime] = None) -> int:
+        """Load all the cron interactions from the datastore into a new heap.
+
+        Parameters
+        ----------
+        now
+            schedule the runs after this. Defaults to now.
+
+        Returns
+        -------
+        int
+            the number of interactions loaded.
+        """
+        with self._lock:
+            self._heap = list()
+            self._entries = dict()
+            self._last_updated = None
+        return self._load(None, now)
+
+    def refresh(self, now: Optional[datetime] = None) -> int:
+        """Load the cron interactions inserted or updated since the last load.
+
+        The load goes back ``REFRESH_OVERLAP`` before the newest ``updated_at`` seen, a
+        transaction that commits late can have an older ``updated_at`` than rows that were
+        already loaded.
+
+        Parameters
+        ----------
+        now
+            schedule the runs after this. Defaults to now.
+
+        Returns
+        -------
+        int
+            the number of interactions loaded.
+        """
+        since = self._last_updated
+        if since is not None:
+            since -= REFRESH_OVERLAP
+        return self._load(since, now)
+
+    def next_due(self) -> Optional[datetime]:
+        """Get the time of the soonest run, None if nothing is scheduled."""
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self) -> NoReturn:
+        while self._heap:
+            next_run, _, interaction_id = self._heap[0]
+            if self._entries.get(interaction_id) == next_run:
+                return
+            heapq.heappop(self._heap)
+
+    def _pop_due(self, now: datetime) -> Optional[Tuple[datetime, str]]:
+        with self._lock:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return None
+            next_run, _, interaction_id = heapq.heappop(self._heap)
+            del self._entries[interaction_id]
+            return next_run, interaction_id
+
+    def run_due(self, now: Optional[datetime] = None) -> int:
+        """Run the cron actions that are due.
+
+        Parameters
+        ----------
+        now
+            run the actions scheduled before this. Defaults to now.
+
+        Returns
+        -------
+        int
+            the number of actions that were run on this node.
+        """
+        now = now or datetime.now()
+        count = 0
+        while not self._stop.is_set():
+            due = self._pop_due(now)
+            if due is None:
+                break
+            if self._run(due[1], due[0], now):
+                count += 1
+        return count
+
+    def _run(self, interaction_id: str, run_at: datetime, now: datetime) -> bool:
+        datastore = self.glados.datastore
+        session = datastore.create_session()
+        try:
+            interaction = datastore.find_by_id(interaction_id, session)
+            if interaction is None or interaction.cron_followup_action is None:
+                logging.debug(f"cron interaction {interaction_id} removed from schedule")
+                return False
+            interval = self.interval(interaction)
+            self.schedule(interaction, now)
+            key = f"cron:{interaction_id}:{int(run_at.timestamp())}"
+            if not datastore.claim_dedup_key(key, int(interval), session):
+                metrics.incr("cron.skipped")
+                return False
+            metrics.observe("cron.lag", (datetime.now() - run_at).total_seconds())
+            if run_callback(
+                self.glados, interaction, interaction.cron_followup_action, session
+            ):
+                metrics.incr("cron.runs")
+            else:
+                metrics.incr("cron.errors")
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            logging.exception(f"error running cron interaction {interaction_id}: {e}")
+            return False
+        finally:
+            session.close()
+
+    def _poll(self) -> NoReturn:
+        while not self._stop.is_set():
+            try:
+                if time.monotonic() >= self._next_refresh:
+                    self.refresh()
+                self.run_due()
+            except Exception as e:
+                logging.exception(f"error running cron actions: {e}")
+            timeout = self._next_refresh - time.monotonic()
+            next_due = self.next_due()
+            if next_due is not None:
+                timeout = min(timeout, (next_due - datetime.now()).total_seconds())
+            self._wakeup.wait(max(timeout, 0))
+            self._wakeup.clear()
+
+    def start(self) -> NoReturn:
+        """Load the schedule and start the scheduler thread."""
+        self._stop.clear()
+        self.rebuild()
+        self._thread = threading.Thread(
+            target=self._poll, name="glados-cron", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> NoReturn:
+        """Stop the scheduler thread.
+
+        Parameters
+        ----------
+        wait
+            wait for the actions that are running to finish.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._entries)
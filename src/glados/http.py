@@ -0,0 +1,369 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, NoReturn, Optional, Tuple, Union
+from weakref import WeakKeyDictionary, WeakSet
+
+import requests
+from requests.adapters import HTTPAdapter
+from slack import WebClient
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from . import codec
+from .metrics import metrics
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# total timeout in seconds for the aiohttp sessions. This is the slack WebClient default.
+SLACK_TIMEOUT = 30
+
+# (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (3.05, 10.0)
+
+_session = None  # type: Optional[requests.Session]
+_session_timeout = DEFAULT_TIMEOUT
+# retry settings, also used by apost.
+_retries = 3
+_backoff_factor = 0.3
+_session_lock = threading.Lock()
+
+# aiohttp sessions can only be used on the event loop they were made on.
+_async_sessions = WeakKeyDictionary()
+# event loop used by the sync slack clients, one per thread.
+_local = threading.local()
+# objects that cache slack clients, they are reset by reset_after_fork.
+_client_holders = WeakSet()
+
+
+def async_session():
+    """Returns the shared aiohttp session for the running event loop.
+
+    This must be called from a coroutine. The session encodes JSON with the GLaDOS codec.
+
+    Returns
+    -------
+    :obj:`aiohttp.ClientSession`
+    """
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        logging.debug("creating aiohttp session")
+        session = aiohttp.ClientSession(
+            json_serialize=codec.dumps,
+            timeout=aiohttp.ClientTimeout(total=SLACK_TIMEOUT),
+        )
+        _async_sessions[loop] = session
+    return session
+
+
+async def _async_session() -> Any:
+    return async_session()
+
+
+def thread_loop() -> asyncio.AbstractEventLoop:
+    """Returns the event loop used by the sync slack clients on this thread.
+
+    A new loop is made if there is none or it was closed, so a client made on an older
+    loop must be built again when this returns a different loop.
+    """
+    loop = getattr(_local, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _local.loop = loop
+    return loop
+
+
+def close_thread_loop() -> NoReturn:
+    """Close the event loop of the sync slack clients on this thread and its aiohttp session.
+
+    The loop and its connections are not closed when the thread ends, so call this when a
+    thread is done with :attr:`glados.GladosBot.client`. A new loop is made if the thread
+    uses a client again.
+    """
+    loop = getattr(_local, "loop", None)
+    _local.loop = None
+    if loop is None or loop.is_closed():
+        return
+    try:
+        loop.run_until_complete(close_async_session())
+    finally:
+        loop.close()
+
+
+def slack_client(token: str, run_async: bool = False) -> WebClient:
+    """Build a Slack client that uses the shared transport.
+
+    All the clients on an event loop share one aiohttp session, so every bot uses the same
+    connection pool and only the auth header is different. Sync clients use an event loop
+    per thread.
+
+    Parameters
+    ----------
+    token
+        the bot token
+    run_async
+        if True the client must be used from a coroutine and the API functions return
+        awaitables.
+
+    Returns
+    -------
+    WebClient
+    """
+    if run_async:
+        loop = asyncio.get_running_loop()
+        session = async_session()
+    else:
+        loop = thread_loop()
+        session = _async_sessions.get(loop)
+        if session is None or session.closed:
+            session = loop.run_until_complete(_async_session())
+    return WebClient(token=token, run_async=run_async, loop=loop, session=session)
+
+
+async def close_async_session():
+    """Close the shared aiohttp session for the running event loop."""
+    session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def run_coroutine(coroutine: Awaitable) -> Any:
+    """Run a coroutine to completion on a new event loop from sync code.
+
+    This is used to run async plugin routes from :meth:`Glados.request`.
+
+    Parameters
+    ----------
+    coroutine
+        the coroutine to run
+    """
+
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await close_async_session()
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        metrics.incr("http.connections.new")
+        return super()._new_conn()
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        metrics.incr("http.connections.new")
+        return super()._new_conn()
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter that counts the connections it opens in ``http.connections.new``"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+def setup_session(
+    pool_size: int = 10,
+    connect_timeout: float = DEFAULT_TIMEOUT[0],
+    read_timeout: float = DEFAULT_TIMEOUT[1],
+    retries: int = 3,
+    backoff_factor: float = 0.3,
+    **kwargs,
+) -> requests.Session:
+    """Set up the shared keep-alive session used to call Slack from sync code.
+
+    This is set with the ``http`` section in the glados config. The session is kept for the
+    life of the process so connections are reused between requests and between warm AWS
+    Lambda invocations.
+
+    Examples
+    --------
+    .. code-block:: yaml
+
+        glados:
+          http:
+            pool_size: 10
+            connect_timeout: 3.05
+            read_timeout: 10
+            retries: 3
+            backoff_factor: 0.3
+
+    Parameters
+    ----------
+    pool_size
+        max number of keep-alive connections per host.
+    connect_timeout
+        seconds to wait for a connection.
+    read_timeout
+        seconds to wait for the response.
+    retries
+        number of retries on a connection error or a 429 or 5xx response. A ``Retry-After``
+        header is respected. This is also used by :func:`apost`.
+    backoff_factor
+        the retry backoff, retries sleep ``backoff_factor * 2 ** (retry - 1)`` seconds.
+
+    Returns
+    -------
+    :obj:`requests.Session`
+    """
+    global _session, _session_timeout, _retries, _backoff_factor
+    for key in kwargs:
+        logging.warning(f"unknown http option: {key}")
+    new_session = _new_session(pool_size, retries, backoff_factor)
+    with _session_lock:
+        old_session, _session = _session, new_session
+        _session_timeout = (connect_timeout, read_timeout)
+        _retries, _backoff_factor = retries, backoff_factor
+    if old_session is not None:
+        old_session.close()
+    return new_session
+
+
+def _new_session(
+    pool_size: int = 10, retries: int = 3, backoff_factor: float = 0.3
+) -> requests.Session:
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=None,  # retry POST too, slack response_urls are idempotent
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = _CountingAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    new_session = requests.Session()
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+    return new_session
+
+
+def session() -> requests.Session:
+    """Returns the shared keep-alive session. It is set up with the defaults on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _new_session()
+    return _session
+
+
+def post(
+    url: str, timeout: Union[float, Tuple[float, float], None] = None, **kwargs
+) -> requests.Response:
+    """POST to a url with the shared session.
+
+    Requests are counted in ``http.requests`` and timed in ``http.request``. Compare
+    ``http.connections.new`` with ``http.requests`` to see how many connections are reused.
+
+    Parameters
+    ----------
+    url
+        the url to post to
+    timeout
+        the timeout for this request. Defaults to the session timeouts.
+    kwargs
+        passed to :meth:`requests.Session.post`
+
+    Returns
+    -------
+    :obj:`requests.Response`
+    """
+    metrics.incr("http.requests")
+    with metrics.timer("http.request"):
+        r = session().post(url, timeout=timeout or _session_timeout, **kwargs)
+    metrics.incr(f"http.status.{r.status_code}")
+    return r
+
+
+def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+    return _backoff_factor * 2 ** attempt
+
+
+async def apost(url: str, **kwargs) -> Any:
+    """Async version of :func:`post`. This must be called from a coroutine.
+
+    The request is sent with the shared aiohttp session for the running event loop. It is
+    retried like the sync session, on a connection error or a 429 or 5xx response, up to
+    ``retries`` times with the same backoff. See :func:`setup_session`. Retries are counted
+    in ``http.retries``.
+
+    Parameters
+    ----------
+    url
+        the url to post to
+    kwargs
+        passed to :meth:`aiohttp.ClientSession.post`
+
+    Returns
+    -------
+    :obj:`aiohttp.ClientResponse`
+        the last response. The body is read, so it can be used after it is returned.
+    """
+    import aiohttp
+
+    metrics.incr("http.requests")
+    attempt = 0
+    while True:
+        try:
+            with metrics.timer("http.request"):
+                async with async_session().post(url, **kwargs) as r:
+                    await r.read()
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt >= _retries:
+                raise
+            delay = _retry_delay(attempt)
+        else:
+            metrics.incr(f"http.status.{r.status}")
+            if r.status not in RETRY_STATUS_CODES or attempt >= _retries:
+                return r
+            delay = _retry_delay(attempt, r.headers.get("Retry-After"))
+        attempt += 1
+        metrics.incr("http.retries")
+        await asyncio.sleep(delay)
+
+
+def register_clients(holder: Any) -> NoReturn:
+    """Reset the slack clients cached by ``holder`` in :func:`reset_after_fork`.
+
+    Parameters
+    ----------
+    holder
+        an object with a ``reset_clients()`` method, like :obj:`glados.GladosBot`. It is
+        held with a weak reference.
+    """
+    _client_holders.add(holder)
+
+
+def reset_after_fork() -> NoReturn:
+    """Drop the sessions and slack clients inherited from the parent process.
+
+    Call this in a forked process so that it does not share connections with the parent.
+    """
+    global _session, _local
+    _session = None
+    _async_sessions.clear()
+    _local = threading.local()
+    for holder in list(_client_holders):
+        holder.reset_clients()
@@ -0,0 +1,114 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, NoReturn
+
+
+class Metrics:
+    """Process wide counters, gauges and timers for GLaDOS.
+
+    Metric names are dotted strings like ``events.filter.SecurityBot.dropped``.
+
+    Examples
+    --------
+    >>> m = Metrics()
+    >>> m.incr("requests")
+    >>> m.get("requests")
+    1
+    >>> with m.timer("handler"):
+    ...     pass
+    >>> m.snapshot()["timers"]["handler"]["count"]
+    1
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict()  # type: Dict[str, int]
+        self._gauges = dict()  # type: Dict[str, float]
+        self._timers = dict()  # type: Dict[str, List[float]] # [count, total, max]
+
+    def incr(self, name: str, value: int = 1) -> NoReturn:
+        """Increment a counter.
+
+        Parameters
+        ----------
+        name
+            name of the counter
+        value
+            value to add to the counter
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> NoReturn:
+        """Set a gauge to a value.
+
+        Parameters
+        ----------
+        name
+            name of the gauge
+        value
+            current value of the gauge
+        """
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> NoReturn:
+        """Record a duration.
+
+        Parameters
+        ----------
+        name
+            name of the timer
+        seconds
+            the duration to record
+        """
+        with self._lock:
+            timer = self._timers.setdefault(name, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """Record how long the with block takes.
+
+        Parameters
+        ----------
+        name
+            name of the timer
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get(self, name: str, default=0):
+        """Get the value of a counter or gauge."""
+        with self._lock:
+            if name in self._counters:
+                return self._counters[name]
+            return self._gauges.get(name, default)
+
+    def snapshot(self) -> dict:
+        """Returns a copy of all the metrics."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timers": {
+                    name: {"count": t[0], "total": t[1], "max": t[2]}
+                    for name, t in self._timers.items()
+                },
+            }
+
+    def reset(self) -> NoReturn:
+        """Reset all the metrics."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timers.clear()
+
+
+metrics = Metrics()
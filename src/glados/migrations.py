@@ -0,0 +1,498 @@
+import argparse
+import logging
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NoReturn, Optional, Union
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+
+from .datastore import DataStoreMigration
+from .errors import GladosError
+
+if TYPE_CHECKING:
+    from .datastore import DataStore
+
+# key of the postgres advisory lock held while migrating, so only one node migrates.
+LOCK_ID = 0x474C61444F53
+# seconds between tries to take the lock while another node migrates.
+LOCK_POLL_INTERVAL = 1.0
+
+# callable steps are called with the connection and the migration parameters.
+Step = Union[str, Callable[[Connection, Dict[str, Any]], None]]
+
+# work table of backfill_slack_ts, kept until the backfill is done so it can resume.
+SLACK_TS_BACKFILL = "slack_ts_backfill"
+
+
+class Migration:
+    """A versioned, forward only change to the datastore schema.
+
+    The steps are SQL strings or functions that are called with the connection and the
+    migration parameters. Migrations are frozen, they do not use the models, so they do the
+    same thing when the models change later.
+
+    A transactional migration runs all its steps and records its version in one
+    transaction. Statements that can not run in a transaction, like
+    ``CREATE INDEX CONCURRENTLY``, need ``transactional=False``. Each step then commits on
+    its own, so the steps must be safe to run again if the migration fails part way.
+
+    Parameters
+    ----------
+    version
+        the version of the migration. Migrations are applied in version order.
+    name
+        a short description of the migration.
+    steps
+        the SQL statements or functions to run.
+    transactional
+        run the migration in a transaction.
+    """
+
+    def __init__(
+        self, version: int, name: str, steps: List[Step], transactional: bool = True
+    ):
+        self.version = version
+        self.name = name
+        self.steps = steps
+        self.transactional = transactional
+
+    def upgrade(
+        self, conn: Connection, params: Optional[Dict[str, Any]] = None
+    ) -> NoReturn:
+        """Run the steps of the migration on a connection.
+
+        Parameters
+        ----------
+        conn
+            the connection to run the steps on
+        params
+            the migration parameters, passed to the steps that are functions.
+        """
+        params = params or dict()
+        for step in self.steps:
+            if callable(step):
+                step(conn, params)
+            else:
+                conn.execute(text(step))
+
+    def __repr__(self):
+        return f"<Migration {self.version} {self.name}>"
+
+
+def create_index_concurrently(name: str, definition: str, unique: bool = False) -> Step:
+    """Build an index without blocking writes to the table.
+
+    A concurrent index build that fails leaves an invalid index behind. That index is
+    dropped and built again when the migration is run again.
+
+    Parameters
+    ----------
+    name
+        the name of the index
+    definition
+        the rest of the ``CREATE INDEX`` statement, ``ON table (columns) ...``
+    unique
+        build a unique index.
+
+    Returns
+    -------
+    Step
+        a step for a migration with ``transactional=False``.
+    """
+    create = "CREATE UNIQUE INDEX" if unique else "CREATE INDEX"
+
+    def step(conn: Connection, params: Dict[str, Any]) -> NoReturn:
+        invalid = conn.execute(
+            text(
+                "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+                "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+            ),
+            dict(name=name),
+        ).first()
+        if invalid is not None:
+            logging.warning(f"dropping invalid index {name} left by a failed build")
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(f"{create} CONCURRENTLY IF NOT EXISTS {name} {definition}"))
+
+    return step
+
+
+def backfill(
+    table: str,
+    values: str,
+    where: str,
+    key: str = "interaction_id",
+    batch_size: int = 10000,
+) -> Step:
+    """Update the rows of a large table in batches.
+
+    Each batch commits on its own so the table is never locked by one long update. The
+    batches are taken in ``key`` order and each one starts after the last key of the batch
+    before it, so the table is read once. The ``where`` clause must not match a row once it
+    is updated, so the step is safe to run again.
+
+    Parameters
+    ----------
+    table
+        the table to update
+    values
+        the ``SET`` clause, ``column = expression, ...``
+    where
+        the rows that still need the update
+    key
+        the primary key of the table
+    batch_size
+        max number of rows updated in one batch
+
+    Returns
+    -------
+    Step
+        a step for a migration with ``transactional=False``.
+    """
+
+    def update(after: Optional[str]):
+        keyed = f"{key} > :after AND " if after is not None else ""
+        return text(
+            f"UPDATE {table} SET {values} WHERE {key} IN "
+            f"(SELECT {key} FROM {table} WHERE {keyed}({where}) "
+            f"ORDER BY {key} LIMIT :limit) RETURNING {key}"
+        )
+
+    def step(conn: Connection, params: Dict[str, Any]) -> NoReturn:
+        after = None
+        total = 0
+        while True:
+            keys = (
+                conn.execute(update(after), dict(after=after, limit=batch_size))
+                .scalars()
+                .all()
+            )
+            total += len(keys)
+            logging.info(f"backfilled {total} rows of {table}")
+            if len(keys) < batch_size:
+                return
+            after = max(str(k) for k in keys)
+
+    return step
+
+
+def backfill_slack_ts(batch_size: int = 10000) -> List[Step]:
+    """Set ``slack_ts`` on the interactions that were linked to a message before it existed.
+
+    ``message_ts`` was set with ``datetime.fromtimestamp`` of the Slack ts, so it is the
+    Slack ts in the timezone of the node that linked the message. That timezone must be
+    passed as the ``message_timezone`` migration parameter, a Postgres timezone name like
+    ``UTC`` or ``Europe/Berlin``. See :func:`migrate`. It is only needed when there are
+    interactions to backfill.
+
+    When more than one interaction is linked to a message only the newest one gets the
+    ``slack_ts``, so the unique index can be built. Interactions of a message that already
+    has one with a ``slack_ts`` are left as they are. They are picked in one pass into a
+    work table, then copied to the interactions with :func:`backfill`.
+
+    Parameters
+    ----------
+    batch_size
+        max number of rows updated in one batch
+
+    Returns
+    -------
+    List[Step]
+        steps for a migration with ``transactional=False``.
+    """
+
+    def pick(conn: Connection, params: Dict[str, Any]) -> NoReturn:
+        timezone = params.get("message_timezone")
+        conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {SLACK_TS_BACKFILL} AS "
+                "SELECT interaction_id, new_slack_ts AS slack_ts FROM ("
+                "SELECT interaction_id, "
+                "extract(epoch FROM message_ts AT TIME ZONE :timezone)"
+                "::numeric(16, 6)::text AS new_slack_ts, "
+                "row_number() OVER (PARTITION BY message_channel, message_ts "
+                "ORDER BY ts DESC NULLS LAST, interaction_id DESC) AS n, "
+                "count(slack_ts) OVER (PARTITION BY message_channel, message_ts) AS linked "
+                "FROM interactions "
+                "WHERE message_channel IS NOT NULL AND message_ts IS NOT NULL"
+                ") AS messages WHERE n = 1 AND linked = 0"
+            ),
+            dict(timezone=timezone or "UTC"),
+        )
+        if timezone is None:
+            pending = conn.execute(
+                text(f"SELECT 1 FROM {SLACK_TS_BACKFILL} LIMIT 1")
+            ).first()
+            if pending is not None:
+                conn.execute(text(f"DROP TABLE {SLACK_TS_BACKFILL}"))
+                raise GladosError(
+                    "the message_timezone migration parameter is needed to backfill "
+                    "slack_ts, set it to the timezone of the nodes that linked the messages"
+                )
+        conn.execute(
+            text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{SLACK_TS_BACKFILL} "
+                f"ON {SLACK_TS_BACKFILL} (interaction_id)"
+            )
+        )
+
+    return [
+        pick,
+        backfill(
+            "interactions",
+            f"slack_ts = (SELECT b.slack_ts FROM {SLACK_TS_BACKFILL} AS b "
+            "WHERE b.interaction_id = interactions.interaction_id)",
+            f"slack_ts IS NULL AND interaction_id IN "
+            f"(SELECT interaction_id FROM {SLACK_TS_BACKFILL})",
+            batch_size=batch_size,
+        ),
+        f"DROP TABLE IF EXISTS {SLACK_TS_BACKFILL}",
+    ]
+
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "index due followups",
+        [
+            create_index_concurrently(
+                "ix_interactions_followup_due",
+                "ON interactions (followup_ts) "
+                "WHERE followed_up IS NULL AND followup_action IS NOT NULL",
+            ),
+        ],
+        transactional=False,
+    ),
+    # an expression index, a stored expires column would rewrite the table.
+    Migration(
+        2,
+        "index interaction expiry",
+        [
+            create_index_concurrently(
+                "ix_interactions_expiry",
+                "ON interactions ((ts + ttl * interval '1 second')) "
+                "WHERE ttl IS NOT NULL",
+            )
+        ],
+        transactional=False,
+    ),
+    # tables made by create_table with older models have a stored expires column. Dropping
+    # a column does not rewrite the table, its index is dropped with it.
+    Migration(
+        3,
+        "drop the stored interactions.expires column",
+        ["ALTER TABLE interactions DROP COLUMN IF EXISTS expires"],
+    ),
+    Migration(
+        4,
+        "add interactions.slack_ts",
+        ["ALTER TABLE interactions ADD COLUMN IF NOT EXISTS slack_ts VARCHAR"],
+    ),
+    # slack_ts is backfilled before the index so a linked message is still found by it.
+    Migration(
+        5,
+        "unique index on message channel and slack_ts",
+        [
+            *backfill_slack_ts(),
+            create_index_concurrently(
+                "ux_interactions_message",
+                "ON interactions (message_channel, slack_ts)",
+                unique=True,
+            ),
+        ],
+        transactional=False,
+    ),
+    # the cron scheduler refreshes by updated_at, so it sees changed interactions too.
+    Migration(
+        6,
+        "add interactions.updated_at for the cron scheduler",
+        [
+            "ALTER TABLE interactions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+            backfill(
+                "interactions",
+                "updated_at = ts",
+                "updated_at IS NULL AND ts IS NOT NULL",
+            ),
+            create_index_concurrently(
+                "ix_interactions_cron_updated",
+                "ON interactions (updated_at) WHERE cron_followup_action IS NOT NULL",
+            ),
+            # tables made by create_table with older models have the ts index.
+            "DROP INDEX CONCURRENTLY IF EXISTS ix_interactions_cron",
+        ],
+        transactional=False,
+    ),
+]  # type: List[Migration]
+
+
+def applied_migrations(datastore: "DataStore") -> Dict[int, datetime]:
+    """Get the versions of the migrations applied to the datastore.
+
+    Returns
+    -------
+    Dict[int, datetime]
+        when each version was applied.
+    """
+    session = datastore.create_session()
+    try:
+        rows = session.query(DataStoreMigration.version, DataStoreMigration.applied)
+        return {version: applied for version, applied in rows}
+    finally:
+        session.close()
+
+
+def pending_migrations(
+    applied: Dict[int, datetime],
+    migrations: Optional[List[Migration]] = None,
+    target: Optional[int] = None,
+) -> List[Migration]:
+    """Get the migrations that are not applied yet, in version order.
+
+    Examples
+    --------
+    >>> pending_migrations({1: None, 3: None}, target=4)
+    [<Migration 2 index interaction expiry>, <Migration 4 add interactions.slack_ts>]
+
+    Parameters
+    ----------
+    applied
+        the versions that are applied
+    migrations
+        the known migrations. Defaults to :obj:`MIGRATIONS`.
+    target
+        only include migrations up to this version.
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    return sorted(
+        (
+            m
+            for m in migrations
+            if m.version not in applied and (target is None or m.version <= target)
+        ),
+        key=lambda m: m.version,
+    )
+
+
+def _apply(
+    datastore: "DataStore", migration: Migration, params: Dict[str, Any]
+) -> NoReturn:
+    record = DataStoreMigration.__table__.insert().values(
+        version=migration.version, name=migration.name, applied=datetime.utcnow()
+    )
+    if migration.transactional:
+        with datastore.db.begin() as conn:
+            migration.upgrade(conn, params)
+            conn.execute(record)
+    else:
+        with datastore.db.connect() as conn:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            migration.upgrade(conn, params)
+            conn.execute(record)
+
+
+def migrate(
+    datastore: "DataStore",
+    target: Optional[int] = None,
+    migrations: Optional[List[Migration]] = None,
+    params: Optional[Dict[str, Any]] = None,
+) -> List[Migration]:
+    """Apply the pending migrations to the datastore.
+
+    The tables must exist, see :meth:`glados.datastore.DataStore.create_table`. A postgres
+    advisory lock is held while migrating, so when many nodes start at once one node
+    migrates and the others wait for it. The waiting nodes poll for the lock instead of
+    blocking on it, a blocked statement keeps a snapshot open and a concurrent index build
+    of the migrating node would wait for it forever.
+
+    Parameters
+    ----------
+    datastore
+        the datastore to migrate
+    target
+        only apply migrations up to this version.
+    migrations
+        the known migrations. Defaults to :obj:`MIGRATIONS`.
+    params
+        parameters for the migrations that need them, like ``message_timezone`` for
+        :func:`backfill_slack_ts`. This is set with ``migration_params`` in the
+        ``datastore`` config.
+
+    Returns
+    -------
+    List[Migration]
+        the migrations that were applied.
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    with datastore.db.connect() as lock:
+        # no transaction is left open on the lock connection, a concurrent index build
+        # waits for every open transaction to finish.
+        lock = lock.execution_options(isolation_level="AUTOCOMMIT")
+        while not lock.execute(select(func.pg_try_advisory_lock(LOCK_ID))).scalar():
+            logging.info("waiting for another node to apply the migrations")
+            time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            applied = applied_migrations(datastore)
+            latest = max((m.version for m in migrations), default=0)
+            unknown = [v for v in applied if v > latest]
+            if unknown:
+                logging.warning(
+                    f"datastore has migrations newer than this version of glados: {unknown}"
+                )
+            pending = pending_migrations(applied, migrations, target)
+            for migration in pending:
+                logging.info(f"applying migration {migration.version}: {migration.name}")
+                start = time.perf_counter()
+                _apply(datastore, migration, params or dict())
+                logging.info(
+                    f"applied migration {migration.version} "
+                    f"in {time.perf_counter() - start:.1f}s"
+                )
+            return pending
+        finally:
+            lock.execute(select(func.pg_advisory_unlock(LOCK_ID)))
+
+
+parser = argparse.ArgumentParser(description="Apply the GLaDOS datastore migrations")
+parser.add_argument(
+    "configfile", type=str, help="GLaDOS config file with the datastore section"
+)
+parser.add_argument(
+    "--target", type=int, default=None, help="Only migrate up to this version"
+)
+parser.add_argument(
+    "--param",
+    action="append",
+    default=[],
+    metavar="NAME=VALUE",
+    help="Migration parameter, overrides migration_params in the datastore config",
+)
+parser.add_argument(
+    "--list",
+    action="store_true",
+    help="List the migrations and if they are applied, do not migrate",
+)
+
+
+def run():
+    from .configs import read_config
+    from .datastore import DataStore
+
+    args = parser.parse_args()
+    ds_config = read_config(args.configfile).config.datastore.to_dict()
+    params = dict(ds_config.get("migration_params") or dict())
+    params.update(param.split("=", 1) for param in args.param)
+    datastore = DataStore.from_config(ds_config)
+    datastore.create_table()
+    if args.list:
+        applied = applied_migrations(datastore)
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            status = applied.get(migration.version, "pending")
+            print(f"{migration.version:>4}  {status!s:<26}  {migration.name}")
+        return
+    applied = migrate(datastore, target=args.target, params=params)
+    print(f"applied {len(applied)} migrations")
+
+
+if __name__ == "__main__":
+    run()
@@ -1,23 +1,27 @@
 import glob
 import importlib
 import logging
+from functools import partial
 from pathlib import Path
 from typing import Any, Callable, Dict, List, NoReturn, Union
 
-import requests
 import yaml
 from slack.web.classes.messages import Message
 from slack.web.classes.objects import MarkdownTextObject, PlainTextObject, TextObject
 
+from . import codec, http
 from .bot import GladosBot
 from .errors import GladosBotNotFoundError, GladosError, GladosPathExistsError
 from .request import GladosRequest
-from .route_type import BOT_ROUTES, VERIFY_ROUTES, EventRoutes, RouteType
+from .route_type import VERIFY_ROUTES, EventRoutes, RouteType
 from .router import GladosRoute
 from .utils import PyJSON
 
 SLACK_MESSAGE_TYPES = [Message, MarkdownTextObject, TextObject, PlainTextObject]
 
+# response_url bodies are encoded with the GLaDOS codec, not the http library.
+JSON_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+
 
 class PluginBotConfig:
     def __init__(self, name="NOT SET"):
@@ -255,7 +259,13 @@ class GladosPlugin:
             ] = dict()  # type: Dict[str, GladosRoute]
 
     def add_route(
-        self, route_type: RouteType, route: Union[EventRoutes, str], function: Callable
+        self,
+        route_type: RouteType,
+        route: Union[EventRoutes, str],
+        function: Callable,
+        deferred: bool = False,
+        ack: Any = "",
+        preload_interaction: bool = False,
     ) -> NoReturn:
         """Add a new route to the plugin
 
@@ -264,15 +274,34 @@ class GladosPlugin:
         route_type
             what type of route this is this
         route
-            what is the route to be added
+            what is the route to be added. This can be a pattern where ``*`` matches any
+            characters and ``?`` matches one character, like ``approve:*``. Routes that are
+            not patterns are always matched before patterns.
         function
             the function to be executed when this route runs
+        deferred
+            respond with ``ack`` right away and run the function on a background worker. Use
+            this for slow routes so GLaDOS responds to Slack within 3 seconds. The return
+            value of the function is still sent to the ``response_url`` for Interactions.
+        ack
+            the response sent right away when the route is deferred.
+        preload_interaction
+            look up ``request.interaction`` before the function runs. By default the
+            datastore session and interaction are loaded when the function first uses them.
+            Set this for async functions that use the interaction, so the lookup runs in
+            the executor and not on the event loop.
         """
         if type(route) is EventRoutes:
             route = route.name
-        new_route = GladosRoute(route_type, route, function)
-        if route_type in BOT_ROUTES:
-            new_route.route = f"{self.bot.name}_{route}"
+        new_route = GladosRoute(
+            route_type,
+            route,
+            function,
+            bot_name=self.bot.name,
+            deferred=deferred,
+            ack=ack,
+            preload_interaction=preload_interaction,
+        )
         if new_route.route in self._routes[new_route.route_type.value]:
             raise GladosPathExistsError(
                 f"a route with the name of {new_route.route} already exists in the route type: {new_route.route_type.name}"
@@ -291,11 +320,39 @@ class GladosPlugin:
             the request object to be sent
         kwargs
         """
+        route = self._routes[request.route_type.value][request.route]
+        return self.call_route(route, request, **kwargs)
+
+    def bind_route(self, route: GladosRoute) -> Callable:
+        """Returns a handler for the route that only takes the request.
+
+        This is used by the router so that the route does not have to be looked up again.
+
+        Parameters
+        ----------
+        route
+            the route to bind
+        """
+        if route.is_async:
+            return partial(self.acall_route, route)
+        return partial(self.call_route, route)
+
+    def call_route(self, route: GladosRoute, request: GladosRequest, **kwargs) -> Any:
+        """Call the route function with the request.
+
+        See :meth:`send_request`
+
+        Parameters
+        ----------
+        route
+            the route to call
+        request
+            the request object to be sent
+        kwargs
+        """
         if request.route_type in VERIFY_ROUTES:
             self.bot.validate_slack_signature(request)
-        response = self._routes[request.route_type.value][request.route].function(
-            request, **kwargs
-        )
+        response = route.function(request, **kwargs)
         if response is None:
             # TODO(zpriddy): add logging.
             return ""
@@ -310,15 +367,64 @@ class GladosPlugin:
 
         return response
 
+    async def acall_route(
+        self, route: GladosRoute, request: GladosRequest, **kwargs
+    ) -> Any:
+        """Await an async route function with the request.
+
+        This is the same as :meth:`call_route` but the response_url is called without
+        blocking the event loop.
+
+        Parameters
+        ----------
+        route
+            the route to call
+        request
+            the request object to be sent
+        kwargs
+        """
+        if request.route_type in VERIFY_ROUTES:
+            self.bot.validate_slack_signature(request)
+        response = await route.function(request, **kwargs)
+        if response is None:
+            return ""
+
+        if request.route_type is RouteType.Interaction and request.response_url:
+            if type(response) is str:
+                await self.arespond_to_url(request, response)
+            if type(response) in SLACK_MESSAGE_TYPES:
+                response = response.to_dict()
+            if type(response) is dict:
+                await self.arespond_to_url(request, **response)
+
+        return response
+
     def respond_to_url(self, request: GladosRequest, text: str, **kwargs):
         """When you click on a link that was sent via slack it sends a callback, This is to handle that"""
         if not request.response_url:
             logging.error("no response_url provided in request.")
             return
         kwargs["text"] = text
-        r = requests.post(request.response_url, json=kwargs)
+        r = http.post(
+            request.response_url,
+            data=codec.dumps(kwargs).encode("utf-8"),
+            headers=JSON_HEADERS,
+        )
         logging.info(f"slack response: {r}")
 
+    async def arespond_to_url(self, request: GladosRequest, text: str, **kwargs):
+        """Async version of :meth:`respond_to_url`"""
+        if not request.response_url:
+            logging.error("no response_url provided in request.")
+            return
+        kwargs["text"] = text
+        r = await http.apost(
+            request.response_url,
+            data=codec.dumps(kwargs).encode("utf-8"),
+            headers=JSON_HEADERS,
+        )
+        logging.info(f"slack response: {r.status}")
+
     def has_route(self, route: str) -> bool:
         """See if route exists.
 
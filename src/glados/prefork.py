@@ -0,0 +1,305 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, NoReturn, Optional
+
+try:
+    from werkzeug.serving import BaseWSGIServer
+except ImportError:
+    raise ImportError(
+        "Flask is not installed, please install Flask or install glados extra 'servelocal'"
+    )
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server that handles requests on a fixed pool of threads.
+
+    Parameters
+    ----------
+    host
+        the host to serve on
+    port
+        the port to serve on
+    app
+        the WSGI app
+    threads
+        number of request threads
+    fd
+        serve on an already bound socket
+    """
+
+    def __init__(self, host, port, app, threads: int = 1, fd: Optional[int] = None):
+        super().__init__(host, port, app, fd=fd)
+        self.threads = threads
+        self._pool = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="glados-request"
+        )
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self) -> NoReturn:
+        """Wait for the requests that are running to finish. Call after serve_forever returns."""
+        self._pool.shutdown(wait=True)
+
+
+class PreforkServer:
+    """Serve a WSGI app from a pool of forked worker processes.
+
+    The app is loaded once in the parent before the workers are forked, so the workers
+    share the loaded bots and plugins copy-on-write. The parent must not start threads, a
+    lock held by a thread when a worker is forked stays locked in the worker. Background
+    jobs run in their own forked process, see ``start_jobs``.
+
+    Signals sent to the parent:
+
+    - ``SIGHUP``: graceful restart. ``unload`` is called, the app is loaded again and new
+      workers are started, the old workers finish the requests they are running and then
+      exit. The old jobs process is stopped before the new one starts.
+    - ``SIGTERM`` or ``SIGINT``: graceful stop.
+
+    Parameters
+    ----------
+    load
+        loads the app. This is called in the parent at start and on every restart.
+    host
+        the host to serve on
+    port
+        the port to serve on
+    workers
+        number of worker processes
+    threads
+        number of request threads per worker
+    graceful_timeout
+        seconds to wait for the workers to finish their requests before they are killed.
+    after_fork
+        called in each worker after it is forked. Use this to drop connections inherited
+        from the parent.
+    unload
+        called in the parent on a restart before the app is loaded again. Use this to close
+        the connections the old app holds in the parent.
+    start_jobs
+        starts the background jobs of the app. It is called in a forked process that does
+        not serve requests, after ``after_fork``. The process is started again if it exits.
+    stop_jobs
+        called in the jobs process when it is stopped.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[], Callable],
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        workers: int = 2,
+        threads: int = 1,
+        graceful_timeout: float = 30,
+        after_fork: Optional[Callable[[], None]] = None,
+        unload: Optional[Callable[[], None]] = None,
+        start_jobs: Optional[Callable[[], None]] = None,
+        stop_jobs: Optional[Callable[[], None]] = None,
+    ):
+        self.load = load
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.after_fork = after_fork
+        self.unload = unload
+        self.start_jobs = start_jobs
+        self.stop_jobs = stop_jobs
+        self.app = None
+        self.socket = None  # type: Optional[socket.socket]
+        self._workers = dict()  # type: Dict[int, int] # pid -> generation
+        self._jobs_pid = None  # type: Optional[int]
+        self._generation = 0
+        self._restart = False
+        self._stop = False
+
+    def run(self) -> NoReturn:
+        """Load the app, start the workers and watch them until the server is stopped."""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.socket.listen(128)
+        self.socket.set_inheritable(True)
+
+        self.app = self.load()
+        signal.signal(signal.SIGHUP, self._handle_restart)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        logging.info(
+            f"serving on {self.host}:{self.port} with {self.workers} workers "
+            f"and {self.threads} threads"
+        )
+        try:
+            while not self._stop:
+                if self._restart:
+                    self._restart = False
+                    self._reload()
+                self._reap()
+                self._spawn_workers()
+                time.sleep(0.5)
+        finally:
+            self._stop_workers(list(self._workers))
+            self._stop_jobs()
+            self.socket.close()
+
+    def _handle_restart(self, signum, frame):
+        self._restart = True
+
+    def _handle_stop(self, signum, frame):
+        self._stop = True
+
+    def _reload(self) -> NoReturn:
+        logging.info("restarting workers")
+        if self.unload is not None:
+            # the old app is stopped first so the old and new app never both run.
+            try:
+                self.unload()
+            except Exception as e:
+                logging.exception(f"error unloading the app: {e}")
+        try:
+            self.app = self.load()
+        except Exception as e:
+            # what unload stopped in the parent stays stopped until the next restart.
+            logging.exception(f"error reloading the app, keeping the old workers: {e}")
+            return
+        old_workers = list(self._workers)
+        self._generation += 1
+        # the old and the new jobs never run at the same time.
+        self._stop_jobs()
+        self._spawn_workers()
+        for pid in old_workers:
+            self._signal(pid, signal.SIGTERM)
+
+    def _spawn_workers(self) -> NoReturn:
+        current = [g for g in self._workers.values() if g == self._generation]
+        for _ in range(self.workers - len(current)):
+            pid = os.fork()
+            if pid == 0:
+                self._run_worker()
+            self._workers[pid] = self._generation
+            logging.debug(f"started worker {pid}")
+        if self.start_jobs is not None and self._jobs_pid is None:
+            pid = os.fork()
+            if pid == 0:
+                self._run_jobs()
+            self._jobs_pid = pid
+            logging.debug(f"started jobs process {pid}")
+
+    def _reap(self) -> NoReturn:
+        while self._workers or self._jobs_pid is not None:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._workers.clear()
+                self._jobs_pid = None
+                return
+            if pid == 0:
+                return
+            if pid == self._jobs_pid:
+                self._jobs_pid = None
+                if not self._stop:
+                    logging.warning(f"jobs process {pid} exited with status {status}")
+                continue
+            generation = self._workers.pop(pid, None)
+            if generation == self._generation and not self._stop:
+                logging.warning(f"worker {pid} exited with status {status}")
+
+    def _signal(self, pid: int, signum: int) -> NoReturn:
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            self._workers.pop(pid, None)
+
+    def _stop_workers(self, pids) -> NoReturn:
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._workers):
+            logging.warning(f"killing worker {pid}")
+            self._signal(pid, signal.SIGKILL)
+        self._reap()
+
+    def _stop_jobs(self) -> NoReturn:
+        pid = self._jobs_pid
+        if pid is None:
+            return
+        self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._jobs_pid == pid and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        if self._jobs_pid == pid:
+            logging.warning(f"killing jobs process {pid}")
+            self._signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self._jobs_pid = None
+
+    def _run_jobs(self) -> NoReturn:
+        """Run the background jobs in a forked process. This never returns."""
+        status = 0
+        stopping = []
+        try:
+            signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            if self.after_fork is not None:
+                self.after_fork()
+            self.start_jobs()
+            while not stopping:
+                time.sleep(0.5)
+            if self.stop_jobs is not None:
+                self.stop_jobs()
+        except Exception as e:
+            logging.exception(f"jobs process {os.getpid()} failed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _run_worker(self) -> NoReturn:
+        """Serve requests in a forked worker. This never returns."""
+        status = 0
+        try:
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            # the parent stops the workers
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            if self.after_fork is not None:
+                self.after_fork()
+            server = PooledWSGIServer(
+                self.host,
+                self.port,
+                self.app,
+                threads=self.threads,
+                fd=self.socket.fileno(),
+            )
+
+            def stop(signum, frame):
+                # shutdown waits for serve_forever so it must run on another thread.
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+            signal.signal(signal.SIGTERM, stop)
+            server.serve_forever()
+            server.drain()
+            server.server_close()
+        except Exception as e:
+            logging.exception(f"worker {os.getpid()} failed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
@@ -0,0 +1,359 @@
+import asyncio
+import logging
+import threading
+import time
+from itertools import count
+from typing import Awaitable, Callable, Dict, List, NoReturn, Optional, Tuple
+
+from slack.errors import SlackApiError
+from slack.web.slack_response import SlackResponse
+
+from .metrics import metrics
+
+# Slack Web API tiers in requests per minute.
+# https://api.slack.com/docs/rate-limits
+TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+
+# methods that are not in this map use DEFAULT_TIER
+METHOD_TIERS = {
+    "chat.update": 3,
+    "chat.delete": 3,
+    "chat.getPermalink": 4,
+    "chat.postEphemeral": 4,
+    "conversations.history": 3,
+    "conversations.info": 3,
+    "conversations.replies": 3,
+    "reactions.add": 3,
+    "users.info": 4,
+    "users.lookupByEmail": 3,
+    "views.open": 4,
+    "views.publish": 4,
+    "views.push": 4,
+    "views.update": 4,
+}
+DEFAULT_TIER = 3
+
+# chat.postMessage is limited to about 1 message per second per channel, with short
+# bursts allowed. There is a higher limit per workspace.
+POST_MESSAGE = "chat.postMessage"
+POST_MESSAGE_CHANNEL_RATE = 1.0
+POST_MESSAGE_CHANNEL_BURST = 3
+POST_MESSAGE_WORKSPACE_RATE = 300
+
+# drop idle buckets when there are more than this many.
+MAX_BUCKETS = 10000
+
+BucketKey = Tuple[str, str, Optional[str]]
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations instead of failing when it is empty.
+
+    Parameters
+    ----------
+    rate
+        tokens added per second.
+    capacity
+        max number of tokens. This is the burst size.
+    """
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated", "_blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Take a token.
+
+        Parameters
+        ----------
+        now
+            the current ``time.monotonic()``
+
+        Returns
+        -------
+        float
+            seconds to wait before the token can be used.
+        """
+        if now > self._updated:
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+        self._tokens -= 1
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return max(wait, self._blocked_until - now)
+
+    def block(self, until: float) -> NoReturn:
+        """Do not hand out tokens before ``until`` (a ``time.monotonic()`` value)."""
+        self._blocked_until = max(self._blocked_until, until)
+
+    def idle(self, now: float) -> bool:
+        """True if the bucket is full and not blocked."""
+        full = self._tokens + (now - self._updated) * self.rate >= self.capacity
+        return full and self._blocked_until <= now
+
+
+class RateLimiter:
+    """Schedules outbound Slack Web API calls so that they stay under the Slack rate limits.
+
+    There is one token bucket per bot (workspace) and method tier, and for
+    ``chat.postMessage`` one per channel. Calls over the limit wait for their turn instead
+    of failing. When Slack responds with HTTP 429 anyway the ``Retry-After`` header is used
+    to pause the buckets.
+
+    This is set with the ``rate_limit`` section of the glados config.
+
+    The rate limiter reports these metrics:
+
+    - ``ratelimit.queue_depth``: calls waiting for a token.
+    - ``ratelimit.throttle``: time calls waited for a token.
+    - ``ratelimit.<bot>.throttled``: calls that had to wait.
+    - ``ratelimit.<bot>.retry_after``: HTTP 429 responses from Slack.
+
+    Examples
+    --------
+    .. code-block:: yaml
+
+        glados:
+          rate_limit:
+            enabled: yes
+            max_retries: 3
+            channel_burst: 3
+            method_tiers:
+              conversations.history: 4
+
+    Parameters
+    ----------
+    enabled
+        if False calls are never delayed, 429 responses are still retried.
+    max_retries
+        how many times to retry a call after an HTTP 429.
+    method_tiers
+        override the Slack tier of a method.
+    channel_burst
+        number of ``chat.postMessage`` calls to a channel that are sent right away before
+        the calls are spaced one second apart.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_retries: int = 3,
+        method_tiers: Optional[Dict[str, int]] = None,
+        channel_burst: int = POST_MESSAGE_CHANNEL_BURST,
+    ):
+        self._lock = threading.Lock()
+        self._buckets = dict()  # type: Dict[BucketKey, TokenBucket]
+        self._waiting = 0
+        self.configure(enabled, max_retries, method_tiers, channel_burst)
+
+    def configure(
+        self,
+        enabled: bool = True,
+        max_retries: int = 3,
+        method_tiers: Optional[Dict[str, int]] = None,
+        channel_burst: int = POST_MESSAGE_CHANNEL_BURST,
+        **kwargs,
+    ) -> NoReturn:
+        """Change the rate limiter settings. See :obj:`RateLimiter`"""
+        for key in kwargs:
+            logging.warning(f"unknown rate_limit option: {key}")
+        with self._lock:
+            self.enabled = enabled
+            self.max_retries = max_retries
+            self.channel_burst = max(channel_burst, 1)
+            self.method_tiers = dict(METHOD_TIERS)
+            self.method_tiers.update(method_tiers or dict())
+            self._buckets.clear()
+
+    def _new_bucket(self, key: BucketKey) -> TokenBucket:
+        _, bucket_name, channel = key
+        if channel is not None:
+            return TokenBucket(POST_MESSAGE_CHANNEL_RATE, self.channel_burst)
+        if bucket_name == POST_MESSAGE:
+            per_minute = POST_MESSAGE_WORKSPACE_RATE
+        else:
+            per_minute = TIER_RATES[int(bucket_name[len("tier") :])]
+        return TokenBucket(per_minute / 60.0, per_minute)
+
+    def _bucket_keys(
+        self, bot_name: str, method: str, channel: Optional[str]
+    ) -> List[BucketKey]:
+        if method == POST_MESSAGE:
+            keys = [(bot_name, POST_MESSAGE, None)]
+            if channel:
+                keys.append((bot_name, POST_MESSAGE, channel))
+            return keys
+        tier = self.method_tiers.get(method, DEFAULT_TIER)
+        return [(bot_name, f"tier{tier}", None)]
+
+    def _prune(self, now: float) -> NoReturn:
+        for key in [k for k, b in self._buckets.items() if b.idle(now)]:
+            del self._buckets[key]
+
+    def reserve(self, bot_name: str, method: str, channel: Optional[str] = None) -> float:
+        """Reserve a call.
+
+        Parameters
+        ----------
+        bot_name
+            the bot making the call
+        method
+            the Slack method, like ``chat.postMessage``
+        channel
+            the channel the call is for
+
+        Returns
+        -------
+        float
+            seconds to wait before making the call.
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > MAX_BUCKETS:
+                self._prune(now)
+            delay = 0.0
+            for key in self._bucket_keys(bot_name, method, channel):
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = self._new_bucket(key)
+                delay = max(delay, bucket.reserve(now))
+        if delay > 0:
+            metrics.incr(f"ratelimit.{bot_name}.throttled")
+            metrics.observe("ratelimit.throttle", delay)
+        return delay
+
+    def _set_waiting(self, change: int) -> NoReturn:
+        with self._lock:
+            self._waiting += change
+            metrics.gauge("ratelimit.queue_depth", self._waiting)
+
+    def wait(self, bot_name: str, method: str, channel: Optional[str] = None) -> NoReturn:
+        """Block until the call can be made. See :meth:`reserve`"""
+        delay = self.reserve(bot_name, method, channel)
+        if delay > 0:
+            self._set_waiting(1)
+            try:
+                time.sleep(delay)
+            finally:
+                self._set_waiting(-1)
+
+    async def await_slot(
+        self, bot_name: str, method: str, channel: Optional[str] = None
+    ) -> NoReturn:
+        """Wait without blocking the event loop until the call can be made. See :meth:`reserve`"""
+        delay = self.reserve(bot_name, method, channel)
+        if delay > 0:
+            self._set_waiting(1)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._set_waiting(-1)
+
+    def retry_after(
+        self,
+        bot_name: str,
+        method: str,
+        seconds: float,
+        channel: Optional[str] = None,
+    ) -> NoReturn:
+        """Pause the buckets of a call after Slack responded with HTTP 429.
+
+        Parameters
+        ----------
+        bot_name
+            the bot that made the call
+        method
+            the Slack method
+        seconds
+            the ``Retry-After`` header value
+        channel
+            the channel the call was for
+        """
+        logging.warning(
+            f"slack rate limited {bot_name} {method}. retrying after {seconds} seconds"
+        )
+        metrics.incr(f"ratelimit.{bot_name}.retry_after")
+        until = time.monotonic() + seconds
+        with self._lock:
+            for key in self._bucket_keys(bot_name, method, channel):
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = self._new_bucket(key)
+                bucket.block(until)
+
+    def _retry_seconds(self, error: SlackApiError, attempt: int) -> Optional[float]:
+        """The seconds to wait before retrying or None if the error should be raised."""
+        response = error.response
+        if response is None or response.status_code != 429:
+            return None
+        if attempt >= self.max_retries:
+            return None
+        return float(response.headers.get("Retry-After", 1))
+
+    def call(
+        self,
+        bot_name: str,
+        method: str,
+        function: Callable[[], SlackResponse],
+        channel: Optional[str] = None,
+    ) -> SlackResponse:
+        """Call a Slack method when there is a token for it and retry it on HTTP 429.
+
+        Parameters
+        ----------
+        bot_name
+            the bot making the call
+        method
+            the Slack method, like ``chat.postMessage``
+        function
+            makes the call
+        channel
+            the channel the call is for
+
+        Returns
+        -------
+        SlackResponse
+            the response from function
+        """
+        for attempt in count():
+            self.wait(bot_name, method, channel)
+            try:
+                return function()
+            except SlackApiError as e:
+                seconds = self._retry_seconds(e, attempt)
+                if seconds is None:
+                    raise
+                self.retry_after(bot_name, method, seconds, channel)
+                if not self.enabled:
+                    time.sleep(seconds)
+
+    async def acall(
+        self,
+        bot_name: str,
+        method: str,
+        function: Callable[[], Awaitable[SlackResponse]],
+        channel: Optional[str] = None,
+    ) -> SlackResponse:
+        """Async version of :meth:`call`"""
+        for attempt in count():
+            await self.await_slot(bot_name, method, channel)
+            try:
+                return await function()
+            except SlackApiError as e:
+                seconds = self._retry_seconds(e, attempt)
+                if seconds is None:
+                    raise
+                self.retry_after(bot_name, method, seconds, channel)
+                if not self.enabled:
+                    await asyncio.sleep(seconds)
+
+
+rate_limiter = RateLimiter()
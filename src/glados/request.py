@@ -1,16 +1,53 @@
+import hashlib
+import hmac
 import json
 import logging
 from datetime import datetime
-from typing import TYPE_CHECKING, NoReturn, Optional, Union
+from typing import TYPE_CHECKING, Mapping, NoReturn, Optional, Tuple, Union
+from urllib.parse import parse_qsl
 
+from . import codec
 from .datastore import DataStore, DataStoreInteraction
 from .route_type import BOT_ROUTES, RouteType
-from .utils import PyJSON
+from .utils import LazyPyJSON
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
 
 
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+# raised by GladosRequest for a body that is not JSON or a form, or a payload that is
+# missing the fields of its route type. Servers respond with 400 for these.
+INVALID_BODY_ERRORS = (ValueError, AttributeError, IndexError)
+
+
+def decode_body(body: Union[bytes, str], content_type: Optional[str] = None) -> dict:
+    """Decode a raw request body into a dict.
+
+    Form encoded bodies are decoded into a dict of strings. If the form has a
+    ``payload`` field (Interactions and Menus) the payload is decoded as JSON
+    and returned instead. Any other body is decoded as JSON.
+
+    Parameters
+    ----------
+    body
+        the raw request body
+    content_type
+        the Content-Type header of the request
+    """
+    if not body:
+        return dict()
+    if content_type and content_type.startswith(FORM_CONTENT_TYPE):
+        if type(body) is bytes:
+            body = body.decode("utf-8")
+        form = dict(parse_qsl(body, keep_blank_values=True))
+        if "payload" in form:
+            return codec.loads(form["payload"])
+        return form
+    return codec.loads(body)
+
+
 class SlackVerification:
     """An object to hold slack verification data
 
@@ -24,11 +61,37 @@ class SlackVerification:
         The X-Slack-Signature from the headers of the request. This is used to verify the message is from slack.
     """
 
-    def __init__(self, data: str, timestamp: str = None, signature: str = None):
+    def __init__(
+        self, data: Union[bytes, str], timestamp: str = None, signature: str = None
+    ):
         self.data = data
         self.timestamp = timestamp
         self.signature = signature
 
+    def is_valid(self, signing_secret: str) -> bool:
+        """Check the signature of the request against the signing secret.
+
+        The raw body is fed to the HMAC as is, so the body is not copied to build
+        the base string.
+
+        Parameters
+        ----------
+        signing_secret
+            the signing secret of the bot the request was sent to
+        """
+        if not self.timestamp or not self.signature or not signing_secret:
+            return False
+        data = self.data
+        if type(data) is str:
+            data = data.encode("utf-8")
+        digest = hmac.new(
+            signing_secret.encode("utf-8"),
+            f"v0:{self.timestamp}:".encode("utf-8"),
+            hashlib.sha256,
+        )
+        digest.update(data)
+        return hmac.compare_digest(f"v0={digest.hexdigest()}", self.signature)
+
     @property
     def json(self) -> dict:
         """Returns the dict of the SlackVerification"""
@@ -56,6 +119,11 @@ class GladosRequest:
         the json paylod of the request
     data
         data to send with the request. This should be from a database
+    body
+        the raw request body. If ``json`` is not set the body is decoded using the
+        Content-Type header. The same buffer is used to verify the Slack signature.
+    headers
+        the headers of the request. Used with ``body``.
     kwargs
 
     Examples
@@ -78,13 +146,27 @@ class GladosRequest:
         bot_name: str = None,
         json: Union[str, dict] = None,
         data: dict = None,
+        body: Union[bytes, str] = None,
+        headers: Mapping[str, str] = None,
         **kwargs,
     ):
+        self.headers = {k.lower(): v for k, v in (headers or dict()).items()}
+        self.body = body
+
+        if body is not None:
+            if not json:
+                json = decode_body(body, self.headers.get("content-type"))
+            if not slack_verify:
+                slack_verify = SlackVerification(
+                    body,
+                    self.headers.get("x-slack-request-timestamp"),
+                    self.headers.get("x-slack-signature"),
+                )
 
         if not json:
             json = dict()
 
-        self.json = PyJSON(json)
+        self.json = LazyPyJSON(json)
         self.route_type = route_type
         self.bot_name = bot_name
         self._route = route
@@ -99,6 +181,7 @@ class GladosRequest:
             None
         )  # type: Optional[Session] # This is the datastore session for this request.
         self._interaction = None  #  type: Optional[DataStoreInteraction] # This is the interaction database object for this request.
+        self._interaction_loaded = False  # the interaction is looked up on first use.
         self.auto_link = False  # if this is true, then it will expect the response from the plugin to want to try to autolink to the interaction datastore.
 
         if route_type is RouteType.Interaction:
@@ -110,7 +193,9 @@ class GladosRequest:
         if route_type is RouteType.Interaction:
             self._route = self.json.actions[0].action_id
         if route_type is RouteType.Events:
-            self._route = self.json.event.type
+            event = self.json.get("event")
+            # url_verification requests do not have an event.
+            self._route = event.type if event else self.json.get("type")
 
         self.new_interaction = None
 
@@ -130,6 +215,16 @@ class GladosRequest:
     def route(self, value):
         self._route = value
 
+    @property
+    def key(self) -> Tuple[RouteType, Optional[str], str]:
+        """the dispatch key of the request: (route_type, bot_name, route)"""
+        route_type = self.route_type
+        return (
+            route_type,
+            self.bot_name if route_type in BOT_ROUTES else None,
+            self._route,
+        )
+
     def set_session(self, session: "Session") -> NoReturn:
         """Set the session for this request.
 
@@ -148,7 +243,10 @@ class GladosRequest:
             raise ConnectionError("request session is not active")
 
     def set_datastore(self, datastore: "DataStore") -> NoReturn:
-        """Set the Datastore and session for the request.
+        """Set the Datastore for the request.
+
+        The session is not opened until it is used, so routes that do not use the datastore
+        do not open a session.
 
         Parameters
         ----------
@@ -157,37 +255,45 @@ class GladosRequest:
 
         """
         self._datastore = datastore
-        self.set_session(self._datastore.create_session())
+
+    @property
+    def session(self) -> Optional["Session"]:
+        """The datastore session for the request. It is opened on first use.
+
+        Raises
+        ------
+        :obj:`ConnectionError`
+            If the session is not active raise a ConnectionError
+        """
+        if self._session is None and self._datastore is not None:
+            self.set_session(self._datastore.create_session())
+        return self._session
 
     def set_interaction_from_datastore(self) -> NoReturn:
         """Get the interaction object from the datastore."""
         # Get the interaction object from the datastore
         # see if there is channel and message ts in the payload.
-        if not self._session:
-            raise ConnectionError("session not set for request")
-
+        self._interaction_loaded = True
         container_payload = self.json.get("container")
         if not container_payload:
-            logging.warning(f"no container block in body: {self.json.to_dict()}")
+            logging.debug(f"no container block in body for request: {self.route}")
             self._interaction = None
-            return self.interaction
+            return
+
+        if self.session is None:
+            raise ConnectionError("session not set for request")
 
         channel = container_payload.get("channel_id")
         message_ts = container_payload.get("message_ts")
-        try:
-            massage_ts = datetime.fromtimestamp(float(message_ts))
-        except Exception as e:
-            logging.warning(f"error parsing message ts: {message_ts} : {e}")
-
         if None in [channel, message_ts]:
             logging.warning(
                 f"missing channel_id or message_ts in container: {container_payload}"
             )
             self._interaction = None
-            return self.interaction
+            return
 
         interaction = self._datastore.find_interaction_by_channel_ts(
-            channel, message_ts, self._session
+            channel, message_ts, self.session
         )
         self._interaction = interaction
 
@@ -208,9 +314,9 @@ class GladosRequest:
         if not self._datastore:
             logging.warning("datastore not set for request")
             return
-        if not self._session:
+        if self.session is None:
             raise ConnectionError("session not set for request")
-        return self._datastore.insert_interaction(interaction, self._session)
+        return self._datastore.insert_interaction(interaction, self.session)
 
     def link_interaction_to_message_response(
         self, interaction_id: str, message_response: dict
@@ -224,15 +330,15 @@ class GladosRequest:
         message_response
             JSON payload response from sending message on slack.
         """
-        if not self._session:
+        if self.session is None:
             raise ConnectionError("session not set for request")
 
         self._datastore.link_to_message_response(
-            interaction_id, message_response, self._session
+            interaction_id, message_response, self.session
         )
 
     def link_interaction_to_message(
-        self, interaction_id: str, channel: str, message_ts: datetime
+        self, interaction_id: str, channel: str, message_ts: Union[str, datetime]
     ) -> NoReturn:
         """Link interaction to message
 
@@ -243,31 +349,32 @@ class GladosRequest:
         channel
             channel to be linked to
         message_ts
-            ts to be linked to
+            ts to be linked to, the ts string from Slack.
 
         Returns
         -------
 
         """
-        if not self._session:
+        if self.session is None:
             raise ConnectionError("session not set for request")
         self._datastore.link_to_message(
-            interaction_id, channel, message_ts, self._session
+            interaction_id, channel, message_ts, self.session
         )
 
     def close_session(self) -> NoReturn:
-        """Close session for request"""
-        if not self._session or not self._session.is_active:
+        """Close session for request if it was opened"""
+        if self._session is not None:
             self._session.close()
+            self._session = None
 
     def rollback_session(self) -> NoReturn:
-        """Rollback the session."""
-        if self._session.is_active:
+        """Rollback the session if it was opened."""
+        if self._session is not None and self._session.is_active:
             self._session.rollback()
 
     def has_interaction(self) -> bool:
-        """Check if request has interaction.        """
-        return True if self._interaction else False
+        """Check if request has interaction. This looks up the interaction if needed."""
+        return self.interaction is not None
 
     def has_new_interaction(self) -> bool:
         """check if request has a new interaction object."""
@@ -324,15 +431,22 @@ class GladosRequest:
 
     @property
     def interaction(self) -> Optional[DataStoreInteraction]:
-        """Returns the interaction for the request"""
-        if not self.has_interaction():
-            return None
+        """Returns the interaction for the request. It is looked up on first use."""
+        if (
+            self._interaction is None
+            and not self._interaction_loaded
+            and self._datastore is not None
+        ):
+            try:
+                self.set_interaction_from_datastore()
+            except Exception as e:
+                logging.error(f"error retrieving interaction : {e} for request: {self}")
         return self._interaction
 
     @property
-    def data(self) -> PyJSON:
+    def data(self) -> LazyPyJSON:
         """Returns the data object of the request"""
-        return PyJSON(self._data)
+        return LazyPyJSON(self._data or dict())
 
     @property
     def data_blob(self) -> dict:
@@ -343,7 +457,7 @@ class GladosRequest:
     def data(self, value):
         if type(value) is str:
             try:
-                self._data = json.loads(value)
+                self._data = codec.loads(value)
             except json.JSONDecodeError:
                 logging.error(f"JSONDecodeError on string {value}")
             except Exception as e:
@@ -1,32 +1,215 @@
+import asyncio
 import logging
-from typing import Callable, Dict, NoReturn
+from itertools import count
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    NoReturn,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from .errors import GladosRouteNotFoundError
 from .request import GladosRequest
-from .route_type import RouteType
+from .route_type import BOT_ROUTES, RouteType
+
+# (route type, bot name, route name)
+RouteKey = Tuple[RouteType, Optional[str], str]
+
+# characters that make a route a pattern. ``*`` matches any characters and ``?`` matches one.
+PATTERN_CHARS = ("*", "?")
 
 
 class GladosRoute(object):
-    """Represents a single route"""
+    """Represents a single route
 
-    def __init__(self, route_type: RouteType, route: str, function: Callable):
+    Parameters
+    ----------
+    route_type
+        the type of route
+    route
+        the name of the route
+    function
+        the function to be executed when this route runs. This can be a coroutine function,
+        see :meth:`glados.core.Glados.arequest`.
+    bot_name
+        the name of the bot the route belongs to. For route types in ``BOT_ROUTES`` the
+        route is prefixed with the bot name.
+    deferred
+        if True GLaDOS responds with ``ack`` right away and runs the route in the background.
+    ack
+        the response sent right away for a deferred route.
+    preload_interaction
+        open the datastore session and look up the interaction before the route runs.
+    """
+
+    def __init__(
+        self,
+        route_type: RouteType,
+        route: str,
+        function: Callable,
+        bot_name: Optional[str] = None,
+        deferred: bool = False,
+        ack: Any = "",
+        preload_interaction: bool = False,
+    ):
         self.route_type = route_type
-        self.route = route
+        self.name = route
+        self.bot_name = bot_name if route_type in BOT_ROUTES else None
+        self.route = f"{self.bot_name}_{route}" if self.bot_name else route
         self.function = function
+        self.deferred = deferred
+        self.ack = ack
+        self.preload_interaction = preload_interaction
+        self.is_async = asyncio.iscoroutinefunction(function)
+        # set by the router to the plugin handler bound to this route
+        self.handler = None  # type: Optional[Callable]
+
+    @property
+    def key(self) -> RouteKey:
+        """The dispatch key of the route: (route_type, bot_name, route)"""
+        return self.route_type, self.bot_name, self.name
+
+    @property
+    def is_pattern(self) -> bool:
+        """True if the route name is a pattern like ``approve:*``"""
+        return any(c in self.name for c in PATTERN_CHARS)
 
     def __repr__(self):
         return f"<GladosRoute| route: {self.route} | route type: {self.route_type.name} | function: {self.function.__name__} >"
 
 
+class _TrieNode(object):
+    __slots__ = ("children", "any_char", "star", "loop", "value")
+
+    def __init__(self, loop: bool = False):
+        self.loop = loop  # a * node, it matches the next character by staying on itself.
+        self.children = dict()  # type: Dict[str, _TrieNode]
+        self.any_char = None  # type: Optional[_TrieNode]
+        self.star = None  # type: Optional[_TrieNode]
+        self.value = None  # type: Optional[Tuple[int, int, Any]]
+
+
+class RouteTrie(object):
+    """A trie of route patterns.
+
+    Patterns can use ``*`` to match any number of characters and ``?`` to match a single
+    character. Matching walks the trie one character at a time so prefix patterns like
+    ``approve:*`` are matched in O(length of the route).
+
+    If more than one pattern matches, the pattern with the most literal characters wins.
+    If that is a tie, the pattern that was added first wins.
+
+    Examples
+    --------
+    >>> trie = RouteTrie()
+    >>> trie.add("approve:*", "approve")
+    >>> trie.add("approve:admin-*", "admin")
+    >>> trie.match("approve:1234")
+    'approve'
+    >>> trie.match("approve:admin-1234")
+    'admin'
+    >>> trie.match("deny:1234") is None
+    True
+    """
+
+    def __init__(self):
+        self._root = _TrieNode()
+        self._order = count()
+
+    def add(self, pattern: str, value: Any) -> NoReturn:
+        """Add a pattern to the trie.
+
+        Parameters
+        ----------
+        pattern
+            the pattern to add
+        value
+            the value returned when the pattern matches
+        """
+        node = self._root
+        literals = 0
+        for c in pattern:
+            if c == "*":
+                if node.star is None:
+                    node.star = _TrieNode(loop=True)
+                node = node.star
+            elif c == "?":
+                if node.any_char is None:
+                    node.any_char = _TrieNode()
+                node = node.any_char
+            else:
+                literals += 1
+                node = node.children.setdefault(c, _TrieNode())
+        node.value = (literals, -next(self._order), value)
+
+    @staticmethod
+    def _expand(nodes: Set[_TrieNode]) -> Set[_TrieNode]:
+        # a * can match zero characters, so the node after it is also active.
+        pending = [node.star for node in nodes if node.star is not None]
+        while pending:
+            star = pending.pop()
+            if star not in nodes:
+                nodes.add(star)
+                if star.star is not None:
+                    pending.append(star.star)
+        return nodes
+
+    def match(self, route: str) -> Any:
+        """Find the value of the best pattern matching the route.
+
+        Parameters
+        ----------
+        route
+            the route to match
+
+        Returns
+        -------
+            the value of the best matching pattern or None if no pattern matches.
+        """
+        # the active nodes are a set, nodes hash by identity.
+        nodes = self._expand({self._root})
+        for c in route:
+            next_nodes = set()  # type: Set[_TrieNode]
+            for node in nodes:
+                child = node.children.get(c)
+                if child is not None:
+                    next_nodes.add(child)
+                if node.any_char is not None:
+                    next_nodes.add(node.any_char)
+                if node.loop:
+                    next_nodes.add(node)
+            if not next_nodes:
+                return None
+            nodes = self._expand(next_nodes)
+        best = max((n.value for n in nodes if n.value is not None), default=None)
+        return best[2] if best else None
+
+
 class GladosRouter(object):
     """GladosRouter"""
 
     def __init__(self, **kwargs):
-        # routes are stored as: {RouteType.SendMessage: {"ask_user",ask_user, "confirm":confirm}}
+        # route handlers by route type and name: {RouteType.Slash.value: {"bot_ask": handler}}
         self.routes = dict()  # type: Dict[RouteType, Dict[str, Callable]]
         for route in RouteType._member_names_:
             self.routes[RouteType[route].value] = dict()  # type: Dict[str, Callable]
 
+        # routes with a bound handler, keyed by GladosRoute.key
+        self._handlers = dict()  # type: Dict[RouteKey, GladosRoute]
+        # pattern routes, keyed by (route_type, bot_name)
+        self._pattern_handlers = (
+            dict()
+        )  # type: Dict[Tuple[RouteType, Optional[str]], List[GladosRoute]]
+        # frozen copy of the routes used for dispatch. This is rebuilt when routes change.
+        self._dispatch = None  # type: Optional[Mapping[RouteKey, GladosRoute]]
+        self._patterns = dict()  # type: Dict[Tuple[RouteType, Optional[str]], RouteTrie]
+
     def add_route(self, plugin, route: GladosRoute) -> NoReturn:
         """Add a route to the router
 
@@ -48,7 +231,15 @@ class GladosRouter(object):
             raise KeyError(
                 f"a route with the name of {route.route} already exists in the route type: {route.route_type.name}"
             )
-        self.routes[route.route_type.value][route.route] = plugin.send_request
+        route.handler = plugin.bind_route(route)
+        self.routes[route.route_type.value][route.route] = route.handler
+        if route.is_pattern:
+            self._pattern_handlers.setdefault(
+                (route.route_type, route.bot_name), list()
+            ).append(route)
+        else:
+            self._handlers[route.key] = route
+        self._dispatch = None
 
     def add_routes(self, plugin) -> NoReturn:
         """Add multiple routes to the router.
@@ -62,6 +253,28 @@ class GladosRouter(object):
         for route in plugin.routes:
             self.add_route(plugin, route)
 
+    def freeze(self) -> Mapping[RouteKey, GladosRoute]:
+        """Build the dispatch table from all the routes that have been added.
+
+        This is called automatically on the first request after routes are added.
+        Pattern routes are compiled into one :obj:`RouteTrie` per route type and bot.
+
+        Returns
+        -------
+        Mapping
+            read only mapping of (route_type, bot_name, route) to the route
+        """
+        patterns = dict()
+        for trie_key, routes in self._pattern_handlers.items():
+            trie = RouteTrie()
+            for route in routes:
+                trie.add(route.name, route)
+            patterns[trie_key] = trie
+        self._patterns = patterns
+        self._dispatch = MappingProxyType(dict(self._handlers))
+        logging.debug(f"router frozen with {len(self._dispatch)} routes")
+        return self._dispatch
+
     def get_route(self, route_type: RouteType, route: str) -> Callable:
         """Get a GladosRoute object for the requested route.
 
@@ -101,6 +314,35 @@ class GladosRouter(object):
         """
         return self.get_route(route_type, route)
 
+    def match(self, request: GladosRequest) -> GladosRoute:
+        """Find the route for a request.
+
+        Exact routes are looked up first, then pattern routes.
+
+        Parameters
+        ----------
+        request
+            the GLaDOS request
+
+        Raises
+        ------
+        GladosRouteNotFoundError
+            there is no route for the request
+        """
+        dispatch = self._dispatch
+        if dispatch is None:
+            dispatch = self.freeze()
+        key = request.key
+        route = dispatch.get(key)
+        if route is None:
+            trie = self._patterns.get(key[:2])
+            route = trie.match(key[2]) if trie and key[2] else None
+        if route is None:
+            raise GladosRouteNotFoundError(
+                f"no route with the name of {request.route} exists in route type: {request.route_type.name}"
+            )
+        return route
+
     def exec_route(self, request: GladosRequest):
         """Execute a route function directly
 
@@ -138,5 +380,6 @@ class GladosRouter(object):
         >>> print(successful)
         False
         """
-        logging.debug(f"calling route function for {request.route}")
-        return self.route_function(request.route_type, request.route)(request)
+        route = self.match(request)
+        logging.debug("calling route function for %s", route.key)
+        return route.handler(request)
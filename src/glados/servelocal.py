@@ -4,18 +4,19 @@ Serves a local Flask application for GLaDOS bots/plugins
 """
 
 import argparse
-import json
 import logging
+import os
 
+from . import http
 from .configs import read_config
 from .core import Glados
 from .errors import GladosRouteNotFoundError
-from .request import GladosRequest, SlackVerification
+from .request import INVALID_BODY_ERRORS, GladosRequest
 from .route_type import RouteType
 from .router import GladosRoute
 
 try:
-    from flask import Flask, request
+    from flask import Flask, abort, request
 except ImportError:
     raise ImportError(
         "Flask is not installed, please install Flask or install glados extra 'servelocal'"
@@ -25,18 +26,35 @@ app = Flask(__name__)
 glados = None
 
 
-def extract_slack_info(r: request):
-    try:
-        data = r.get_data(as_text=True)
-        timestamp = r.headers.get("X-Slack-Request-Timestamp")
-        signature = r.headers.get("X-Slack-Signature")
-
-        return SlackVerification(data, timestamp, signature)
-    except Exception as e:
-        # If it makes it here, the request probably isn't from Slack.
-        logging.error(e)
+def build_request(route_type: RouteType, route: str = None, bot: str = None):
+    """Build a GladosRequest from the raw body and headers of the flask request.
 
-        return None
+    Responds with 400 if the body can not be decoded.
+    """
+    try:
+        return GladosRequest(
+            route_type,
+            route,
+            bot_name=bot,
+            body=request.get_data(),
+            headers=request.headers,
+        )
+    except INVALID_BODY_ERRORS as e:
+        logging.warning(f"invalid request body for {request.path}: {e!r}")
+        abort(400)
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """Health check for load balancers and the prefork server."""
+    if glados is None:
+        return {"status": "starting"}, 503
+    return {
+        "status": "ok",
+        "pid": os.getpid(),
+        "bots": len(glados.bots),
+        "plugins": len(glados.plugins),
+    }
 
 
 @app.route("/SendMessage/<bot>/<route>", methods=["POST"])
@@ -50,19 +68,10 @@ def send_message_route(bot, route):
 
 @app.route("/Events/<bot>", methods=["POST"])
 def event_subscriptions(bot):
-    body = request.json
-    event_type = body.get("type", "")
-
-    if event_type == "url_verification":
-        return body.get("challenge")
-
-    # Build GladosRequest
-    r = GladosRequest(
-        RouteType.Events,
-        slack_verify=extract_slack_info(request),
-        bot_name=bot,
-        json=request.get_json(),
-    )
+    r = build_request(RouteType.Events, bot=bot)
+
+    if r.json.get("type") == "url_verification":
+        return r.json.get("challenge")
     try:
         return glados.request(r)
     except KeyError:
@@ -71,23 +80,14 @@ def event_subscriptions(bot):
 
 @app.route("/Slash/<bot>/<route>", methods=["POST"])
 def slash_command(bot, route):
-    slack_info = extract_slack_info(request)
-    request_json = request.form.to_dict()
-    r = GladosRequest(
-        RouteType.Slash, route, slack_info, bot_name=bot, json=request_json
-    )
+    r = build_request(RouteType.Slash, route, bot)
 
     return glados.request(r)
 
 
 @app.route("/Interaction/<bot>", methods=["POST"])
 def interaction(bot):
-    slack_info = extract_slack_info(request)
-    request_json = request.form.to_dict()
-    request_json = json.loads(request_json.get("payload"))
-    r = GladosRequest(
-        RouteType.Interaction, slack_verify=slack_info, bot_name=bot, json=request_json
-    )
+    r = build_request(RouteType.Interaction, bot=bot)
     try:
         return glados.request(r)
     except GladosRouteNotFoundError as e:
@@ -98,10 +98,7 @@ def interaction(bot):
 
 @app.route("/Menu", methods=["POST"])
 def external_menu():
-    slack_info = extract_slack_info(request)
-    request_json = request.form.to_dict()
-    request_json = json.loads(request_json.get("payload"))
-    r = GladosRequest(RouteType.Menu, slack_verify=slack_info, json=request_json)
+    r = build_request(RouteType.Menu)
 
     return glados.request(r)
 
@@ -114,6 +111,59 @@ parser.add_argument(
     type=str,
     help="Use the provided configfile for starting the server/GLaDOS bots",
 )
+parser.add_argument(
+    "--workers",
+    type=int,
+    default=None,
+    help="Serve with this many pre-forked worker processes instead of the Flask development server",
+)
+parser.add_argument(
+    "--threads",
+    type=int,
+    default=1,
+    help="Number of request threads per worker",
+)
+parser.add_argument(
+    "--graceful-timeout",
+    type=float,
+    default=30,
+    help="Seconds to wait for workers to finish their requests on restart or stop",
+)
+
+
+def load_glados(configfile: str, autostart_jobs: bool = True) -> Glados:
+    """Load GLaDOS, the bots and the plugins from the config file.
+
+    Set ``autostart_jobs`` to False to load without starting the background job threads,
+    like in the parent of the prefork server. See :meth:`Glados.start_jobs`
+    """
+    g = Glados(configfile, autostart_jobs=autostart_jobs)
+    g.read_config()
+    return g
+
+
+def after_fork():
+    """Drop the connections the worker inherited from the parent."""
+    http.reset_after_fork()
+    if glados.has_datastore():
+        # close=False leaves the parent's connections open, the worker only forgets them.
+        glados.datastore.db.dispose(close=False)
+
+
+def unload():
+    """Close the connections GLaDOS holds in the parent before a restart."""
+    if glados is not None:
+        glados.stop()
+
+
+def start_jobs():
+    """Start the followup, cron and ttl sweeper threads in the prefork jobs process."""
+    glados.start_jobs()
+
+
+def stop_jobs():
+    """Stop the background jobs when the prefork jobs process is stopped."""
+    glados.stop()
 
 
 def run():
@@ -125,11 +175,34 @@ def run():
     config = read_config(configfile)
 
     server_config = config.config.server
-    glados = Glados(config.config_file)
-    glados.read_config()
-
     app.secret_key = server_config.secret_key
-    app.run(server_config.host, server_config.port, debug=server_config.debug)
+
+    if args.workers is None:
+        glados = load_glados(config.config_file)
+        app.run(server_config.host, server_config.port, debug=server_config.debug)
+        return
+
+    from .prefork import PreforkServer
+
+    def load():
+        global glados
+        # the parent forks the workers, so it must not run threads.
+        glados = load_glados(config.config_file, autostart_jobs=False)
+        return app
+
+    server = PreforkServer(
+        load,
+        host=server_config.host,
+        port=server_config.port,
+        workers=args.workers,
+        threads=args.threads,
+        graceful_timeout=args.graceful_timeout,
+        after_fork=after_fork,
+        unload=unload,
+        start_jobs=start_jobs,
+        stop_jobs=stop_jobs,
+    )
+    server.run()
 
 
 if __name__ == "__main__":
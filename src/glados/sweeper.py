@@ -0,0 +1,131 @@
+import logging
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, NoReturn, Optional
+
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from .core import Glados
+
+
+class TTLSweeper:
+    """Deletes interactions from the datastore when their ``ttl`` has expired.
+
+    An interaction expires at ``ts + ttl``. Interactions without a ttl are never deleted.
+    Expired interactions are deleted in batches of ``batch_size`` and each batch is its own
+    transaction, so a sweep never holds locks on more than one batch of rows. Rows that are
+    locked, like an interaction being updated by a request, are skipped until the next
+    sweep.
+
+    This is set with the ``ttl_sweeper`` section of the glados config.
+
+    Examples
+    --------
+    .. code-block:: yaml
+
+        glados:
+          ttl_sweeper:
+            enabled: yes
+            batch_size: 1000
+            interval: 60
+            pause: 0.1
+
+    The sweeper reports these metrics:
+
+    - ``sweeper.deleted``: interactions deleted.
+    - ``sweeper.sweep``: time to run a sweep.
+    - ``sweeper.errors``: sweeps that raised an error.
+
+    Parameters
+    ----------
+    glados
+        the GLaDOS instance with the datastore
+    batch_size
+        max number of interactions deleted in one transaction.
+    interval
+        seconds between sweeps.
+    pause
+        seconds to wait between batches to let other queries through.
+    """
+
+    def __init__(
+        self,
+        glados: "Glados",
+        batch_size: int = 1000,
+        interval: float = 60,
+        pause: float = 0.1,
+    ):
+        self.glados = glados
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self._stop = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """Delete the expired interactions. Use this from a scheduled job.
+
+        Parameters
+        ----------
+        now
+            delete interactions that expire before this. Defaults to now.
+
+        Returns
+        -------
+        int
+            the number of interactions deleted.
+        """
+        now = now or datetime.now()
+        datastore = self.glados.datastore
+        session = datastore.create_session()
+        total = 0
+        try:
+            with metrics.timer("sweeper.sweep"):
+                while not self._stop.is_set():
+                    deleted = datastore.delete_expired_interactions(
+                        session, now, self.batch_size
+                    )
+                    metrics.incr("sweeper.deleted", deleted)
+                    total += deleted
+                    if deleted < self.batch_size:
+                        break
+                    self._stop.wait(self.pause)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if total:
+            logging.info(f"deleted {total} expired interactions")
+        return total
+
+    def _poll(self) -> NoReturn:
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                metrics.incr("sweeper.errors")
+                logging.exception(f"error deleting expired interactions: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> NoReturn:
+        """Start the sweeper thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._poll, name="glados-ttl-sweeper", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, wait: bool = True) -> NoReturn:
+        """Stop the sweeper thread.
+
+        Parameters
+        ----------
+        wait
+            wait for the batch that is running to finish.
+        """
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
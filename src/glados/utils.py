@@ -1,9 +1,10 @@
-import json
 import logging
 import os
 from base64 import b64decode
 from typing import Union
 
+from . import codec
+
 
 def check_for_env_vars(value: Union[str, dict]):
     """Check an input value to see if it is an env_var or enc_env_var and get the value.
@@ -80,9 +81,21 @@ def read_config(config_file: str):
 
 
 class PyJSON:
+    """An attribute style container for trusted config data.
+
+    The whole dict is converted when the object is created and any ``env_var`` or
+    ``enc_env_var`` values are resolved at that time. This must only be used for
+    config files, use :obj:`LazyPyJSON` for request payloads.
+
+    Parameters
+    ----------
+    d
+        the dict (or JSON string) to convert
+    """
+
     def __init__(self, d):
         if type(d) is str:
-            d = json.loads(d)
+            d = codec.loads(d)
 
         self.from_dict(d)
 
@@ -125,3 +138,90 @@ class PyJSON:
             return self.__getitem__(key)
         except:
             return default
+
+
+class LazyPyJSON:
+    """A lazy, attribute style view over an untrusted payload.
+
+    Unlike :obj:`PyJSON` the original dict is kept as is and nested dicts are only
+    wrapped when they are reached through attribute or item access. The wrapped
+    values are cached so repeated access does not build new objects.
+
+    Values are returned as they are in the payload, ``env_var`` and ``enc_env_var``
+    values are never resolved.
+
+    Parameters
+    ----------
+    d
+        the dict (or JSON document) to wrap
+
+    Examples
+    --------
+    >>> payload = LazyPyJSON({"event": {"type": "message"}})
+    >>> payload.event.type
+    'message'
+    """
+
+    __slots__ = ("_data", "_cache", "_owned")
+
+    def __init__(self, d):
+        if type(d) in (str, bytes):
+            d = codec.loads(d)
+        object.__setattr__(self, "_data", d)
+        object.__setattr__(self, "_cache", {})
+        object.__setattr__(self, "_owned", False)
+
+    def _wrap(self, key):
+        cache = self._cache
+        if key in cache:
+            return cache[key]
+        value = self._data[key]
+        if type(value) is dict:
+            value = LazyPyJSON(value)
+        elif type(value) is list:
+            value = [LazyPyJSON(v) if type(v) is dict else v for v in value]
+        else:
+            return value
+        cache[key] = value
+        return value
+
+    def __getattr__(self, key):
+        if key in LazyPyJSON.__slots__:
+            # only hit before __init__ has run, e.g. while unpickling.
+            raise AttributeError(key)
+        try:
+            return self._wrap(key)
+        except KeyError:
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        self.__setitem__(key, value)
+
+    def __getitem__(self, key):
+        return self._wrap(key)
+
+    def __setitem__(self, key, value):
+        # Copy on first write so the wrapped dict is never changed.
+        if not self._owned:
+            object.__setattr__(self, "_data", dict(self._data))
+            object.__setattr__(self, "_owned", True)
+        self._data[key] = value
+        self._cache.pop(key, None)
+
+    def get(self, key, default=None):
+        try:
+            return self._wrap(key)
+        except KeyError:
+            return default
+
+    def to_dict(self) -> dict:
+        d = dict(self._data)
+        for key, value in self._cache.items():
+            if type(value) is LazyPyJSON:
+                d[key] = value.to_dict()
+            elif type(value) is list:
+                d[key] = [v.to_dict() if type(v) is LazyPyJSON else v for v in value]
+        return d
+
+    def __repr__(self):
+        return str(self.to_dict())
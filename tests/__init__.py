@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 import logging
 
 GLADOS_CONFIG_FILE = "tests/glados.yaml"
@@ -6,3 +8,18 @@ GLADOS_CONFIG_SECTIONS = sorted(["datastore", "glados", "my_other_config"])
 POSTGRES_HOST = "localhost"
 
 SORTED_BOT_NAMES = sorted(["SecurityBot", "Bot1", "Bot2", "Bot3"])
+
+SIGNING_SECRET = "test_signing_secret"
+
+
+def signed_headers(body: bytes, content_type: str = "application/json") -> dict:
+    """Headers for a request body signed with SIGNING_SECRET"""
+    timestamp = "1584379414"
+    digest = hmac.new(
+        SIGNING_SECRET.encode(), f"v0:{timestamp}:".encode() + body, hashlib.sha256
+    ).hexdigest()
+    return {
+        "Content-Type": content_type,
+        "X-Slack-Request-Timestamp": timestamp,
+        "X-Slack-Signature": f"v0={digest}",
+    }
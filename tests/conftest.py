@@ -0,0 +1,24 @@
+import pytest
+
+from glados import GladosBot, GladosPlugin, http
+from glados.plugin import PluginConfig
+from tests import SIGNING_SECRET
+
+
+@pytest.fixture
+def bot():
+    """A bot named ``bot`` that signs requests with SIGNING_SECRET"""
+    return GladosBot("", "bot", SIGNING_SECRET)
+
+
+@pytest.fixture
+def plugin(bot):
+    """A plugin for ``bot`` without any routes"""
+    return GladosPlugin(PluginConfig("test", "None"), bot)
+
+
+@pytest.fixture(autouse=True)
+def thread_loop():
+    """Close the slack client loop and session a test left on the main thread"""
+    yield
+    http.close_thread_loop()
@@ -0,0 +1,64 @@
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+from glados import Glados, RouteType
+from glados.asgi import ASGITestClient, GladosASGI
+from tests import signed_headers
+
+FORM = "application/x-www-form-urlencoded"
+
+
+@pytest.fixture
+def client(plugin):
+    async def ask(request):
+        return f"you asked: {request.json.text}"
+
+    def webhook(request):
+        return {"ok": True, "name": request.json.name}
+
+    plugin.add_route(RouteType.Slash, "ask", ask)
+    plugin.add_route(RouteType.Webhook, "hook", webhook)
+    g = Glados()
+    g.add_plugin(plugin)
+    g.router.freeze()
+    client = ASGITestClient(GladosASGI(g))
+    yield client
+    client.close()
+
+
+def test_asgi_routes(client):
+    body = urlencode({"command": "/ask", "text": "cake"}).encode()
+    r = client.post("/Slash/bot/ask", body=body, headers=signed_headers(body, FORM))
+    assert r.status == 200
+    assert r.text == "you asked: cake"
+
+    r = client.post("/Slash/bot/ask", body=body, headers={"Content-Type": FORM})
+    assert r.status == 401
+
+    body = json.dumps({"name": "glados"}).encode()
+    r = client.post("/Webhook/bot/hook", body=body)
+    assert r.headers["content-type"] == "application/json"
+    assert r.json() == {"ok": True, "name": "glados"}
+
+    assert client.post("/Webhook/bot/missing", body=body).status == 404
+    assert client.post("/Unknown", body=body).status == 404
+    assert client.get("/Webhook/bot/hook").status == 405
+
+
+def test_asgi_url_verification(client):
+    body = json.dumps({"type": "url_verification", "challenge": "abc"}).encode()
+    r = client.post("/Events/bot", body=body)
+    assert r.text == "abc"
+
+
+def test_asgi_invalid_requests(client):
+    assert client.post("/Webhook/bot/hook", body=b"{not json").status == 400
+
+    # an unknown interaction is acked like the Flask servers do
+    payload = {"actions": [{"action_id": "missing"}]}
+    body = urlencode({"payload": json.dumps(payload)}).encode()
+    r = client.post("/Interaction/bot", body=body, headers=signed_headers(body, FORM))
+    assert r.status == 200
+    assert r.text == "not found"
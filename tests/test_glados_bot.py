@@ -1,7 +1,11 @@
-from tests import SORTED_BOT_NAMES
-from glados import BotImporter
+import asyncio
 import os
 
+from slack.web.classes.messages import Message
+
+from glados import BotImporter, GladosBot, http
+from tests import SORTED_BOT_NAMES
+
 
 def test_import_bots():
     # Set the OS Envars for bot 3
@@ -19,3 +23,57 @@ def test_import_bots():
     assert bot_importer.bots["Bot2"].signing_secret == "bot_2_signing_secret"
     assert bot_importer.bots["Bot3"].token == bot3_token
     assert bot_importer.bots["Bot3"].signing_secret == bot3_secret
+
+
+def test_bot_clients_share_transport():
+    bot1 = GladosBot("token-1", "bot1")
+    bot2 = GladosBot("token-2", "bot2")
+    assert getattr(bot1._clients, "client", None) is None
+
+    assert bot1.client is bot1.client
+    assert bot1.client.token == "token-1"
+    assert bot2.client.token == "token-2"
+    assert bot1.client.session is bot2.client.session
+
+
+def test_bot_clients_are_rebuilt():
+    bot = GladosBot("token", "bot")
+    client = bot.client
+
+    # the thread loop was closed, a new loop and client are made
+    http.close_thread_loop()
+    assert client.session.closed
+    assert bot.client is not client
+    client = bot.client
+
+    parent_loop = http.thread_loop()
+    http.reset_after_fork()
+    assert getattr(bot._clients, "client", None) is None
+    assert bot.client is not client
+    # a forked process leaves the parent session open, the test closes it here.
+    parent_loop.run_until_complete(client.session.close())
+    parent_loop.close()
+
+
+def test_send_messages():
+    bot = GladosBot("token", "bot")
+    in_flight = []
+
+    async def asend_message(channel, message):
+        in_flight.append(channel)
+        assert len(in_flight) <= 2
+        await asyncio.sleep(0.01)
+        in_flight.remove(channel)
+        if channel == "C2":
+            raise ValueError("channel_not_found")
+        return {"ok": True, "channel": channel}
+
+    bot.asend_message = asend_message
+    channels = ["C1", "C2", "C3", "C4"]
+    results = bot.send_messages(
+        [(c, Message(text="alert")) for c in channels], max_concurrency=2
+    )
+    assert [r.channel for r in results] == channels
+    assert [r.ok for r in results] == [True, False, True, True]
+    assert results[0].response["channel"] == "C1"
+    assert type(results[1].error) is ValueError
@@ -0,0 +1,62 @@
+from slack.web.classes.messages import Message
+
+from glados import GladosBot, http, metrics
+
+
+def test_update_message_coalesced():
+    sent = []
+
+    bot = GladosBot("token", "bot", update_window=60)
+
+    def send(channel, ts, message):
+        sent.append(message.text)
+        return {"ts": ts, "text": message.text}
+
+    bot.coalescer._send = send
+    metrics.reset()
+
+    futures = [
+        bot.update_message("C1", "1.0", Message(text=f"status {i}"))
+        for i in range(5)
+    ]
+    other = bot.update_message("C1", "2.0", Message(text="other"))
+    assert sent == []
+    assert len(bot.coalescer) == 2
+
+    bot.flush_updates("C1", "1.0")
+    assert sent == ["status 4"]
+    assert [f.result()["text"] for f in futures] == ["status 4"] * 5
+    assert metrics.get("coalesce.bot.updates") == 6
+    assert metrics.get("coalesce.bot.sent") == 1
+
+    bot.coalescer.cancel("C1", "2.0")
+    assert other.cancelled()
+    assert len(bot.coalescer) == 0
+
+
+def test_update_message_wait():
+    bot = GladosBot("token", "bot", update_window=0.01)
+    bot.coalescer._send = lambda channel, ts, message: {"text": message.text}
+    message = Message(text="done")
+    assert bot.update_message("C1", "1.0", message, wait=True) == {"text": "done"}
+
+
+def test_update_windows_reuse_the_flusher_loop():
+    bot = GladosBot("token", "bot", update_window=0.001)
+    loops = set()
+    sessions = set()
+
+    def send(channel, ts, message):
+        loops.add(http.thread_loop())
+        sessions.add(bot.client.session)
+        return {"text": message.text}
+
+    bot.coalescer._send = send
+    for i in range(20):
+        bot.update_message("C1", f"{i}.0", Message(text="status")).result(timeout=5)
+    assert len(loops) == 1
+    assert len(sessions) == 1
+
+    bot.coalescer.stop()
+    assert all(loop.is_closed() for loop in loops)
+    assert all(session.closed for session in sessions)
@@ -0,0 +1,72 @@
+import pytest
+
+from glados import (
+    Glados,
+    GladosRequest,
+    JSONCodec,
+    RouteType,
+    get_codec,
+    http,
+    set_codec,
+)
+from glados.errors import GladosError
+
+
+class MockCodec(JSONCodec):
+    name = "mock"
+
+    def __init__(self):
+        self.calls = 0
+
+    def loads(self, data):
+        self.calls += 1
+        return super().loads(data)
+
+    def dumps(self, obj):
+        self.calls += 1
+        return super().dumps(obj)
+
+
+@pytest.fixture
+def reset_codec():
+    yield
+    set_codec("json")
+
+
+def test_default_codec():
+    assert get_codec().name == "json"
+
+
+def test_glados_sets_codec(reset_codec):
+    codec = MockCodec()
+    g = Glados(json_codec=codec)
+    assert g.codec is codec
+    request = GladosRequest(
+        RouteType.Events, bot_name="bot", body=b'{"event": {"type": "message"}}'
+    )
+    assert request.json.event.type == "message"
+    assert codec.calls == 1
+
+    # the codec is process wide, a second instance uses it too
+    assert Glados().codec is codec
+
+
+def test_auto_codec(reset_codec):
+    assert set_codec("auto").name in ["json", "orjson"]
+
+
+def test_unknown_codec(reset_codec):
+    with pytest.raises(GladosError):
+        set_codec("nope")
+
+
+def test_respond_to_url_uses_codec(reset_codec, plugin, monkeypatch):
+    posted = []
+    monkeypatch.setattr(http, "post", lambda url, **kwargs: posted.append(kwargs))
+    codec = set_codec(MockCodec())
+    request = GladosRequest(RouteType.Webhook, "hook", bot_name="bot", json={})
+    request.response_url = "https://hooks.slack.com/x"
+    plugin.respond_to_url(request, "done")
+    assert codec.calls == 1
+    assert posted[0]["data"] == b'{"text": "done"}'
+    assert posted[0]["headers"]["Content-Type"].startswith("application/json")
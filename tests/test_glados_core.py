@@ -1,5 +1,16 @@
-from tests import SORTED_BOT_NAMES, GLADOS_CONFIG_FILE, GLADOS_CONFIG_FILE_LIMITED
-from glados import Glados
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+from glados import Glados, GladosRequest, RouteType
+from tests import (
+    GLADOS_CONFIG_FILE,
+    GLADOS_CONFIG_FILE_LIMITED,
+    SORTED_BOT_NAMES,
+    signed_headers,
+)
 
 
 def test_glados_import_bots(caplog):
@@ -14,3 +25,112 @@ def test_import_limited_bots_only(caplog):
     g = Glados(GLADOS_CONFIG_FILE_LIMITED)
     g.read_config(bot_name=SORTED_BOT_NAMES[0])
     assert len(g.plugins) == 1
+
+
+@pytest.fixture
+def async_glados(plugin):
+    async def async_handler(request):
+        return f"async {request.json.name}"
+
+    def sync_handler(request):
+        return f"sync {request.json.name}"
+
+    plugin.add_route(RouteType.Webhook, "async", async_handler)
+    plugin.add_route(RouteType.Webhook, "sync", sync_handler)
+    g = Glados()
+    g.add_plugin(plugin)
+    return g
+
+
+def test_arequest(async_glados):
+    g = async_glados
+    loop = asyncio.new_event_loop()
+    try:
+        for route in ["async", "sync"]:
+            request = GladosRequest(
+                RouteType.Webhook, route, bot_name="bot", json={"name": "glados"}
+            )
+            assert loop.run_until_complete(g.arequest(request)) == f"{route} glados"
+    finally:
+        loop.close()
+
+
+def test_request_async_route(async_glados):
+    g = async_glados
+    request = GladosRequest(
+        RouteType.Webhook, "async", bot_name="bot", json={"name": "glados"}
+    )
+    assert g.router.match(request).is_async
+    assert g.request(request) == "async glados"
+
+
+def test_request_datastore_is_lazy(plugin):
+    class FakeSession:
+        is_active = True
+
+        def close(self):
+            pass
+
+    class FakeDataStore:
+        sessions = 0
+
+        def create_session(self):
+            self.sessions += 1
+            return FakeSession()
+
+        def find_interaction_by_channel_ts(self, channel, ts, session):
+            return f"{channel}-{ts}"
+
+    plugin.add_route(RouteType.Webhook, "unused", lambda request: "ok")
+    plugin.add_route(RouteType.Interaction, "used", lambda request: request.interaction)
+    plugin.add_route(
+        RouteType.Interaction,
+        "preload",
+        lambda request: request._session is not None,
+        preload_interaction=True,
+    )
+    g = Glados()
+    g.add_plugin(plugin)
+    g.datastore = FakeDataStore()
+    g.enable_datastore = True
+
+    assert g.request(GladosRequest(RouteType.Webhook, "unused", bot_name="bot")) == "ok"
+    assert g.datastore.sessions == 0
+
+    def interaction_request(action_id):
+        payload = {
+            "actions": [{"action_id": action_id}],
+            "container": {"channel_id": "C1", "message_ts": "1.000100"},
+        }
+        body = urlencode({"payload": json.dumps(payload)}).encode()
+        headers = signed_headers(body, "application/x-www-form-urlencoded")
+        return GladosRequest(
+            RouteType.Interaction, bot_name="bot", body=body, headers=headers
+        )
+
+    assert g.request(interaction_request("used")) == "C1-1.000100"
+    assert g.datastore.sessions == 1
+    assert g.request(interaction_request("preload")) is True
+    assert g.datastore.sessions == 2
+
+
+def test_autostart_jobs():
+    class FakeDataStore:
+        class db:
+            @staticmethod
+            def dispose():
+                pass
+
+    g = Glados(autostart_jobs=False)
+    g.enable_datastore = True
+    g.datastore = FakeDataStore()
+    g.setup_sweeper(interval=60)
+    assert g.sweeper._thread is None
+
+    # the jobs are started in the process that runs them
+    g.start_jobs()
+    try:
+        assert g.sweeper._thread.is_alive()
+    finally:
+        g.stop()
+    assert g.sweeper._thread is None
@@ -0,0 +1,91 @@
+import json
+import time
+
+import pytest
+
+from glados import Glados, GladosRequest, RouteType, metrics
+from glados.dedup import DedupCache, MemoryDedupCache
+from tests import signed_headers
+
+
+def test_memory_dedup_cache():
+    cache = MemoryDedupCache(max_size=2, ttl=60)
+    assert cache.claim("a") is True
+    assert cache.claim("a") is False
+    cache.release("a")
+    assert cache.claim("a") is True
+
+    cache.claim("b")
+    cache.claim("c")
+    assert len(cache._keys) == 2
+    assert cache.claim("a") is True  # "a" was the oldest key and was dropped
+
+
+def test_dedup_cache_is_abstract():
+    with pytest.raises(TypeError):
+        DedupCache()
+
+
+def test_memory_dedup_cache_ttl():
+    cache = MemoryDedupCache(ttl=0.01)
+    assert cache.claim("a") is True
+    time.sleep(0.02)
+    assert cache.claim("a") is True
+
+
+@pytest.fixture
+def glados(bot, plugin):
+    plugin.calls = 0
+
+    def handler(request):
+        plugin.calls += 1
+        if request.json.event.text == "fail":
+            raise ValueError("handler failed")
+        return "handled"
+
+    plugin.add_route(RouteType.Events, "message", handler)
+    plugin.add_route(RouteType.Events, "reaction_added", handler, deferred=True)
+    g = Glados()
+    g.add_bot(bot)
+    g.add_plugin(plugin)
+    g.setup_dedup(backend="memory")
+    g.plugin = plugin
+    metrics.reset()
+    return g
+
+
+def event_request(text="hi", retry=None, event_type="message"):
+    body = json.dumps(
+        {"event_id": "Ev1", "event": {"type": event_type, "text": text}}
+    ).encode()
+    headers = signed_headers(body)
+    if retry:
+        headers["X-Slack-Retry-Num"] = str(retry)
+    return GladosRequest(RouteType.Events, bot_name="bot", body=body, headers=headers)
+
+
+def test_retry_is_acked(glados):
+    assert glados.request(event_request()) == "handled"
+    assert glados.request(event_request(retry=1)) == ""
+    assert glados.plugin.calls == 1
+    assert metrics.get("events.dedup.bot.duplicates") == 1
+
+
+def test_failed_event_can_be_retried(glados):
+    with pytest.raises(ValueError):
+        glados.request(event_request("fail"))
+    with pytest.raises(ValueError):
+        glados.request(event_request("fail", retry=1))
+    assert glados.plugin.calls == 2
+
+
+def test_failed_deferred_event_can_be_retried(glados):
+    glados.setup_deferred(max_workers=1)
+    assert glados.request(event_request("fail", event_type="reaction_added")) == ""
+    glados.deferred.shutdown()
+    assert metrics.get("deferred.errors") == 1
+
+    glados.setup_deferred(max_workers=1)
+    glados.request(event_request("fail", retry=1, event_type="reaction_added"))
+    glados.deferred.shutdown()
+    assert glados.plugin.calls == 2
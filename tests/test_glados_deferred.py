@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+from glados import Glados, GladosRequest, RouteType, metrics
+
+
+def test_deferred_route(plugin):
+    started = threading.Event()
+    finish = threading.Event()
+    done = threading.Event()
+
+    def slow_handler(request):
+        started.set()
+        finish.wait(5)
+        done.set()
+        return "slow"
+
+    plugin.add_route(RouteType.Webhook, "slow", slow_handler, deferred=True, ack="ok")
+    plugin.add_route(RouteType.Webhook, "fast", lambda r: "fast", deferred=True)
+    g = Glados()
+    g.add_plugin(plugin)
+    g.setup_deferred(max_workers=1, max_queue=1)
+    metrics.reset()
+
+    request = GladosRequest(RouteType.Webhook, "slow", bot_name="bot")
+    assert g.request(request) == "ok"
+    assert started.wait(5)
+    assert metrics.get("deferred.queue_depth") == 1
+
+    # the queue is full so the next request is run inline.
+    fast = GladosRequest(RouteType.Webhook, "fast", bot_name="bot")
+    assert g.request(fast) == "fast"
+    assert metrics.get("deferred.rejected") == 1
+
+    finish.set()
+
+    g.deferred.shutdown()
+    assert done.is_set()
+    assert metrics.get("deferred.queue_depth") == 0
+    assert metrics.snapshot()["timers"]["deferred.handler"]["count"] == 1
+
+
+def test_deferred_async_route(plugin):
+    async def run():
+        finished = asyncio.Event()
+
+        async def async_handler(request):
+            finished.set()
+
+        plugin.add_route(
+            RouteType.Webhook, "async", async_handler, deferred=True, ack="ok"
+        )
+        g = Glados()
+        g.add_plugin(plugin)
+
+        request = GladosRequest(RouteType.Webhook, "async", bot_name="bot")
+        assert await g.arequest(request) == "ok"
+        await asyncio.wait_for(finished.wait(), 5)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
@@ -0,0 +1,53 @@
+import pytest
+
+from glados import Glados, GladosBot, GladosRequest, RouteType, metrics
+
+EVENT_FILTER = {
+    "event_types": ["message"],
+    "ignore_subtypes": ["message_changed"],
+    "ignore_channels": ["C_NOISY"],
+    "ignore_bot_messages": True,
+    "bot_user_id": "U_BOT",
+}
+
+
+@pytest.fixture
+def bot():
+    return GladosBot("", "bot", "", event_filter=EVENT_FILTER)
+
+
+@pytest.fixture
+def glados(bot, plugin):
+    plugin.add_route(RouteType.Events, "message", lambda request: "handled")
+    g = Glados()
+    g.add_bot(bot)
+    g.add_plugin(plugin)
+    metrics.reset()
+    return g
+
+
+def event_request(**event):
+    return GladosRequest(RouteType.Events, bot_name="bot", json={"event": event})
+
+
+@pytest.mark.parametrize(
+    "event,reason",
+    [
+        ({"type": "reaction_added"}, "event_type"),
+        ({"type": "message", "subtype": "message_changed"}, "subtype"),
+        ({"type": "message", "channel": "C_NOISY"}, "channel"),
+        ({"type": "message", "bot_id": "B123"}, "bot_message"),
+        ({"type": "message", "user": "U_BOT"}, "self"),
+    ],
+)
+def test_event_dropped(glados, event, reason):
+    assert glados.request(event_request(**event)) == ""
+    assert metrics.get("events.filter.bot.dropped") == 1
+    assert metrics.get(f"events.filter.bot.dropped.{reason}") == 1
+
+
+def test_event_allowed(glados):
+    # The event is not signed, so it fails signature validation after the filter.
+    with pytest.raises(Exception, match="verification"):
+        glados.request(event_request(type="message", channel="C1", user="U1"))
+    assert metrics.get("events.filter.bot.dropped") == 0
@@ -0,0 +1,193 @@
+from datetime import datetime, timedelta
+
+from glados import Glados, RouteType, metrics
+from glados.datastore import DataStoreInteraction
+from glados.followup import REFRESH_OVERLAP, CronScheduler, FollowupScheduler
+
+
+class FakeSavepoint:
+    def __init__(self, session):
+        self.session = session
+
+    def commit(self):
+        self.session.savepoints.append("commit")
+
+    def rollback(self):
+        self.session.savepoints.append("rollback")
+
+
+class FakeSession:
+    """Records what the scheduler does with the session. The SQL is not run."""
+
+    def __init__(self):
+        self.savepoints = []
+        self.commits = 0
+        self.closed = False
+
+    def begin_nested(self):
+        return FakeSavepoint(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDataStore:
+    def __init__(self, interactions):
+        self.interactions = interactions
+        self.session = FakeSession()
+        self.loads = []
+        self.keys = set()
+
+    def create_session(self):
+        return self.session
+
+    def claim_due_followups(self, session, now, limit):
+        due = [i for i in self.interactions if i.followup_ts <= now][:limit]
+        self.interactions = [i for i in self.interactions if i not in due]
+        return due
+
+    def find_cron_interactions(self, session, since=None):
+        self.loads.append(since)
+        found = [i for i in self.interactions if i.cron_followup_action is not None]
+        if since is not None:
+            found = [i for i in found if i.updated_at > since]
+        return sorted(found, key=lambda i: i.updated_at)
+
+    def find_by_id(self, interaction_id, session):
+        for i in self.interactions:
+            if i.interaction_id == interaction_id:
+                return i
+        return None
+
+    def claim_dedup_key(self, key, ttl, session):
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+
+def test_followup_scheduler(plugin):
+    called = []
+
+    def remind(request):
+        # the followup is claimed and committed before the route runs
+        assert request.interaction.followed_up is not None
+        assert request._session.commits > 0
+        called.append((request.interaction.interaction_id, request.data.ticket))
+
+    def broken(request):
+        raise ValueError("broken")
+
+    plugin.add_route(RouteType.Callback, "remind", remind)
+    plugin.add_route(RouteType.Callback, "broken", broken)
+    g = Glados()
+    g.add_plugin(plugin)
+    g.router.freeze()
+
+    past = datetime.now() - timedelta(minutes=1)
+
+    def interaction(interaction_id, action, followup_ts=past):
+        return DataStoreInteraction(
+            interaction_id=interaction_id,
+            bot="bot",
+            data={"ticket": interaction_id},
+            followup_action=action,
+            followup_ts=followup_ts,
+        )
+
+    interactions = [
+        interaction("1", "remind"),
+        interaction("2", "broken"),
+        interaction("3", "missing"),
+        interaction("4", "remind"),
+        interaction("5", "remind", datetime.now() + timedelta(hours=1)),
+    ]
+    g.datastore = FakeDataStore(list(interactions))
+    metrics.reset()
+
+    scheduler = FollowupScheduler(g, batch_size=2)
+    assert scheduler.run_pending() == 4
+    assert called == [("1", "1"), ("4", "4")]
+    assert [i.followed_up is not None for i in interactions] == [True] * 4 + [False]
+    assert g.datastore.session.savepoints == ["commit", "rollback", "rollback", "commit"]
+    # one commit for each of the 3 claims, the last one is empty, and one after each route
+    assert g.datastore.session.commits == 3 + 4
+    assert g.datastore.session.closed
+    assert metrics.get("followups.done") == 2
+    assert metrics.get("followups.errors") == 2
+
+
+def test_cron_scheduler(plugin):
+    called = []
+
+    def check(request):
+        called.append(request.interaction.interaction_id)
+
+    plugin.add_route(RouteType.Callback, "check", check)
+    g = Glados()
+    g.add_plugin(plugin)
+    g.router.freeze()
+
+    start = datetime(2020, 1, 1)
+
+    def interaction(interaction_id, ts, action="check", data=None):
+        return DataStoreInteraction(
+            interaction_id=interaction_id,
+            ts=ts,
+            updated_at=ts,
+            bot="bot",
+            data=data or dict(),
+            cron_followup_action=action,
+        )
+
+    g.datastore = FakeDataStore(
+        [
+            interaction("1", start),
+            interaction("2", start, data={"cron_interval": 60}),
+            interaction("3", start, action=None),
+        ]
+    )
+    metrics.reset()
+
+    cron = CronScheduler(g, intervals={"check": 300})
+    now = start + timedelta(seconds=30)
+    assert cron.rebuild(now) == 2
+    assert len(cron) == 2
+    assert cron.next_run(g.datastore.interactions[0], now) == start + timedelta(minutes=5)
+    assert cron.next_due() == start + timedelta(minutes=1)
+
+    assert cron.run_due(start + timedelta(seconds=90)) == 1
+    assert called == ["2"]
+    assert cron.next_due() == start + timedelta(minutes=2)
+
+    # runs that were missed are run once, then scheduled after now
+    assert cron.run_due(start + timedelta(minutes=10, seconds=1)) == 2
+    assert sorted(called) == ["1", "2", "2"]
+    assert cron.next_due() == start + timedelta(minutes=11)
+
+    # another node already ran it
+    g.datastore.keys.add(f"cron:2:{int((start + timedelta(minutes=11)).timestamp())}")
+    assert cron.run_due(start + timedelta(minutes=11)) == 0
+    assert metrics.get("cron.skipped") == 1
+    assert metrics.get("cron.runs") == 3
+
+    # new and changed interactions are loaded by updated_at, removed ones are dropped when
+    # they are due
+    later = start + timedelta(minutes=11)
+    g.datastore.interactions.append(interaction("4", later))
+    changed = g.datastore.interactions[0]
+    changed.data = {"cron_interval": 60}
+    changed.updated_at = later
+    g.datastore.interactions[1].cron_followup_action = None
+    assert cron.refresh(later) == 2
+    assert g.datastore.loads == [None, start - REFRESH_OVERLAP]
+    assert len(cron) == 3
+    assert cron.next_due() == start + timedelta(minutes=12)
+    assert cron.run_due(start + timedelta(minutes=12)) == 1
+    assert len(cron) == 2
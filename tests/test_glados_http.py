@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from glados import http, metrics
+
+
+class SlackHookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fail = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        status = 200
+        if SlackHookHandler.fail:
+            SlackHookHandler.fail -= 1
+            status = 503
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def hook_url():
+    server = HTTPServer(("127.0.0.1", 0), SlackHookHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    http.setup_session(pool_size=2, retries=2, backoff_factor=0)
+    metrics.reset()
+    yield f"http://127.0.0.1:{server.server_port}/hook"
+    # close the keep-alive connections so the server can stop
+    http.session().close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_post_reuses_connection(hook_url):
+    for _ in range(3):
+        assert http.post(hook_url, json={"text": "hi"}).status_code == 200
+    assert metrics.get("http.connections.new") == 1
+    assert metrics.get("http.requests") == 3
+    assert metrics.get("http.status.200") == 3
+
+
+def test_post_retries(hook_url):
+    SlackHookHandler.fail = 1
+    assert http.post(hook_url, json={"text": "hi"}).status_code == 200
+    assert SlackHookHandler.fail == 0
+
+
+def test_apost_retries(hook_url):
+    async def post():
+        try:
+            r = await http.apost(hook_url, json={"text": "hi"})
+            return r.status, await r.text()
+        finally:
+            await http.close_async_session()
+
+    SlackHookHandler.fail = 2
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(post()) == (200, "ok")
+    finally:
+        loop.close()
+    assert SlackHookHandler.fail == 0
+    assert metrics.get("http.retries") == 2
+    assert metrics.get("http.status.503") == 2
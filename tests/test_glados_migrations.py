@@ -0,0 +1,180 @@
+from contextlib import contextmanager
+
+import pytest
+
+from glados import migrations
+from glados.errors import GladosError
+from glados.migrations import (
+    MIGRATIONS,
+    Migration,
+    backfill,
+    backfill_slack_ts,
+    create_index_concurrently,
+    migrate,
+)
+
+
+class FakeResult:
+    def __init__(self, row=None, rows=None, value=None):
+        self.row = row
+        self.rows = rows or []
+        self.value = value
+
+    def first(self):
+        return self.row
+
+    def scalar(self):
+        return self.value
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeConnection:
+    """Records the SQL that is run. Nothing is sent to a database."""
+
+    def __init__(self, engine, isolation_level=None):
+        self.engine = engine
+        self.isolation_level = isolation_level
+
+    def execution_options(self, isolation_level=None):
+        return FakeConnection(self.engine, isolation_level)
+
+    def execute(self, statement, params=None):
+        self.engine.executed.append((str(statement), self.isolation_level))
+        self.engine.params.append(params)
+        rows = self.engine.rows.pop(0) if self.engine.rows else []
+        locked = self.engine.locked.pop(0) if self.engine.locked else True
+        return FakeResult(self.engine.invalid_index, rows, locked)
+
+
+class FakeEngine:
+    def __init__(self, invalid_index=None, rows=None):
+        self.executed = []
+        self.params = []
+        self.invalid_index = invalid_index
+        # rows returned by each statement, no rows once the list is empty.
+        self.rows = rows or []
+        # results of pg_try_advisory_lock, True once the list is empty.
+        self.locked = []
+
+    @contextmanager
+    def connect(self):
+        yield FakeConnection(self)
+
+    @contextmanager
+    def begin(self):
+        yield FakeConnection(self, "transaction")
+
+
+class FakeDataStore:
+    def __init__(self, applied):
+        self.db = FakeEngine()
+        self.applied = applied
+
+    def create_session(self):
+        applied = self.applied
+
+        class Session:
+            def query(self, *columns):
+                return [(v, None) for v in applied]
+
+            def close(self):
+                pass
+
+        return Session()
+
+
+def test_migration_versions():
+    versions = [m.version for m in MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+
+def test_create_index_concurrently():
+    step = create_index_concurrently("ix_a", "ON t (a)", unique=True)
+    engine = FakeEngine()
+    step(FakeConnection(engine), {})
+    assert engine.executed[-1][0] == "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_a ON t (a)"
+    assert len(engine.executed) == 2
+
+    # an invalid index from a failed build is dropped first
+    engine = FakeEngine(invalid_index=(1,))
+    step(FakeConnection(engine), {})
+    assert [sql for sql, _ in engine.executed[1:]] == [
+        "DROP INDEX CONCURRENTLY IF EXISTS ix_a",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_a ON t (a)",
+    ]
+
+
+def test_backfill():
+    step = backfill("t", "b = a", "b IS NULL", key="id", batch_size=2)
+    engine = FakeEngine(rows=[["1", "2"], ["4", "3"], ["5"]])
+    step(FakeConnection(engine), {})
+    assert len(engine.executed) == 3
+    assert engine.executed[0][0] == (
+        "UPDATE t SET b = a WHERE id IN "
+        "(SELECT id FROM t WHERE (b IS NULL) ORDER BY id LIMIT :limit) RETURNING id"
+    )
+    # each batch starts after the last key of the one before
+    assert "WHERE id > :after AND (b IS NULL)" in engine.executed[1][0]
+    assert [p["after"] for p in engine.params] == [None, "2", "4"]
+
+
+def test_backfill_slack_ts():
+    steps = backfill_slack_ts(batch_size=2)
+    engine = FakeEngine()
+    migration = Migration(5, "five", steps, transactional=False)
+    migration.upgrade(FakeConnection(engine), {"message_timezone": "Europe/Berlin"})
+    executed = [sql for sql, _ in engine.executed]
+    assert executed[0].startswith("CREATE TABLE IF NOT EXISTS slack_ts_backfill AS")
+    assert "AT TIME ZONE :timezone" in executed[0]
+    assert engine.params[0] == {"timezone": "Europe/Berlin"}
+    assert executed[2].startswith("UPDATE interactions SET slack_ts = ")
+    assert executed[3] == "DROP TABLE IF EXISTS slack_ts_backfill"
+
+    # the timezone is only needed when there are interactions to backfill
+    pick = steps[0]
+    pick(FakeConnection(FakeEngine()), {})
+    with pytest.raises(GladosError):
+        pick(FakeConnection(FakeEngine(invalid_index=(1,))), {})
+
+
+def test_migrate():
+    migrations = [
+        Migration(1, "one", ["SELECT 1"]),
+        Migration(3, "three", ["SELECT 3"], transactional=False),
+        Migration(2, "two", ["SELECT 2"]),
+    ]
+    datastore = FakeDataStore(applied=[1])
+    applied = migrate(datastore, migrations=migrations)
+    assert [m.version for m in applied] == [2, 3]
+
+    executed = [(sql.split("(")[0].strip(), level) for sql, level in datastore.db.executed]
+    assert executed == [
+        ("SELECT pg_try_advisory_lock", "AUTOCOMMIT"),
+        ("SELECT 2", "transaction"),
+        ("INSERT INTO schema_migrations", "transaction"),
+        ("SELECT 3", "AUTOCOMMIT"),
+        ("INSERT INTO schema_migrations", "AUTOCOMMIT"),
+        ("SELECT pg_advisory_unlock", "AUTOCOMMIT"),
+    ]
+
+    datastore = FakeDataStore(applied=[1, 2, 3])
+    assert migrate(datastore, migrations=migrations) == []
+
+
+def test_migrate_waits_for_lock(monkeypatch):
+    monkeypatch.setattr(migrations, "LOCK_POLL_INTERVAL", 0)
+    datastore = FakeDataStore(applied=[])
+    datastore.db.locked = [False, False]
+    migrate(datastore, migrations=[Migration(1, "one", ["SELECT 1"])])
+
+    # nothing blocks on the lock, each try commits on its own.
+    executed = [(sql.split("(")[0].strip(), level) for sql, level in datastore.db.executed]
+    assert executed[:4] == [("SELECT pg_try_advisory_lock", "AUTOCOMMIT")] * 3 + [
+        ("SELECT 1", "transaction")
+    ]
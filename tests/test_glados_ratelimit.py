@@ -0,0 +1,58 @@
+import pytest
+from slack.errors import SlackApiError
+
+from glados import RateLimiter, metrics
+from glados.ratelimit import TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or dict()
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1.0, capacity=2)
+    now = bucket._updated
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == 0
+    # the bucket is empty so calls are queued one second apart
+    assert bucket.reserve(now) == pytest.approx(1.0)
+    assert bucket.reserve(now) == pytest.approx(2.0)
+    bucket.block(now + 10)
+    assert bucket.reserve(now + 5) == pytest.approx(5.0)
+
+
+def test_post_message_per_channel():
+    limiter = RateLimiter(channel_burst=2)
+    metrics.reset()
+    assert limiter.reserve("bot", "chat.postMessage", "C1") == 0
+    assert limiter.reserve("bot", "chat.postMessage", "C2") == 0
+    # a short burst is sent right away, then posts are spaced out
+    assert limiter.reserve("bot", "chat.postMessage", "C1") == 0
+    assert limiter.reserve("bot", "chat.postMessage", "C1") > 0.9
+    assert metrics.get("ratelimit.bot.throttled") == 1
+    # other bots have their own buckets
+    assert limiter.reserve("other", "chat.postMessage", "C1") == 0
+
+    limiter.configure(enabled=False)
+    assert limiter.reserve("bot", "chat.postMessage", "C1") == 0
+
+
+def test_call_retries_429():
+    limiter = RateLimiter(max_retries=1)
+    metrics.reset()
+    responses = [FakeResponse(429, {"Retry-After": "0.01"}), FakeResponse(200)]
+
+    def call():
+        response = responses.pop(0)
+        if response.status_code != 200:
+            raise SlackApiError("rate limited", response)
+        return response
+
+    assert limiter.call("bot", "chat.update", call).status_code == 200
+    assert metrics.get("ratelimit.bot.retry_after") == 1
+
+    responses = [FakeResponse(429, {"Retry-After": "0"})] * 2
+    with pytest.raises(SlackApiError):
+        limiter.call("bot", "chat.update", call)
@@ -1,4 +1,13 @@
-from glados import GladosRequest, RouteType
+import json
+from urllib.parse import urlencode
+
+import pytest
+from slack.errors import SlackRequestError
+
+from glados import GladosBot, GladosRequest, RouteType
+from tests import SIGNING_SECRET, signed_headers
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
 
 
 def test_it():
@@ -6,3 +15,80 @@ def test_it():
         RouteType.Webhook, "send_mock", json={"message": "my message"}
     )
     assert request.json.message == "my message"
+
+
+def test_event_from_body():
+    body = json.dumps({"type": "event_callback", "event": {"type": "message"}}).encode()
+    request = GladosRequest(
+        RouteType.Events, bot_name="bot", body=body, headers=signed_headers(body)
+    )
+    assert request.route == "bot_message"
+    assert request.slack_verify.data is body
+    GladosBot("", "bot", SIGNING_SECRET).validate_slack_signature(request)
+
+
+def test_url_verification_from_body():
+    body = b'{"type": "url_verification", "challenge": "abc"}'
+    request = GladosRequest(RouteType.Events, bot_name="bot", body=body)
+    assert request.json.challenge == "abc"
+
+
+def test_interaction_from_form_body():
+    payload = {"response_url": "https://hooks", "actions": [{"action_id": "ack"}]}
+    body = urlencode({"payload": json.dumps(payload)}).encode()
+    request = GladosRequest(
+        RouteType.Interaction,
+        bot_name="bot",
+        body=body,
+        headers=signed_headers(body, FORM_CONTENT_TYPE),
+    )
+    assert request.route == "bot_ack"
+    assert request.response_url == "https://hooks"
+    GladosBot("", "bot", SIGNING_SECRET).validate_slack_signature(request)
+
+
+def test_slash_from_form_body():
+    body = b"command=%2Fsecurity&text=&trigger_id=123"
+    request = GladosRequest(
+        RouteType.Slash,
+        "security",
+        bot_name="bot",
+        body=body,
+        headers=signed_headers(body, FORM_CONTENT_TYPE),
+    )
+    assert request.json.command == "/security"
+    assert request.json.text == ""
+
+
+def test_invalid_signature():
+    body = b'{"event": {"type": "message"}}'
+    headers = signed_headers(body)
+    request = GladosRequest(
+        RouteType.Events, bot_name="bot", body=body + b" ", headers=headers
+    )
+    with pytest.raises(SlackRequestError):
+        GladosBot("", "bot", SIGNING_SECRET).validate_slack_signature(request)
+
+
+def test_set_interaction_from_datastore_uses_slack_ts():
+    class FakeDataStore:
+        def find_interaction_by_channel_ts(self, channel, ts, session):
+            self.lookup = (channel, ts)
+            return "interaction"
+
+    payload = {
+        "actions": [{"action_id": "ack"}],
+        "container": {"channel_id": "C123", "message_ts": "1584379414.000800"},
+    }
+    body = urlencode({"payload": json.dumps(payload)}).encode()
+    request = GladosRequest(
+        RouteType.Interaction,
+        bot_name="bot",
+        body=body,
+        headers={"Content-Type": FORM_CONTENT_TYPE},
+    )
+    request._datastore = FakeDataStore()
+    request._session = object()
+    request.set_interaction_from_datastore()
+    assert request._datastore.lookup == ("C123", "1584379414.000800")
+    assert request.interaction == "interaction"
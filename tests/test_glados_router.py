@@ -0,0 +1,53 @@
+import pytest
+
+from glados import GladosRequest, GladosRouter, RouteType
+from glados.errors import GladosRouteNotFoundError
+
+
+def test_exec_route(plugin):
+    plugin.add_route(RouteType.Webhook, "hello", lambda request: "hi")
+    router = GladosRouter()
+    router.add_routes(plugin)
+
+    dispatch = router.freeze()
+    assert (RouteType.Webhook, "bot", "hello") in dispatch
+
+    request = GladosRequest(RouteType.Webhook, "hello", bot_name="bot")
+    assert request.key == (RouteType.Webhook, "bot", "hello")
+    assert router.exec_route(request) == "hi"
+
+    with pytest.raises(GladosRouteNotFoundError):
+        router.exec_route(GladosRequest(RouteType.Webhook, "hello", bot_name="other"))
+
+
+def test_add_route_after_freeze(plugin):
+    router = GladosRouter()
+    router.freeze()
+    plugin.add_route(RouteType.Response, "response", lambda request: "ok")
+    router.add_routes(plugin)
+
+    request = GladosRequest(RouteType.Response, "response", bot_name="bot")
+    assert request.key == (RouteType.Response, None, "response")
+    assert router.exec_route(request) == "ok"
+
+
+def test_pattern_routes(plugin):
+    plugin.add_route(RouteType.Webhook, "approve:*", lambda r: "approve")
+    plugin.add_route(RouteType.Webhook, "approve:1?", lambda r: "ten")
+    plugin.add_route(RouteType.Webhook, "approve:all", lambda r: "all")
+    plugin.add_route(RouteType.Webhook, "*:deny", lambda r: "deny")
+    router = GladosRouter()
+    router.add_routes(plugin)
+
+    def route(name, bot="bot"):
+        return router.exec_route(GladosRequest(RouteType.Webhook, name, bot_name=bot))
+
+    assert route("approve:1234") == "approve"
+    assert route("approve:") == "approve"
+    assert route("approve:12") == "ten"
+    assert route("approve:all") == "all"
+    assert route("ticket:deny") == "deny"
+    with pytest.raises(GladosRouteNotFoundError):
+        route("deny:1234")
+    with pytest.raises(GladosRouteNotFoundError):
+        route("approve:1234", bot="other")
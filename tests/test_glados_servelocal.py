@@ -0,0 +1,162 @@
+import os
+import signal
+import socket
+import threading
+import time
+import urllib.request
+
+from glados import Glados, servelocal
+from glados.prefork import PooledWSGIServer, PreforkServer
+
+
+def test_health():
+    client = servelocal.app.test_client()
+    servelocal.glados = None
+    assert client.get("/health").status_code == 503
+
+    servelocal.glados = Glados()
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "ok"
+
+
+def test_invalid_body():
+    client = servelocal.app.test_client()
+    servelocal.glados = Glados()
+    try:
+        response = client.post(
+            "/Slash/bot/ask", data=b"{not json", content_type="application/json"
+        )
+        assert response.status_code == 400
+    finally:
+        servelocal.glados = None
+
+
+def test_pooled_wsgi_server():
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [threading.current_thread().name.encode()]
+
+    server = PooledWSGIServer("127.0.0.1", 0, app, threads=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/"
+        with urllib.request.urlopen(url, timeout=5) as r:
+            assert r.read().startswith(b"glados-request")
+    finally:
+        server.shutdown()
+        server.drain()
+        server.server_close()
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=5) as r:
+        return r.read().decode()
+
+
+def wait_for(url, prefix, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            body = get(url)
+            if body.startswith(prefix):
+                return body
+        except OSError:
+            pass
+        assert time.monotonic() < deadline, f"no response starting with {prefix!r}"
+        time.sleep(0.1)
+
+
+def test_prefork_server_restart(tmp_path):
+    events = tmp_path / "events"
+    events.touch()
+    loads = []
+
+    def record(event):
+        with open(events, "a") as f:
+            f.write(f"{event}\n")
+
+    def load():
+        loads.append(1)
+        record("load")
+        generation = len(loads)
+
+        def app(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [f"{generation} {os.getpid()}".encode()]
+
+        return app
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = PreforkServer(
+        load,
+        port=port,
+        workers=1,
+        graceful_timeout=5,
+        after_fork=lambda: record(f"after_fork {os.getpid()}"),
+        unload=lambda: record("unload"),
+        start_jobs=lambda: record(f"start_jobs {os.getpid()}"),
+        stop_jobs=lambda: record(f"stop_jobs {os.getpid()}"),
+    )
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            server.run()
+            status = 0
+        finally:
+            os._exit(status)
+
+    def jobs_started(count):
+        deadline = time.monotonic() + 10
+        while events.read_text().count("start_jobs") < count:
+            assert time.monotonic() < deadline, "jobs process did not start"
+            time.sleep(0.1)
+
+    try:
+        url = f"http://127.0.0.1:{port}/"
+        worker = wait_for(url, "1 ").split()[1]
+        jobs_started(1)
+        os.kill(pid, signal.SIGHUP)
+        new_worker = wait_for(url, "2 ").split()[1]
+        assert new_worker != worker
+        jobs_started(2)
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        _, status = os.waitpid(pid, 0)
+    assert status == 0
+
+    lines = events.read_text().splitlines()
+    # the old app is unloaded before the new one is loaded.
+    assert [e for e in lines if "load" in e] == ["load", "unload", "load"]
+    # the jobs run in their own process, the old jobs stop before the new ones start.
+    jobs = [e.split() for e in lines if "_jobs" in e]
+    assert [e[0] for e in jobs] == ["start_jobs", "stop_jobs"] * 2
+    assert jobs[0][1] == jobs[1][1] != jobs[2][1] == jobs[3][1]
+    assert {worker, new_worker}.isdisjoint(e[1] for e in jobs)
+    # the workers and the jobs processes run after_fork.
+    forked = {e.split()[1] for e in lines if e.startswith("after_fork")}
+    assert forked == {worker, new_worker, jobs[0][1], jobs[2][1]}
+
+
+def test_after_fork_keeps_parent_connections():
+    disposed = []
+
+    class FakeEngine:
+        def dispose(self, close=True):
+            disposed.append(close)
+
+    g = Glados()
+    g.enable_datastore = True
+    g.datastore = type("FakeDataStore", (), {"db": FakeEngine()})()
+    servelocal.glados = g
+    try:
+        servelocal.after_fork()
+        assert disposed == [False]
+        servelocal.unload()
+        assert disposed == [False, True]
+    finally:
+        servelocal.glados = None
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from glados import Glados, metrics
+from glados.datastore import DataStoreInteraction
+from glados.sweeper import TTLSweeper
+
+
+class FakeSession:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDataStore:
+    """Deletes from a list the way the datastore deletes from the interactions table."""
+
+    def __init__(self, interactions):
+        self.interactions = interactions
+        self.batches = []
+
+    def create_session(self):
+        return FakeSession()
+
+    def delete_expired_interactions(self, session, now, limit):
+        expired = [
+            i
+            for i in self.interactions
+            if i.ttl is not None and i.ts + timedelta(seconds=i.ttl) <= now
+        ][:limit]
+        self.interactions = [i for i in self.interactions if i not in expired]
+        self.batches.append(len(expired))
+        return len(expired)
+
+
+def test_ttl_sweeper():
+    now = datetime.now()
+
+    def interaction(interaction_id, ttl):
+        return DataStoreInteraction(
+            interaction_id=interaction_id,
+            ts=now - timedelta(hours=1),
+            bot="bot",
+            ttl=ttl,
+        )
+
+    g = Glados()
+    g.datastore = FakeDataStore(
+        [interaction(str(i), 60) for i in range(5)]
+        + [interaction("keep", None), interaction("later", 7200)]
+    )
+    metrics.reset()
+
+    sweeper = TTLSweeper(g, batch_size=2, pause=0)
+    assert sweeper.sweep(now) == 5
+    assert g.datastore.batches == [2, 2, 1]
+    assert [i.interaction_id for i in g.datastore.interactions] == ["keep", "later"]
+    assert metrics.get("sweeper.deleted") == 5
+    assert metrics.snapshot()["timers"]["sweeper.sweep"]["count"] == 1
+
+    assert sweeper.sweep(now + timedelta(hours=2)) == 1
+    assert [i.interaction_id for i in g.datastore.interactions] == ["keep"]
@@ -0,0 +1,51 @@
+import pytest
+
+from glados import LazyPyJSON, PyJSON
+
+PAYLOAD = {
+    "type": "block_actions",
+    "container": {"channel_id": "C123", "message_ts": "1584379414.000800"},
+    "actions": [{"action_id": "approve", "value": "1"}],
+}
+
+
+def test_lazy_pyjson_attribute_access():
+    j = LazyPyJSON(PAYLOAD)
+    assert j.type == "block_actions"
+    assert j.container.channel_id == "C123"
+    assert j.actions[0].action_id == "approve"
+    assert j.get("response_url") is None
+    assert j["container"]["message_ts"] == "1584379414.000800"
+    with pytest.raises(AttributeError):
+        j.missing
+
+
+def test_lazy_pyjson_wraps_on_access_only():
+    j = LazyPyJSON(PAYLOAD)
+    assert j._cache == {}
+    assert j.container is j.container
+    assert list(j._cache.keys()) == ["container"]
+
+
+def test_lazy_pyjson_set_does_not_change_source():
+    j = LazyPyJSON(PAYLOAD)
+    j.container.channel_id = "C999"
+    j.extra = True
+    assert PAYLOAD["container"]["channel_id"] == "C123"
+    assert "extra" not in PAYLOAD
+    d = j.to_dict()
+    assert d["container"]["channel_id"] == "C999"
+    assert d["extra"] is True
+    assert d["actions"] == PAYLOAD["actions"]
+
+
+def test_lazy_pyjson_from_string():
+    j = LazyPyJSON('{"event": {"type": "message"}}')
+    assert j.event.type == "message"
+
+
+def test_env_vars_only_resolved_for_config(monkeypatch):
+    monkeypatch.setenv("glados_test_secret", "secret")
+    d = {"secret": {"env_var": "glados_test_secret"}}
+    assert PyJSON(d).secret == "secret"
+    assert LazyPyJSON(d).secret.env_var == "glados_test_secret"